@@ -0,0 +1,192 @@
+# anomaly_injection.py
+"""
+Размеченный бенчмарк для детекторов аномалий: нормальные пары
+(payload, идеальная транзакция) + типизированные мутации.
+Всё на матрицах признаков (как PaymentFeatureExtractor), мутации — векторными масками:
+
+    python anomaly_injection.py --snapshot dictionary_cache.json -n 1000000 --rate 0.05 --seed 42 --output bench.npz
+    python anomaly_injection.py --journal successful_payloads.json --rate 0.1 --output bench_real.npz
+
+В .npz: X_payload [N, 21], X_tx [N, 37], labels (0/1), types (-1 — норма, иначе индекс в type_names).
+"""
+
+import argparse
+import json
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+
+from feature_extractor import PaymentFeatureExtractor
+from generate_ideal_transactionDetail import generate_ideal_output
+from offline_generator import PAYLOAD_FEATURES, TRANSACTION_FEATURES, OfflinePayloadGenerator
+from services.models import PaymentPayload, TransactionDetail
+
+ANOMALY_TYPES = (
+    "kbk_knp_mismatch",     # KBK от другого платежа при том же KNP
+    "amount_spike",         # сумма x20..x500
+    "commission_mismatch",  # комиссия не равна тарифной
+    "failed_status",        # транзакция FAILED с ошибкой
+    "missing_ugd",          # KBK требует UGD, а его нет
+    "counterparty_swap",    # получатель/UGD в транзакции от другого платежа
+)
+
+P = {name: i for i, name in enumerate(PAYLOAD_FEATURES)}
+T = {name: i for i, name in enumerate(TRANSACTION_FEATURES)}
+PAYLOAD_KBK = [P["kbk_code"], P["kbk_employee_flag"], P["kbk_ugd_flag"], P["kbk_name"]]
+PAYLOAD_UGD = [P["has_ugd"], P["ugd_code"], P["ugd_bin"], P["ugd_name"]]
+TX_UGD = [T["has_ugd"], T["ugd_bin_hash"], T["credit_id_hash"], T["counterparty_len"]]
+
+
+def vectorize_records(records: Iterable[Dict]):
+    """
+    Реальные записи журнала -> (X_payload, X_tx) через PaymentFeatureExtractor
+    и generate_ideal_output, как в neural_test.train_model.
+    """
+    payloads = [PaymentPayload.from_dict(record) for record in records]
+    transactions = [
+        TransactionDetail.from_dict(generate_ideal_output(payload.to_dict(), is_payload=True))
+        for payload in payloads
+    ]
+    X_payload = np.stack([PaymentFeatureExtractor.payload_to_vector(p)['vector'] for p in payloads])
+    X_tx = np.stack([PaymentFeatureExtractor.transaction_to_vector(t)['vector'] for t in transactions])
+    return X_payload, X_tx
+
+
+class AnomalyInjector:
+    """
+    Мутирует долю rate строк. Тип для каждой аномальной строки выбирается
+    с весами weights среди типов, применимых к ней (missing_ugd и
+    counterparty_swap — только для строк с UGD). Исходные матрицы не меняются.
+    """
+
+    def __init__(
+        self,
+        rate: float = 0.05,
+        types: Sequence[str] = ANOMALY_TYPES,
+        weights: Optional[Sequence[float]] = None,
+        seed: Optional[int] = None
+    ):
+        unknown = set(types) - set(ANOMALY_TYPES)
+        if unknown:
+            raise ValueError(f"Неизвестные типы аномалий: {sorted(unknown)}")
+        self.rate = rate
+        self.type_ids = np.array([ANOMALY_TYPES.index(name) for name in types])
+        self.weights = np.asarray(weights if weights is not None else np.ones(len(types)), dtype=np.float64)
+        self.rng = np.random.default_rng(seed)
+
+    def inject(self, X_payload: np.ndarray, X_tx: np.ndarray) -> Dict[str, np.ndarray]:
+        rng = self.rng
+        n = len(X_payload)
+        X_payload = X_payload.copy()
+        X_tx = X_tx.copy()
+
+        rows = np.flatnonzero(rng.random(n) < self.rate)
+        has_ugd = X_payload[rows, P["has_ugd"]] > 0
+        eligible = np.ones((len(rows), len(self.type_ids)), dtype=bool)
+        for column, type_id in enumerate(self.type_ids):
+            if ANOMALY_TYPES[type_id] in ("missing_ugd", "counterparty_swap"):
+                eligible[:, column] = has_ugd
+        # Взвешенный выбор среди применимых типов одним argmax
+        scores = rng.random(eligible.shape) ** (1.0 / self.weights) * eligible
+        picked = scores.argmax(axis=1)
+        keep = eligible[np.arange(len(rows)), picked]
+        rows, types = rows[keep], self.type_ids[picked[keep]]
+
+        original_payload, original_tx = X_payload[rows], X_tx[rows]
+        for type_id, name in enumerate(ANOMALY_TYPES):
+            target = rows[types == type_id]
+            if len(target):
+                getattr(self, f"_{name}")(X_payload, X_tx, target)
+
+        # Мутация могла не найти отличающегося донора (мало разных KBK/UGD) — такие строки не метим
+        changed = np.any(X_payload[rows] != original_payload, axis=1) | np.any(X_tx[rows] != original_tx, axis=1)
+        rows, types = rows[changed], types[changed]
+        labels = np.zeros(n, dtype=np.int8)
+        type_column = np.full(n, -1, dtype=np.int8)
+        labels[rows] = 1
+        type_column[rows] = types
+
+        return {
+            "X_payload": X_payload,
+            "X_tx": X_tx,
+            "labels": labels,
+            "types": type_column,
+            "type_names": np.array(ANOMALY_TYPES),
+        }
+
+    def _donors(self, X: np.ndarray, target: np.ndarray, columns) -> np.ndarray:
+        """Для каждой целевой строки — случайная строка с другими значениями columns"""
+        n = len(X)
+        donors = self.rng.integers(0, n, size=len(target))
+        for _ in range(8):
+            same = np.all(X[donors][:, columns] == X[target][:, columns], axis=1)
+            if not same.any():
+                break
+            donors[same] = self.rng.integers(0, n, size=same.sum())
+        return donors
+
+    def _kbk_knp_mismatch(self, X_payload, X_tx, target):
+        donors = self._donors(X_payload, target, PAYLOAD_KBK)
+        X_payload[np.ix_(target, PAYLOAD_KBK)] = X_payload[np.ix_(donors, PAYLOAD_KBK)]
+        X_tx[target, T["kbk_code"]] = X_tx[donors, T["kbk_code"]]
+        X_tx[target, T["kbk_name_hash"]] = X_tx[donors, T["kbk_name_hash"]]
+
+    def _amount_spike(self, X_payload, X_tx, target):
+        factor = np.exp(self.rng.uniform(np.log(20), np.log(500), size=len(target)))
+        X_payload[target, P["amount"]] *= factor
+        X_tx[target, T["amount"]] *= factor
+
+    def _commission_mismatch(self, X_payload, X_tx, target):
+        # Тариф 150 -> 0.15 после нормировки; берём 0..5000 тенге, но не около тарифа
+        commission = self.rng.uniform(0.0, 5.0, size=len(target))
+        commission = np.where(np.abs(commission - X_tx[target, T["commission"]]) < 0.05, commission + 0.5, commission)
+        X_tx[target, T["commission"]] = commission
+
+    def _failed_status(self, X_payload, X_tx, target):
+        X_tx[target, T["status_completed"]] = 0.0
+        X_tx[target, T["status_failed"]] = 1.0
+        X_tx[target, T["has_error"]] = 1.0
+
+    def _missing_ugd(self, X_payload, X_tx, target):
+        X_payload[np.ix_(target, PAYLOAD_UGD)] = 0.0
+        X_tx[np.ix_(target, TX_UGD)] = 0.0
+
+    def _counterparty_swap(self, X_payload, X_tx, target):
+        donors = self._donors(X_tx, target, TX_UGD)
+        donors = np.where(X_tx[donors, T["has_ugd"]] > 0, donors, target)
+        X_tx[np.ix_(target, TX_UGD)] = X_tx[np.ix_(donors, TX_UGD)]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Размеченный набор аномалий для бенчмарка детекторов")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--snapshot", default="dictionary_cache.json", help="Синтетика из снапшота справочников")
+    source.add_argument("--journal", help="Реальные payload'ы из журнала (successful_payloads.json)")
+    parser.add_argument("-n", "--count", type=int, default=100_000, help="Строк синтетики")
+    parser.add_argument("--rate", type=float, default=0.05)
+    parser.add_argument("--types", nargs="+", default=list(ANOMALY_TYPES), choices=ANOMALY_TYPES)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", default="anomaly_benchmark.npz")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.journal:
+        with open(args.journal, "r", encoding="utf-8") as f:
+            X_payload, X_tx = vectorize_records(json.load(f))
+    else:
+        generator = OfflinePayloadGenerator.from_snapshot(args.snapshot, seed=args.seed)
+        columns = generator.sample(args.count)
+        X_payload, X_tx = generator.features(columns), generator.transaction_features(columns)
+
+    dataset = AnomalyInjector(args.rate, args.types, seed=args.seed).inject(X_payload, X_tx)
+    np.savez_compressed(args.output, **dataset)
+    counts = np.bincount(dataset["types"][dataset["labels"] == 1], minlength=len(ANOMALY_TYPES))
+    print(f"{len(X_payload)} строк, аномалий {int(dataset['labels'].sum())} -> {args.output}")
+    for name, count in zip(ANOMALY_TYPES, counts):
+        print(f"  {name:<20}{count:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+# benchmark_detectors.py
+"""
+Сравнение детекторов аномалий по стоимости и качеству на одних и тех же
+размеченных данных (anomaly_injection.AnomalyInjector):
+
+    python benchmark_detectors.py --sizes 10000 100000 1000000 --seed 42
+    python benchmark_detectors.py --dataset anomaly_benchmark.npz --sizes 100000 --output bench.json
+
+Для каждого размера данные делятся пополам: детектор обучается на нормальных
+строках первой половины (не больше --fit-rows), скорит вторую. Признаки
+стандартизуются по обучающим строкам (кроме готовых весов и Pipeline).
+Порог — квантиль --threshold-quantile скоров на обучающих строках
+(как 95-й перцентиль в demo_testing/anomaly_detector.py). В таблице: время обучения, rows/s скоринга
+батчами, p99 задержки одной строки, пик прироста RSS (или tracemalloc вне Linux),
+precision/recall/F1.
+
+Каждый детектор меряется в отдельном процессе (spawn) после холостого прогона
+torch: иначе первый по порядку детектор платит за разовую инициализацию
+(аллокаторы, потоки, ленивые импорты) и в fit_s, и в peak_mb. --no-isolate —
+всё в одном процессе (быстрее, но цифры зависят от порядка).
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from sklearn.ensemble import IsolationForest
+from sklearn.metrics import f1_score, precision_score, recall_score
+
+from anomaly_injection import AnomalyInjector
+from offline_generator import TRANSACTION_FEATURES, OfflinePayloadGenerator, QUARTERS
+
+T = {name: i for i, name in enumerate(TRANSACTION_FEATURES)}
+TX_TYPES = {"type_empltax": "EMPLTAX", "type_indntrtax": "INDNTRTAX", "type_corptax": "CORPTAX", "type_indtax": "INDTAX"}
+
+
+class Detector:
+    """fit на нормальных строках, score -> [N], чем больше, тем аномальнее"""
+    name = "detector"
+    # Признаки PaymentFeatureExtractor не нормированы (ugd_bin ~1e8, knp ~1e3):
+    # без стандартизации по обучающим строкам ошибку любой модели определяет ugd_bin
+    standardize = True
+
+    def fit(self, X_payload: np.ndarray, X_tx: np.ndarray):
+        pass
+
+    def score(self, X_payload: np.ndarray, X_tx: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+def _train_torch(model, forward_loss, tensors, epochs, batch_size, lr=1e-3):
+    optimizer = optim.Adam(model.parameters(), lr=lr)
+    n = len(tensors[0])
+    model.train()
+    for _ in range(epochs):
+        order = torch.randperm(n)
+        for start in range(0, n, batch_size):
+            batch = [t[order[start:start + batch_size]] for t in tensors]
+            optimizer.zero_grad()
+            loss = forward_loss(*batch)
+            loss.backward()
+            optimizer.step()
+    model.eval()
+
+
+def _score_torch(score_batch, tensors, batch_size=65536) -> np.ndarray:
+    parts = []
+    with torch.no_grad():
+        for start in range(0, len(tensors[0]), batch_size):
+            parts.append(score_batch(*[t[start:start + batch_size] for t in tensors]).numpy())
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+
+
+class PaymentAutoencoderDetector(Detector):
+    """
+    neural_test.PaymentAutoencoder: payload [21] -> ожидаемая транзакция [37].
+    Скор — MSE между предсказанием и фактической транзакцией.
+    С weights — готовые веса (fit не обучает), иначе обучение как в train_model.
+    """
+    name = "payment_autoencoder"
+
+    def __init__(self, weights: Optional[str] = None, epochs: int = 5, batch_size: int = 1024):
+        self.weights = weights
+        # Готовые веса обучены на сырых признаках
+        self.standardize = not weights
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.model = None
+
+    def fit(self, X_payload, X_tx):
+        if self.weights:
+            from model_testing import load_trained_model
+            self.model = load_trained_model(self.weights)
+            return
+        from neural_test import PaymentAutoencoder
+        self.model = PaymentAutoencoder()
+        reconstruction_loss, anomaly_loss = nn.MSELoss(), nn.BCELoss()
+
+        def forward_loss(payload, target):
+            decoded, anomaly_score = self.model(payload)
+            return reconstruction_loss(decoded, target) + anomaly_loss(anomaly_score, torch.zeros_like(anomaly_score))
+
+        _train_torch(self.model, forward_loss, [torch.from_numpy(X_payload), torch.from_numpy(X_tx)], self.epochs, self.batch_size)
+
+    def score(self, X_payload, X_tx):
+        def score_batch(payload, target):
+            decoded, _ = self.model(payload)
+            return (decoded - target).pow(2).mean(dim=1)
+        return _score_torch(score_batch, [torch.from_numpy(X_payload), torch.from_numpy(X_tx)])
+
+
+class ConcatAutoencoderDetector(Detector):
+    """
+    Демо-автоэнкодеры (demo_testing AutoEncoder, nn_training Autoencoder) на
+    склейке [payload, транзакция] [58]; скор — ошибка восстановления.
+    """
+
+    def __init__(self, name: str, build, epochs: int = 5, batch_size: int = 1024):
+        self.name = name
+        self.build = build
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.model = None
+
+    def fit(self, X_payload, X_tx):
+        X = torch.from_numpy(np.hstack([X_payload, X_tx]))
+        self.model = self.build(X.shape[1])
+        criterion = nn.MSELoss()
+        _train_torch(self.model, lambda x: criterion(self.model(x), x), [X], self.epochs, self.batch_size)
+
+    def score(self, X_payload, X_tx):
+        X = torch.from_numpy(np.hstack([X_payload, X_tx]))
+        return _score_torch(lambda x: (self.model(x) - x).pow(2).mean(dim=1), [X])
+
+
+class IsolationForestDetector(Detector):
+    name = "isolation_forest"
+
+    def __init__(self, n_estimators: int = 100, seed: Optional[int] = 42):
+        self.model = IsolationForest(n_estimators=n_estimators, contamination='auto', random_state=seed)
+
+    def fit(self, X_payload, X_tx):
+        self.model.fit(np.hstack([X_payload, X_tx]))
+
+    def score(self, X_payload, X_tx):
+        # score_samples: чем меньше, тем аномальнее — разворачиваем
+        return -self.model.score_samples(np.hstack([X_payload, X_tx]))
+
+
+class PickledPipelineDetector(Detector):
+    """
+    Готовый sklearn Pipeline из anomaly_detection_model.pkl (не переобучается).
+    Он ждёт сырые колонки транзакции, их восстанавливаем из матрицы признаков
+    (обратно нормировкам transaction_to_vector); knpCode берём из payload.
+    """
+    name = "sklearn_pipeline"
+    standardize = False
+
+    def __init__(self, path: str = "anomaly_detection_model.pkl"):
+        import joblib
+        self.model = joblib.load(path)
+
+    def fit(self, X_payload, X_tx):
+        pass
+
+    @staticmethod
+    def frame(X_payload, X_tx):
+        import pandas as pd
+        year = np.rint(X_tx[:, T["payment_year"]] * 50 + 2000)
+        quarter = np.rint(X_tx[:, T["payment_quarter"]] * 4).astype(int)
+        type_columns = [T[name] for name in TX_TYPES]
+        type_names = np.array(list(TX_TYPES.values()))
+        return pd.DataFrame({
+            "amount": X_tx[:, T["amount"]] * 1_000_000,
+            "commission": X_tx[:, T["commission"]] * 1000,
+            "paymentYear": np.where(quarter > 0, year, np.nan),
+            "paymentQuarter": np.where(quarter > 0, np.array((None,) + QUARTERS, dtype=object)[np.clip(quarter, 0, 4)], None),
+            "kbkCode": np.rint(X_tx[:, T["kbk_code"]] * 1_000_000).astype(np.int64).astype(str),
+            "knpCode": np.rint(X_payload[:, 2]).astype(np.int64).astype(str),
+            "transactionType": type_names[X_tx[:, type_columns].argmax(axis=1)],
+        })
+
+    def score(self, X_payload, X_tx):
+        frame = self.frame(X_payload, X_tx)
+        if hasattr(self.model, "score_samples"):
+            return -np.asarray(self.model.score_samples(frame), dtype=np.float64)
+        if hasattr(self.model, "decision_function"):
+            return -np.asarray(self.model.decision_function(frame), dtype=np.float64)
+        return (np.asarray(self.model.predict(frame)) == -1).astype(np.float64)
+
+
+DETECTORS = ("payment_autoencoder", "demo_autoencoder", "nn_page_autoencoder", "isolation_forest", "sklearn_pipeline")
+
+
+def build_detector(name: str, args) -> Detector:
+    if name == "payment_autoencoder":
+        return PaymentAutoencoderDetector(args.weights, args.epochs, args.batch_size)
+    if name == "demo_autoencoder":
+        from demo_testing.anomaly_detector import AutoEncoder
+        return ConcatAutoencoderDetector(name, lambda dim: AutoEncoder(input_dim=dim, hidden_dim=16, bottleneck=4), args.epochs, args.batch_size)
+    if name == "nn_page_autoencoder":
+        from nn_training import Autoencoder
+        return ConcatAutoencoderDetector(name, lambda dim: Autoencoder(input_dim=dim), args.epochs, args.batch_size)
+    if name == "isolation_forest":
+        return IsolationForestDetector(seed=args.seed)
+    if name == "sklearn_pipeline":
+        return PickledPipelineDetector(args.pipeline)
+    raise ValueError(f"Неизвестный детектор: {name}")
+
+
+class PeakMemory:
+    """
+    Пик прироста памяти внутри with: RSS из /proc (видит и тензоры torch),
+    вне Linux — tracemalloc (только аллокации Python/numpy).
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._use_proc = os.path.exists("/proc/self/statm")
+        self._page = os.sysconf("SC_PAGE_SIZE") if self._use_proc else 0
+        self._stop = threading.Event()
+
+    def _rss(self) -> int:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * self._page
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, self._rss() - self._start)
+
+    def __enter__(self):
+        if self._use_proc:
+            self._start = self._rss()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        else:
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._use_proc:
+            self._stop.set()
+            self._thread.join()
+            self.peak_bytes = max(self.peak_bytes, self._rss() - self._start)
+        else:
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+
+def load_dataset(args, size: int, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    if args.dataset:
+        dataset = np.load(args.dataset)
+        n = len(dataset["labels"])
+        rows = np.sort(rng.choice(n, size=min(size, n), replace=False))
+        return {key: dataset[key][rows] for key in ("X_payload", "X_tx", "labels")}
+    generator = OfflinePayloadGenerator.from_snapshot(args.snapshot, seed=args.seed)
+    columns = generator.sample(size)
+    return AnomalyInjector(args.rate, seed=args.seed).inject(generator.features(columns), generator.transaction_features(columns))
+
+
+def standardize(X: np.ndarray, train: np.ndarray) -> np.ndarray:
+    mean = X[train].mean(axis=0)
+    std = X[train].std(axis=0)
+    std[std == 0] = 1.0
+    return ((X - mean) / std).astype(np.float32)
+
+
+def warm_up():
+    """Холостые forward/backward/step: разовые расходы torch не попадают в замеры"""
+    model = nn.Sequential(nn.Linear(64, 32), nn.ReLU(), nn.Linear(32, 64))
+    optimizer = optim.Adam(model.parameters(), lr=1e-3)
+    batch = torch.randn(256, 64)
+    for _ in range(3):
+        optimizer.zero_grad()
+        loss = nn.functional.mse_loss(model(batch), batch)
+        loss.backward()
+        optimizer.step()
+    with torch.no_grad():
+        model(batch[:1])
+
+
+def _isolated_run(name: str, data_dir: str, args) -> Dict:
+    """Точка входа дочернего процесса: данные с диска, прогрев, замер одного детектора"""
+    torch.manual_seed(args.seed)
+    data = {key: np.load(os.path.join(data_dir, f"{key}.npy")) for key in ("X_payload", "X_tx", "labels")}
+    warm_up()
+    return run_detector(build_detector(name, args), data, args, np.random.default_rng(args.seed))
+
+
+def run_detector(detector: Detector, data: Dict[str, np.ndarray], args, rng: np.random.Generator) -> Dict:
+    X_payload, X_tx, labels = data["X_payload"], data["X_tx"], data["labels"]
+    half = len(labels) // 2
+    train = np.flatnonzero(labels[:half] == 0)[:args.fit_rows]
+    test = np.arange(half, len(labels))
+    if detector.standardize:
+        X_payload, X_tx = standardize(X_payload, train), standardize(X_tx, train)
+
+    with PeakMemory() as memory:
+        started_at = time.perf_counter()
+        detector.fit(X_payload[train], X_tx[train])
+        fit_s = time.perf_counter() - started_at
+
+        threshold = np.quantile(detector.score(X_payload[train], X_tx[train]), args.threshold_quantile)
+
+        started_at = time.perf_counter()
+        scores = detector.score(X_payload[test], X_tx[test])
+        score_s = time.perf_counter() - started_at
+
+    single = []
+    for row in rng.choice(test, size=min(args.latency_samples, len(test)), replace=False):
+        started_at = time.perf_counter()
+        detector.score(X_payload[row:row + 1], X_tx[row:row + 1])
+        single.append(time.perf_counter() - started_at)
+
+    predicted = (scores > threshold).astype(int)
+    truth = labels[test]
+    return {
+        "detector": detector.name,
+        "rows": len(labels),
+        "fit_rows": len(train),
+        "fit_s": fit_s,
+        "rows_per_s": len(test) / score_s if score_s else float("inf"),
+        "p99_ms": float(np.percentile(single, 99) * 1000) if single else None,
+        "peak_mb": memory.peak_bytes / 2**20,
+        "precision": precision_score(truth, predicted, zero_division=0),
+        "recall": recall_score(truth, predicted, zero_division=0),
+        "f1": f1_score(truth, predicted, zero_division=0),
+    }
+
+
+def print_table(rows: List[Dict]):
+    header = f"{'detector':<22}{'rows':>10}{'fit_s':>9}{'rows/s':>12}{'p99_ms':>9}{'peak_mb':>9}{'P':>7}{'R':>7}{'F1':>7}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        if "error" in row:
+            print(f"{row['detector']:<22}{row['rows']:>10}  пропущен: {row['error']}")
+            continue
+        p99 = f"{row['p99_ms']:>9.2f}" if row["p99_ms"] is not None else f"{'-':>9}"
+        print(
+            f"{row['detector']:<22}{row['rows']:>10}{row['fit_s']:>9.2f}{row['rows_per_s']:>12.0f}"
+            f"{p99}{row['peak_mb']:>9.1f}{row['precision']:>7.3f}{row['recall']:>7.3f}{row['f1']:>7.3f}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк детекторов аномалий: стоимость и качество")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--snapshot", default="dictionary_cache.json", help="Синтетика из снапшота справочников")
+    source.add_argument("--dataset", help="Готовый .npz из anomaly_injection.py (подвыборки размера --sizes)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--detectors", nargs="+", default=list(DETECTORS), choices=DETECTORS)
+    parser.add_argument("--rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--fit-rows", type=int, default=200_000, help="Максимум строк для обучения")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--weights", help="Готовые веса PaymentAutoencoder вместо обучения")
+    parser.add_argument("--pipeline", default="anomaly_detection_model.pkl")
+    parser.add_argument("--threshold-quantile", type=float, default=0.95)
+    parser.add_argument("--latency-samples", type=int, default=200)
+    parser.add_argument("--no-isolate", dest="isolate", action="store_false",
+                        help="Не запускать каждый детектор в отдельном процессе")
+    parser.add_argument("--output", help="JSON с результатами")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    torch.manual_seed(args.seed)
+    if not args.isolate:
+        warm_up()
+    results = []
+    for size in args.sizes:
+        data = load_dataset(args, size, np.random.default_rng(args.seed))
+        with tempfile.TemporaryDirectory(prefix="bench_") as data_dir:
+            if args.isolate:
+                # Данные один раз на диск: дочерние процессы читают их до начала замера
+                for key in ("X_payload", "X_tx", "labels"):
+                    np.save(os.path.join(data_dir, f"{key}.npy"), data[key])
+            for name in args.detectors:
+                try:
+                    if args.isolate:
+                        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                            results.append(pool.submit(_isolated_run, name, data_dir, args).result())
+                    else:
+                        detector = build_detector(name, args)
+                        results.append(run_detector(detector, data, args, np.random.default_rng(args.seed)))
+                except Exception as e:
+                    results.append({"detector": name, "rows": len(data["labels"]), "error": repr(e)})
+    print_table(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -6,24 +6,37 @@ from dateutil.relativedelta import relativedelta
 import json
 from typing import Dict, Any, Optional, List
 
+from services.dictionary_cache import CachedDictionaryService
+from services.period_resolver import PaymentPeriodResolver
+
 class PaymentPayloadGenerator:
-    def __init__(self, base_url: str, token: str):
+    def __init__(self, base_url: str, token: str, prefetch_periods: bool = False, token_manager=None):
+        """
+        token_manager (TokenManager) — для долгих прогонов: заголовки берутся из него
+        на каждый запрос, на 401 токен обновляется и запрос повторяется.
+        """
         self.base_url = base_url
+        self.token_manager = token_manager
+        self.token = token_manager.get_token() if token_manager is not None else token
         self.headers = {
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/json"
         }
         self.selected_operation_type = "INDIVIDUAL_ENTREPRENEUR"
+        self.period_resolver = PaymentPeriodResolver(self._fetch_api_data)
         self._load_initial_data()
+        if prefetch_periods:
+            self.period_resolver.prefetch(self.selected_operation_type, self.kbk_list)
 
     def _fetch_api_data(self, endpoint: str) -> Dict:
         """Базовый метод для выполнения API-запросов"""
         try:
-            response = requests.get(
-                f"{self.base_url}{endpoint}",
-                headers=self.headers,
-                verify=False
-            )
+            headers = self.token_manager.headers() if self.token_manager is not None else self.headers
+            response = requests.get(f"{self.base_url}{endpoint}", headers=headers, verify=False)
+            if response.status_code == 401 and self.token_manager is not None:
+                stale_token = headers["Authorization"][len("Bearer "):]
+                if self.token_manager.refresh(stale_token=stale_token):
+                    response = requests.get(f"{self.base_url}{endpoint}", headers=self.token_manager.headers(), verify=False)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -41,24 +54,17 @@ class PaymentPayloadGenerator:
         if not self.valid_accounts:
             raise Exception("Нет доступных счетов для списания")
         
-        # Загрузка справочников
-        self.ugd_list = self._fetch_api_data("/api/dictionary/dictionary/ugd/all")
-        self.kbk_list = self._fetch_api_data(
-            f"/api/dictionary/dictionary/kbk/kbk-to-knp-list?taxesPaymentOperationType={self.selected_operation_type}"
-        )
+        # Загрузка справочников (из локального кэша, сеть только при устаревании)
+        self.dictionary = CachedDictionaryService(self.base_url, self.token, token_manager=self.token_manager)
+        self.ugd_list = self.dictionary.get_ugd_list()
+        self.kbk_list = self.dictionary.get_kbk_list(self.selected_operation_type)
         
         if not self.kbk_list:
             raise Exception("Не удалось загрузить список KBK")
 
     def fetch_period_list(self, kbk_code: str, knp_code: str) -> List[Dict]:
         """Получение списка периодов для KBK/KNP"""
-        period_data = self._fetch_api_data(
-            f"/api/dictionary/dictionary/payment-period?"
-            f"operationType={self.selected_operation_type}"
-            f"&kbk={kbk_code}"
-            f"&knp={knp_code}"
-            f"&id=0"
-        )
+        period_data = self.period_resolver.get(self.selected_operation_type, kbk_code, knp_code)
 
         if not period_data or period_data.get("periodType") is None:
             return []
@@ -87,11 +93,11 @@ class PaymentPayloadGenerator:
     ) -> Dict[str, Any]:
         """Генерация payload для платежа"""
         # Находим KBK и KNP в справочниках
-        kbk = next((k for k in self.kbk_list if k["code"] == kbk_code), None)
+        kbk = self.dictionary.kbk_by_code(self.selected_operation_type).get(kbk_code)
         if not kbk:
             raise ValueError(f"KBK с кодом {kbk_code} не найден")
         
-        knp = next((k for k in kbk["knpList"] if k["knpCode"] == knp_code), None)
+        knp = self.dictionary.knp_by_kbk(self.selected_operation_type).get((kbk["code"], knp_code))
         if not knp:
             raise ValueError(f"KNP с кодом {knp_code} не найден для KBK {kbk_code}")
 
@@ -128,7 +134,7 @@ class PaymentPayloadGenerator:
             if not ugd_code:
                 ugd = random.choice(self.ugd_list)
             else:
-                ugd = next((u for u in self.ugd_list if u["code"] == ugd_code), None)
+                ugd = self.dictionary.ugd_by_code().get(ugd_code)
                 if not ugd:
                     raise ValueError(f"UGD с кодом {ugd_code} не найден")
             
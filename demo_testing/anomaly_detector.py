@@ -1,4 +1,9 @@
 # anomaly_detector.py
+import argparse
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 import numpy as np
 import torch
@@ -56,31 +61,87 @@ def eval_autoencoder(model, data):
     mse = (recon - X).pow(2).mean(dim=1).numpy()
     return mse
 
-def main():
-    # Шаг 1: Сбор данных
-    all_data = []
-    all_labels = []
-    N = 30  # кол-во запросов
-    batch_size = 20  # сколько точек за раз
-    anomaly_rate = 0.08  # немного повысим шанс аномалий
-
-    for i in range(N):
-        # делаем GET-запрос
-        url = f"{SERVER_URL}/data?n={batch_size}&anomaly_rate={anomaly_rate}"
-        resp = requests.get(url)
+def collect(total, batch_size=1000, rate=0.08, workers=8, server_url=SERVER_URL):
+    """
+    Собирает total точек с /data параллельными батчами (не больше workers запросов
+    одновременно). Каждый батч пишется сразу в свой срез заранее выделенных
+    numpy-буферов; батчи с ошибкой выбрасываются при сжатии в конце.
+    """
+    data = np.empty(total, dtype=np.float32)
+    labels = np.empty(total, dtype=np.int8)
+    filled = np.zeros(total, dtype=bool)
+    local = threading.local()
+
+    def fetch(offset):
+        n = min(batch_size, total - offset)
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        try:
+            resp = local.session.get(f"{server_url}/data", params={"n": n, "rate": rate})
+        except requests.exceptions.RequestException as e:
+            print(f"[{offset}] Ошибка запроса: {e}")
+            return
         if resp.status_code != 200:
-            print(f"[{i}] Ошибка {resp.status_code}: {resp.text}")
-            continue
+            print(f"[{offset}] Ошибка {resp.status_code}: {resp.text}")
+            return
         out = resp.json()  # словарь {data: [...], labels: [...]}
-        data_batch = out["data"]
-        labels_batch = out["labels"]
-        all_data.extend(data_batch)
-        all_labels.extend(labels_batch)
-        time.sleep(0.3)  # маленькая пауза
-    
-    all_data = np.array(all_data, dtype=np.float32)
-    all_labels = np.array(all_labels, dtype=int)
-    print(f"\nВсего собрано {len(all_data)} точек (из {N} запросов).")
+        count = min(n, len(out["data"]))
+        data[offset:offset + count] = out["data"][:count]
+        labels[offset:offset + count] = out["labels"][:count]
+        filled[offset:offset + count] = True
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(fetch, range(0, total, batch_size)))
+
+    if filled.all():
+        return data, labels
+    return data[filled], labels[filled]
+
+
+def collect_stream(total, rate=0.08, chunk=10000, server_url=SERVER_URL):
+    """Собирает total точек одним потоковым запросом к /data/stream (NDJSON по чанкам)"""
+    data = np.empty(total, dtype=np.float32)
+    labels = np.empty(total, dtype=np.int8)
+    filled = 0
+    with requests.get(
+        f"{server_url}/data/stream",
+        params={"n": total, "rate": rate, "chunk": chunk},
+        stream=True
+    ) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            if not line:
+                continue
+            out = json.loads(line)
+            count = min(len(out["data"]), total - filled)
+            data[filled:filled + count] = out["data"][:count]
+            labels[filled:filled + count] = out["labels"][:count]
+            filled += count
+    return data[:filled], labels[:filled]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Сравнение AutoEncoder и IsolationForest на данных demo-сервера")
+    parser.add_argument("--server-url", default=SERVER_URL)
+    parser.add_argument("--points", type=int, default=600, help="Сколько точек собрать")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Точек за один запрос")
+    parser.add_argument("--workers", type=int, default=8, help="Одновременных запросов")
+    parser.add_argument("--rate", type=float, default=0.08, help="Доля аномалий (немного выше серверных 7%%)")
+    parser.add_argument("--stream", action="store_true", help="Один потоковый запрос к /data/stream вместо батчей")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Шаг 1: Сбор данных
+    started_at = time.perf_counter()
+    if args.stream:
+        all_data, all_labels = collect_stream(args.points, args.rate, args.batch_size, args.server_url)
+    else:
+        all_data, all_labels = collect(args.points, args.batch_size, args.rate, args.workers, args.server_url)
+    all_labels = all_labels.astype(int)
+    print(f"\nВсего собрано {len(all_data)} точек за {time.perf_counter() - started_at:.2f} с.")
 
     # Шаг 2: Автоэнкодер
     model = AutoEncoder(input_dim=1, hidden_dim=16, bottleneck=4)
@@ -0,0 +1,123 @@
+# payment_stub_server.py
+"""
+Локальная заглушка платёжного API для проверки самого генератора нагрузки
+(load_test.py) без реального backend'а: счета, справочники, периоды,
+multi-calculate и init/entrepreneur с настраиваемой задержкой и долей ошибок.
+
+    python demo_testing/payment_stub_server.py --port 5055 --latency-ms 20 --jitter-ms 10 --error-rate 0.05
+    python load_test.py --base-url http://127.0.0.1:5055 --token stub --mode open --rps 200 --duration 30
+"""
+import argparse
+import random
+import time
+import uuid
+
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+
+CONFIG = {
+    "latency_ms": 20.0,
+    "jitter_ms": 10.0,
+    "error_rate": 0.05,
+}
+
+ACCOUNTS = [
+    {"iban": "KZ00STUB0000000001", "accountStatus": "OPEN", "fullyBlocked": False,
+     "availableBalance": 10_000_000, "currency": "KZT"},
+    {"iban": "KZ00STUB0000000002", "accountStatus": "OPEN", "fullyBlocked": False,
+     "availableBalance": 2_500_000, "currency": "KZT"},
+]
+
+UGD_LIST = [
+    {"bin": "940740000961", "name": "УГД по Алмалинскому району", "code": "600302"},
+    {"bin": "620240000012", "name": "УГД по Есильскому району", "code": "620302"},
+]
+
+KBK_LIST = [
+    {"name": "ИПН с доходов ИП", "code": 101202, "employeeLoadingRequired": False, "ugdLoadingRequired": True,
+     "knpList": [{"knpCode": "911", "knpName": "Основной платёж"}, {"knpCode": "912", "knpName": "Пеня"}]},
+    {"name": "Социальный налог", "code": 103101, "employeeLoadingRequired": False, "ugdLoadingRequired": True,
+     "knpList": [{"knpCode": "911", "knpName": "Основной платёж"}]},
+    {"name": "Административные штрафы", "code": 204101, "employeeLoadingRequired": False, "ugdLoadingRequired": False,
+     "knpList": [{"knpCode": "911", "knpName": "Основной платёж"}]},
+]
+
+
+def simulate_latency():
+    delay = CONFIG["latency_ms"] + random.uniform(-CONFIG["jitter_ms"], CONFIG["jitter_ms"])
+    if delay > 0:
+        time.sleep(delay / 1000)
+
+
+def simulate_error():
+    """Ответ 500 с вероятностью error_rate, иначе None"""
+    if random.random() < CONFIG["error_rate"]:
+        return jsonify({"code": "STUB_ERROR", "message": "Случайная ошибка заглушки"}), 500
+    return None
+
+
+@app.route("/api/account/accounts", methods=["GET"])
+def accounts():
+    return jsonify({"accounts": ACCOUNTS})
+
+
+@app.route("/api/dictionary/dictionary/ugd/all", methods=["GET"])
+def ugd_all():
+    return jsonify(UGD_LIST)
+
+
+@app.route("/api/dictionary/dictionary/kbk/kbk-to-knp-list", methods=["GET"])
+def kbk_to_knp_list():
+    return jsonify(KBK_LIST)
+
+
+@app.route("/api/dictionary/dictionary/payment-period", methods=["GET"])
+def payment_period():
+    year = time.localtime().tm_year - 1
+    return jsonify({
+        "periodType": "QUARTER",
+        "periods": [
+            {"year": year, "quarter": quarter, "yearHalf": None}
+            for quarter in ("FIRST", "SECOND", "THIRD", "FOURTH")
+        ]
+    })
+
+
+@app.route("/api/charge-calculator/api/v1/charges/trn/multi-calculate", methods=["PUT"])
+def multi_calculate():
+    simulate_latency()
+    error = simulate_error()
+    if error:
+        return error
+    items = request.json or []
+    return jsonify([
+        {"transactionId": item.get("transactionId"), "commission": 150, "currency": "KZT"}
+        for item in items
+    ])
+
+
+@app.route("/api/payment/api/v5/budget/init/entrepreneur", methods=["POST"])
+def init_entrepreneur():
+    simulate_latency()
+    error = simulate_error()
+    if error:
+        return error
+    payload = request.json or {}
+    return jsonify({
+        "id": str(uuid.uuid4()),
+        "transactionId": payload.get("transactionId"),
+        "status": "IN_PROGRESS"
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушка платёжного API для load_test.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--latency-ms", type=float, default=CONFIG["latency_ms"])
+    parser.add_argument("--jitter-ms", type=float, default=CONFIG["jitter_ms"])
+    parser.add_argument("--error-rate", type=float, default=CONFIG["error_rate"])
+    args = parser.parse_args()
+    CONFIG.update(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    app.run(host=args.host, port=args.port, threaded=True)
@@ -1,9 +1,36 @@
 # server.py
-import random
-from flask import Flask, jsonify, request
+import json
+
+import numpy as np
+from flask import Flask, Response, jsonify, request
 
 app = Flask(__name__)
 
+rng = np.random.default_rng()
+
+
+def generate(n, anomaly_rate):
+    """
+    n точек N(50, 7); с вероятностью anomaly_rate точка — аномалия одного из типов:
+    big_pos (+70..120), big_neg (-50..100), zero (= 0). Возвращает (data, labels).
+    """
+    data = rng.normal(50, 7, size=n)
+    labels = rng.random(n) < anomaly_rate
+    # разные типы аномалий: 0 = big_pos, 1 = big_neg, 2 = zero
+    anomaly_type = np.where(labels, rng.integers(0, 3, size=n), -1)
+    big_pos = anomaly_type == 0
+    big_neg = anomaly_type == 1
+    data[big_pos] += rng.uniform(70, 120, size=big_pos.sum())
+    data[big_neg] -= rng.uniform(50, 100, size=big_neg.sum())
+    data[anomaly_type == 2] = 0
+    return data, labels.astype(np.int8)
+
+
+def classify(values):
+    # Простая логика: число < 10 или > 90 — аномалия
+    return ((values < 10) | (values > 90)).astype(np.uint8)
+
+
 @app.route("/data", methods=["GET"])
 def get_data():
     """
@@ -17,47 +44,51 @@ def get_data():
     n = int(request.args.get("n", 10))  # сколько точек вернуть
     anomaly_rate = float(request.args.get("rate", 0.07))
 
-    data = []
-    labels = []
-    for _ in range(n):
-        val = random.gauss(50, 7)  # нормальное со средним 50 и sigma=7
-        is_anomaly = False
-        if random.random() < anomaly_rate:
-            # разные типы аномалий
-            anomaly_type = random.choice(["big_pos", "big_neg", "zero"])
-            if anomaly_type == "big_pos":
-                val += random.uniform(70, 120)
-            elif anomaly_type == "big_neg":
-                val -= random.uniform(50, 100)
-            else:  # zero
-                val = 0
-            is_anomaly = True
-        data.append(val)
-        labels.append(1 if is_anomaly else 0)
-
-    return jsonify({"data": data, "labels": labels})
+    data, labels = generate(n, anomaly_rate)
+    return jsonify({"data": data.tolist(), "labels": labels.tolist()})
+
+
+@app.route("/data/stream", methods=["GET"])
+def stream_data():
+    """
+    То же, что /data, но для больших n: NDJSON, по строке
+    {"data": [...], "labels": [...]} на каждые chunk точек.
+    Ответ отдаётся chunked, в памяти сервера не больше одного чанка.
+    """
+    n = int(request.args.get("n", 10))
+    anomaly_rate = float(request.args.get("rate", 0.07))
+    chunk = max(1, int(request.args.get("chunk", 10000)))
+
+    def chunks():
+        for offset in range(0, n, chunk):
+            data, labels = generate(min(chunk, n - offset), anomaly_rate)
+            yield json.dumps({"data": data.tolist(), "labels": labels.tolist()}) + "\n"
+
+    return Response(chunks(), mimetype="application/x-ndjson")
+
 
 @app.route("/detect", methods=["POST"])
 def detect_anomalies():
     """
     Примитивная логика (псевдомодель на сервере):
     - Если число < 10 или > 90, считаем аномалией
-    - Возвращаем JSON вида: { \"results\": [0/1, ...] }
+    - JSON { "values": [...] } -> JSON вида: { "results": [0/1, ...] }
+    - application/octet-stream (float32 little-endian подряд) -> uint8 0/1 на каждое значение
     """
+    if request.mimetype == "application/octet-stream":
+        body = request.get_data()
+        if len(body) % 4:
+            return jsonify({"error": "Body length is not a multiple of 4 (float32)"}), 400
+        values = np.frombuffer(body, dtype="<f4")
+        return Response(classify(values).tobytes(), mimetype="application/octet-stream")
+
     content = request.json
     if not content or "values" not in content:
         return jsonify({"error": "No 'values' field in JSON"}), 400
 
-    values = content["values"]
-    results = []
-    for x in values:
-        # Простая логика
-        if x < 10 or x > 90:
-            results.append(1)  # anomaly
-        else:
-            results.append(0)  # normal
+    values = np.asarray(content["values"], dtype=np.float64)
+    return jsonify({"results": classify(values).tolist()})
 
-    return jsonify({"results": results})
 
 if __name__ == "__main__":
     app.run(host="127.0.0.1", port=5000, debug=False)
@@ -0,0 +1,274 @@
+# drift_monitor.py
+"""
+Мониторинг дрейфа признаков PaymentFeatureExtractor: насколько поток
+платежей ушёл от того, на чём обучалась модель (новые KBK, рост сумм),
+чтобы пороги не устаревали молча.
+
+    monitor = DriftMonitor(PAYLOAD_FEATURES, reference_size=50_000, live_window=20_000)
+    for X in batches:                      # [N, 21] из payload_to_vector / offline_generator
+        for alert in monitor.update(X):
+            print(alert)
+
+Первые reference_size строк — эталон: по ним считаются границы бинов
+(квантили) и эталонная гистограмма, после чего буфер освобождается.
+Живое окно — кольцо из live_buckets гистограмм по live_window / live_buckets
+строк; старая корзина вычитается из суммы при вытеснении. Память —
+O(признаки * бины) при любом трафике, обновление — searchsorted + bincount
+на батч. По каждому признаку считаются PSI и KS (по бинам, поэтому KS —
+оценка снизу); алерт — при пересечении psi_threshold или ks_threshold,
+повторный — только после возврата ниже hysteresis * порог.
+
+    python drift_monitor.py --synthetic -n 300000 --drift-at 150000 --inflate 1.5
+    python drift_monitor.py --journal successful_payloads.json --reference-size 1000
+"""
+
+import argparse
+import json
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+EPS = 1e-4  # доля для пустых бинов, чтобы ln(p/q) оставался конечным
+
+
+class DriftMonitor:
+    def __init__(
+        self,
+        feature_names: Sequence[str],
+        bins: int = 20,
+        reference_size: int = 50_000,
+        live_window: int = 20_000,
+        live_buckets: int = 10,
+        psi_threshold: float = 0.2,
+        ks_threshold: float = 0.1,
+        min_live: Optional[int] = None,
+        hysteresis: float = 0.8
+    ):
+        self.feature_names = list(feature_names)
+        self.dim = len(self.feature_names)
+        self.bins = bins
+        self.reference_size = reference_size
+        self.live_buckets = live_buckets
+        self.bucket_size = max(1, live_window // live_buckets)
+        self.live_window = self.bucket_size * live_buckets
+        self.psi_threshold = psi_threshold
+        self.ks_threshold = ks_threshold
+        self.min_live = min_live if min_live is not None else self.live_window // 2
+        self.hysteresis = hysteresis
+        self.seen = 0
+
+        self._reference_buffer = np.zeros((reference_size, self.dim), dtype=np.float64)
+        self._reference_len = 0
+        self.edges: Optional[np.ndarray] = None  # [dim, bins - 1] внутренние границы
+        self.reference = np.zeros((self.dim, bins), dtype=np.int64)
+
+        self._ring = np.zeros((live_buckets, self.dim, bins), dtype=np.int64)
+        self._ring_rows = np.zeros(live_buckets, dtype=np.int64)
+        self._ring_pos = 0
+        self.live = np.zeros((self.dim, bins), dtype=np.int64)  # сумма кольца
+        self._offsets = np.arange(self.dim) * bins
+
+        self.psi = np.zeros(self.dim)
+        self.ks = np.zeros(self.dim)
+        self._drifting = np.zeros(self.dim, dtype=bool)
+
+    @property
+    def ready(self) -> bool:
+        return self.edges is not None
+
+    @property
+    def live_count(self) -> int:
+        return int(self._ring_rows.sum())
+
+    def update(self, X) -> List[Dict]:
+        """Учитывает батч [N, dim]; возвращает алерты по признакам, впервые пересёкшим порог"""
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.dim)
+        self.seen += len(X)
+        if not self.ready:
+            take = min(len(X), self.reference_size - self._reference_len)
+            self._reference_buffer[self._reference_len:self._reference_len + take] = X[:take]
+            self._reference_len += take
+            X = X[take:]
+            if self._reference_len < self.reference_size:
+                return []
+            self._fit_reference(self._reference_buffer)
+        if not len(X):
+            return []
+
+        # Батч раскладывается по корзинам кольца, не переполняя текущую
+        start = 0
+        while start < len(X):
+            room = self.bucket_size - self._ring_rows[self._ring_pos]
+            if room == 0:
+                self._ring_pos = (self._ring_pos + 1) % self.live_buckets
+                self.live -= self._ring[self._ring_pos]
+                self._ring[self._ring_pos] = 0
+                self._ring_rows[self._ring_pos] = 0
+                continue
+            part = X[start:start + room]
+            counts = self._histogram(part)
+            self._ring[self._ring_pos] += counts
+            self._ring_rows[self._ring_pos] += len(part)
+            self.live += counts
+            start += len(part)
+        return self._check()
+
+    def _fit_reference(self, X: np.ndarray):
+        quantiles = np.linspace(0, 1, self.bins + 1)[1:-1]
+        self.edges = np.quantile(X, quantiles, axis=0).T.copy()
+        self.reference = self._histogram(X)
+        self._reference_buffer = None  # дальше нужны только границы и счётчики
+
+    def _histogram(self, X: np.ndarray) -> np.ndarray:
+        """Счётчики [dim, bins]: searchsorted по колонке, один bincount на весь батч"""
+        idx = np.empty(X.shape, dtype=np.int64)
+        for j in range(self.dim):
+            # side="right": у дискретных признаков повторяющиеся границы схлопываются в один бин
+            idx[:, j] = np.searchsorted(self.edges[j], X[:, j], side="right")
+        flat = (idx + self._offsets).ravel()
+        return np.bincount(flat, minlength=self.dim * self.bins).reshape(self.dim, self.bins)
+
+    def _check(self) -> List[Dict]:
+        live_count = self.live_count
+        if live_count < self.min_live:
+            return []
+        p = _proportions(self.reference)
+        q = _proportions(self.live)
+        self.psi = ((q - p) * np.log(q / p)).sum(axis=1)
+        self.ks = np.abs(np.cumsum(q - p, axis=1)).max(axis=1)
+
+        over = (self.psi > self.psi_threshold) | (self.ks > self.ks_threshold)
+        # Дрейф снимается только ниже hysteresis * порог, чтобы признак на границе не алертил каждый батч
+        calm = (self.psi < self.hysteresis * self.psi_threshold) & (self.ks < self.hysteresis * self.ks_threshold)
+        started = over & ~self._drifting
+        self._drifting = over | (self._drifting & ~calm)
+        now = time.time()
+        return [
+            {
+                "feature": self.feature_names[j],
+                "psi": round(float(self.psi[j]), 4),
+                "ks": round(float(self.ks[j]), 4),
+                "live_count": live_count,
+                "seen": self.seen,
+                "at": now,
+            }
+            for j in np.flatnonzero(started)
+        ]
+
+    def rebase(self):
+        """Живое окно становится эталоном (после переобучения модели на свежих данных)"""
+        if not self.ready or not self.live_count:
+            return
+        self.reference = self.live.copy()
+        self._drifting[:] = False
+
+    def state(self) -> Dict:
+        return {
+            "seen": self.seen,
+            "ready": self.ready,
+            "live_count": self.live_count,
+            "drifting": [self.feature_names[j] for j in np.flatnonzero(self._drifting)],
+            "psi": dict(zip(self.feature_names, np.round(self.psi, 4).tolist())),
+            "ks": dict(zip(self.feature_names, np.round(self.ks, 4).tolist())),
+        }
+
+
+def _proportions(counts: np.ndarray) -> np.ndarray:
+    totals = np.maximum(counts.sum(axis=1, keepdims=True), 1)
+    p = np.maximum(counts / totals, EPS)
+    return p / p.sum(axis=1, keepdims=True)
+
+
+def journal_batches(path: str, batch_size: int):
+    """Матрицы признаков [N, 21] по журналу (JSON-список или JSONL)"""
+    from feature_extractor import PaymentFeatureExtractor
+    from reconciliation import iter_journal
+    from services.models import PaymentPayload
+
+    batch = []
+    for record in iter_journal(path):
+        batch.append(PaymentFeatureExtractor.payload_to_vector(PaymentPayload.from_dict(record))['vector'])
+        if len(batch) >= batch_size:
+            yield np.stack(batch)
+            batch = []
+    if batch:
+        yield np.stack(batch)
+
+
+def synthetic_batches(snapshot: str, total: int, batch_size: int, drift_at: int, inflate: float, seed: Optional[int]):
+    """Батчи OfflinePayloadGenerator; после drift_at строк суммы умножаются на inflate"""
+    from offline_generator import OfflinePayloadGenerator, PAYLOAD_FEATURES
+    generator = OfflinePayloadGenerator.from_snapshot(snapshot, seed=seed)
+    amount = PAYLOAD_FEATURES.index('amount')
+    for start in range(0, total, batch_size):
+        X = generator.features(generator.sample(min(batch_size, total - start))).astype(np.float64)
+        drifted = max(0, start + len(X) - drift_at) if drift_at >= 0 else 0
+        if drifted:
+            X[-drifted:, amount] *= inflate
+        yield X
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Мониторинг дрейфа признаков платежей (PSI/KS)")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--journal", help="Журнал платежей (JSON-список или JSONL)")
+    source.add_argument("--synthetic", action="store_true", help="Поток OfflinePayloadGenerator")
+    parser.add_argument("--snapshot", default="dictionary_cache.json", help="Снапшот справочников для --synthetic")
+    parser.add_argument("-n", "--count", type=int, default=300_000, help="Размер синтетического потока")
+    parser.add_argument("--drift-at", type=int, default=-1, help="С какой строки синтетического потока начинается дрейф")
+    parser.add_argument("--inflate", type=float, default=1.5, help="Множитель суммы после --drift-at")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--bins", type=int, default=20)
+    parser.add_argument("--reference-size", type=int, default=50_000)
+    parser.add_argument("--live-window", type=int, default=20_000)
+    parser.add_argument("--psi-threshold", type=float, default=0.2)
+    parser.add_argument("--ks-threshold", type=float, default=0.1)
+    parser.add_argument("--alerts", help="Дописывать алерты в JSONL")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from offline_generator import PAYLOAD_FEATURES
+
+    args = parse_args(argv)
+    if args.journal:
+        batches = journal_batches(args.journal, args.batch_size)
+    else:
+        batches = synthetic_batches(args.snapshot, args.count, args.batch_size, args.drift_at, args.inflate, args.seed)
+
+    monitor = DriftMonitor(
+        PAYLOAD_FEATURES,
+        bins=args.bins,
+        reference_size=args.reference_size,
+        live_window=args.live_window,
+        psi_threshold=args.psi_threshold,
+        ks_threshold=args.ks_threshold
+    )
+    out = open(args.alerts, "a", encoding="utf-8") if args.alerts else None
+    started_at = time.perf_counter()
+    try:
+        for X in batches:
+            for alert in monitor.update(X):
+                print(f"DRIFT {alert['feature']}: PSI={alert['psi']:.3f} KS={alert['ks']:.3f} (строка {alert['seen']})")
+                if out:
+                    out.write(json.dumps(alert, ensure_ascii=False) + "\n")
+    finally:
+        if out:
+            out.close()
+    elapsed = time.perf_counter() - started_at
+
+    if not monitor.ready:
+        print(f"Эталон не набран: {monitor.seen} из {args.reference_size} строк")
+        return monitor
+    print(f"{monitor.seen} строк за {elapsed:.2f} с ({monitor.seen / max(elapsed, 1e-9):.0f} строк/с)")
+    state = monitor.state()
+    top = sorted(state["psi"].items(), key=lambda item: -item[1])[:5]
+    print("Топ PSI: " + ", ".join(f"{name}={value:.3f}" for name, value in top))
+    print(f"В дрейфе: {', '.join(state['drifting']) or 'нет'}")
+    return monitor
+
+
+if __name__ == "__main__":
+    main()
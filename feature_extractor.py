@@ -88,7 +88,58 @@ class PaymentFeatureExtractor:
             'feature_names': feature_names,
             'size': len(feature_names)
         }
-    
+
+    @staticmethod
+    def profile_to_vector(profile, payload: 'PaymentPayload'):
+        """
+        Поведенческие признаки платежа относительно профиля плательщика
+        (services.profile_store.IbanProfile ДО этого платежа; None — новый IBAN)
+        """
+        features = {}
+        amount = float(payload.amount)
+
+        if profile is None or profile.count == 0:
+            features.update({
+                'is_new_iban': 1.0,
+                'profile_count': 0.0,
+                'seconds_since_last': 0.0,
+                'amount_zscore': 0.0,
+                'amount_to_ewma': 0.0,
+                'distinct_kbk': 0.0,
+                'distinct_ugd': 0.0
+            })
+        else:
+            try:
+                at = datetime.fromisoformat(payload.timestamp).timestamp()
+            except (TypeError, ValueError):
+                at = datetime.now().timestamp()
+            std = profile.std_amount
+            zscore = (amount - profile.mean_amount) / std if std > 0 else 0.0
+            features.update({
+                'is_new_iban': 0.0,
+                'profile_count': float(np.log1p(profile.count)) / 10,
+                # Скорость: логарифм паузы с прошлого платежа (~1.0 при паузе в год)
+                'seconds_since_last': float(np.log1p(max(at - profile.last_seen, 0.0))) / 17,
+                'amount_zscore': float(np.clip(zscore, -10, 10)) / 10,
+                'amount_to_ewma': float(np.clip(np.log((amount + 1) / (profile.ewma_amount + 1)), -10, 10)) / 10,
+                'distinct_kbk': float(np.log1p(profile.distinct_kbk)) / 5,
+                'distinct_ugd': float(np.log1p(profile.distinct_ugd)) / 5
+            })
+
+        feature_names = [
+            'is_new_iban', 'profile_count', 'seconds_since_last',
+            'amount_zscore', 'amount_to_ewma', 'distinct_kbk', 'distinct_ugd'
+        ]
+
+        vector = np.array([features[name] for name in feature_names], dtype=np.float32)
+
+        return {
+            'vector': vector,
+            'features': features,
+            'feature_names': feature_names,
+            'size': len(feature_names)
+        }
+
     @staticmethod
     def transaction_to_vector(transaction: 'TransactionDetail'):
         """Улучшенная векторизация TransactionDetail с обработкой всех случаев"""
@@ -0,0 +1,390 @@
+# journal_pipeline.py
+"""
+Долгоживущий скоринг журнала отправленных платежей:
+
+    python journal_pipeline.py --base-url https://sme-bff.kz.infra --token $TOKEN \\
+        --journal successful_payloads.json --model models/payment_autoencoder_0.0801.pth \\
+        --alerts alerts.jsonl --checkpoint journal_pipeline.checkpoint.json
+
+Цикл: новые записи журнала после сохранённого смещения -> transactionId ->
+(id, type) через TransactionIndex -> детали транзакций пачкой с ограниченной
+параллельностью -> батчевый скоринг (reconciliation.score_pairs) -> алерты в JSONL.
+Смещение журнала и размер файла алертов сохраняются одним атомарным чекпоинтом
+после записи батча; при рестарте недописанный хвост алертов обрезается,
+и обработка продолжается ровно с сохранённой записи. Токен ведёт TokenManager
+(--refresh-token); ошибка запросов внутри шага не завершает процесс: хвост
+алертов откатывается к чекпоинту, и шаг повторяется с экспоненциальной паузой.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from latency import LatencyRecorder
+from reconciliation import details_fetcher, score_pairs, sent_key
+from services.transaction_index import TransactionIndex
+from services.transaction_service import TransactionService
+from token_manager import TokenManager
+
+
+class JournalTail:
+    """
+    Чтение новых записей журнала после offset.
+    JSONL — offset в байтах, читаются только завершённые строки.
+    JSON-список (successful_payloads.json переписывается целиком) — offset
+    это число уже обработанных записей; файл перечитывается, только если
+    изменились размер или mtime.
+    """
+
+    def __init__(self, path: str, offset: int = 0):
+        self.path = path
+        self.offset = offset
+        self.format = "jsonl" if path.endswith(".jsonl") else "json"
+        self._stamp = None
+        self._records: List[Dict] = []
+
+    def read(self, limit: int) -> List[Tuple[Dict, int]]:
+        """До limit пар (запись, offset после неё)"""
+        if not os.path.exists(self.path):
+            return []
+        if self.format == "jsonl":
+            return self._read_jsonl(limit)
+        return self._read_json(limit)
+
+    def backlog(self) -> int:
+        """Сколько записей (JSON) или байт (JSONL) ещё не прочитано"""
+        if not os.path.exists(self.path):
+            return 0
+        if self.format == "jsonl":
+            return max(0, os.path.getsize(self.path) - self.offset)
+        self._reload()
+        return max(0, len(self._records) - self.offset)
+
+    def _read_jsonl(self, limit: int) -> List[Tuple[Dict, int]]:
+        out = []
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            position = self.offset
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # строка ещё дописывается
+                position += len(line)
+                if line.strip():
+                    out.append((json.loads(line), position))
+                    if len(out) >= limit:
+                        break
+        return out
+
+    def _reload(self):
+        stat = os.stat(self.path)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        if stamp == self._stamp:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except json.JSONDecodeError:
+            return  # файл переписывается прямо сейчас — попробуем в следующий раз
+        self._records = records if isinstance(records, list) else [records]
+        self._stamp = stamp
+
+    def _read_json(self, limit: int) -> List[Tuple[Dict, int]]:
+        self._reload()
+        end = min(len(self._records), self.offset + limit)
+        return [(self._records[i], i + 1) for i in range(self.offset, end)]
+
+
+class Checkpoint:
+    """{"journal", "offset", "alerts_size", ...} в JSON; запись через os.replace"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.state: Dict = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def save(self, **state):
+        self.state.update(state)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+def journal_lag(record: Dict, now: Optional[datetime] = None) -> Optional[float]:
+    """Секунды от записи в журнал (timestamp, локальное время) до сейчас"""
+    timestamp = record.get("timestamp")
+    if not timestamp:
+        return None
+    try:
+        return ((now or datetime.now()) - datetime.fromisoformat(timestamp)).total_seconds()
+    except ValueError:
+        return None
+
+
+class JournalPipeline:
+    """
+    Один шаг step(): батч новых записей -> алерты -> чекпоинт.
+    Записи, которых ещё нет в истории на сервере, ждут до pending_timeout
+    секунд: батч обрывается на первой такой записи, смещение на неё не
+    двигается, и она перечитывается на следующем шаге. Старше — алерт missing.
+    """
+
+    def __init__(
+        self,
+        tail: JournalTail,
+        checkpoint: Checkpoint,
+        alerts_path: str,
+        service: TransactionService,
+        index: TransactionIndex,
+        fetch_details,
+        model=None,
+        batch_size: int = 256,
+        score_threshold: float = 0.5,
+        mse_threshold: float = 0.01,
+        pending_timeout: float = 300.0,
+        adaptive=None,
+        latency: Optional[LatencyRecorder] = None
+    ):
+        self.tail = tail
+        self.checkpoint = checkpoint
+        self.alerts_path = alerts_path
+        self.service = service
+        self.index = index
+        self.fetch_details = fetch_details
+        self.model = model
+        self.batch_size = batch_size
+        self.score_threshold = score_threshold
+        self.mse_threshold = mse_threshold
+        self.pending_timeout = pending_timeout
+        self.adaptive = adaptive
+        self.latency = latency or LatencyRecorder()
+        self.processed = 0
+        self.alerts = 0
+        self._alerts = self._open_alerts()
+
+    def _open_alerts(self):
+        # Всё, что дописано после последнего чекпоинта, относится к незакоммиченному батчу
+        committed = self.checkpoint.state.get("alerts_size")
+        if committed is not None and os.path.exists(self.alerts_path) and os.path.getsize(self.alerts_path) > committed:
+            with open(self.alerts_path, "r+b") as f:
+                f.truncate(committed)
+        return open(self.alerts_path, "a", encoding="utf-8")
+
+    def close(self):
+        self._alerts.close()
+
+    def rollback(self):
+        """После упавшего step(): отбросить алерты, дописанные после чекпоинта"""
+        self._alerts.close()
+        self._alerts = self._open_alerts()
+
+    def _resolve(self, records: List[Dict]) -> List[Optional[Tuple[str, str]]]:
+        keys = [self.index.get(sent_key(record)) for record in records]
+        if any(key is None for key in keys):
+            started_at = time.perf_counter()
+            self.index.sync(self.service)
+            self.latency.record("index_sync", time.perf_counter() - started_at)
+            keys = [key or self.index.get(sent_key(record)) for key, record in zip(keys, records)]
+        return keys
+
+    def step(self) -> int:
+        batch = self.tail.read(self.batch_size)
+        if not batch:
+            return 0
+        records = [record for record, _ in batch]
+        keys = self._resolve(records)
+
+        now = datetime.now()
+        pairs, rows, offset = [], [], self.tail.offset
+        for (record, position), key in zip(batch, keys):
+            if key is None:
+                lag = journal_lag(record, now)
+                if lag is None or lag < self.pending_timeout:
+                    break  # ждём, пока транзакция появится в истории
+                rows.append({"transactionId": sent_key(record), "reasons": ["missing"]})
+            else:
+                pairs.append((record, {"id": key[0], "transactionType": key[1]}))
+            offset = position
+        if offset == self.tail.offset:
+            return 0
+        by_id = {sent_key(record): record for record, _ in batch}
+
+        started_at = time.perf_counter()
+        if self.model is not None:
+            scored = list(score_pairs(pairs, self.model, self.fetch_details, self.batch_size))
+        else:
+            details = self.fetch_details([(r["id"], r["transactionType"]) for _, r in pairs]) if pairs else []
+            scored = [
+                {"transactionId": sent_key(s), "status": d.get("status")} if d else
+                {"transactionId": sent_key(s), "error": "Не удалось получить детали транзакции"}
+                for (s, _), d in zip(pairs, details)
+            ]
+        self.latency.record("fetch_and_score", time.perf_counter() - started_at)
+        rows.extend(self._alert(row) for row in scored)
+
+        written = 0
+        for row in rows:
+            if not row.get("reasons"):
+                continue
+            row["journal_timestamp"] = by_id[row["transactionId"]].get("timestamp")
+            row["scored_at"] = datetime.now().isoformat()
+            self._alerts.write(json.dumps(row, ensure_ascii=False) + "\n")
+            written += 1
+        self._alerts.flush()
+        os.fsync(self._alerts.fileno())
+
+        finished = datetime.now()
+        lags = [lag for lag in (journal_lag(by_id[row["transactionId"]], finished) for row in rows) if lag is not None]
+        for lag in lags:
+            self.latency.record("e2e_lag", max(lag, 0.0))
+
+        self.tail.offset = offset
+        self.processed += len(rows)
+        self.alerts += written
+        self.checkpoint.save(
+            journal=self.tail.path,
+            offset=offset,
+            alerts_size=self._alerts.tell(),
+            processed=self.checkpoint.state.get("processed", 0) + len(rows),
+            last_lag_s=max(lags) if lags else None,
+            updated_at=finished.isoformat()
+        )
+        return len(rows)
+
+    def _alert(self, row: Dict) -> Dict:
+        reasons = []
+        if "error" in row:
+            reasons.append("details_unavailable")
+        if row.get("status") not in (None, "COMPLETED"):
+            reasons.append(f"status_{row['status']}")
+        if row.get("anomaly_score") is not None and row["anomaly_score"] > self.score_threshold:
+            reasons.append("anomaly_score")
+        if row.get("reconstruction_mse") is not None and row["reconstruction_mse"] > self.mse_threshold:
+            reasons.append("reconstruction_mse")
+        if self.adaptive is not None and "anomaly_score" in row:
+            # Онлайн-норма скоров: ловит выбросы относительно недавнего потока, а не фиксированного порога
+            if self.adaptive.update([row["anomaly_score"], row["reconstruction_mse"]])[0]:
+                reasons.append("adaptive")
+        row["reasons"] = reasons
+        return row
+
+    def metrics(self) -> Dict:
+        lag = next((r for r in self.latency.report() if r["endpoint"] == "e2e_lag" and r["group"] == "all"), None)
+        return {
+            "offset": self.tail.offset,
+            "backlog": self.tail.backlog(),
+            "processed": self.processed,
+            "alerts": self.alerts,
+            "lag_p50_s": lag["p50"] / 1000 if lag else None,
+            "lag_p99_s": lag["p99"] / 1000 if lag else None,
+            "lag_max_s": lag["max"] / 1000 if lag else None,
+        }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Хвост журнала платежей -> скоринг -> алерты")
+    parser.add_argument("--base-url", required=True)
+    parser.add_argument("--token", default=os.environ.get("PAYMENT_API_TOKEN"), help="Access-токен (или PAYMENT_API_TOKEN)")
+    parser.add_argument("--refresh-token", default=os.environ.get("PAYMENT_API_REFRESH_TOKEN"))
+    parser.add_argument("--child-refresh", default=os.environ.get("PAYMENT_API_CHILD_REFRESH"))
+    parser.add_argument("--token-store", help="Общий файл токенов с другими процессами")
+    parser.add_argument("--journal", default="successful_payloads.json")
+    parser.add_argument("--checkpoint", default="journal_pipeline.checkpoint.json")
+    parser.add_argument("--alerts", default="alerts.jsonl")
+    parser.add_argument("--index", default="transaction_index.sqlite")
+    parser.add_argument("--model", help="Веса PaymentAutoencoder; без них — только статус транзакции")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--max-per-host", type=int, default=20, help="Одновременных запросов деталей")
+    parser.add_argument("--score-threshold", type=float, default=0.5)
+    parser.add_argument("--mse-threshold", type=float, default=0.01)
+    parser.add_argument("--pending-timeout", type=float, default=300.0, help="Сколько ждать появления транзакции в истории, с")
+    parser.add_argument("--adaptive", action="store_true", help="Дополнительно StreamingDetector по скорам")
+    parser.add_argument("--poll", type=float, default=2.0, help="Пауза, когда новых записей нет, с")
+    parser.add_argument("--max-backoff", type=float, default=60.0, help="Предел паузы между повторами после ошибки, с")
+    parser.add_argument("--once", action="store_true", help="Обработать накопившееся и выйти")
+    parser.add_argument("--metrics-every", type=float, default=30.0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.token:
+        raise SystemExit("Нужен --token или переменная окружения PAYMENT_API_TOKEN")
+    base_url = args.base_url.rstrip('/')
+    token_manager = TokenManager(
+        base_url,
+        args.token,
+        refresh_token=args.refresh_token,
+        child_refresh=args.child_refresh,
+        store_path=args.token_store
+    )
+    checkpoint = Checkpoint(args.checkpoint)
+    if checkpoint.state.get("journal") not in (None, args.journal):
+        raise SystemExit(f"Чекпоинт {args.checkpoint} относится к журналу {checkpoint.state['journal']}")
+
+    model = None
+    if args.model:
+        from model_testing import load_trained_model
+        model = load_trained_model(args.model)
+    adaptive = None
+    if args.adaptive:
+        from streaming_detector import StreamingDetector
+        adaptive = StreamingDetector(dim=2, window=2000)
+
+    pipeline = JournalPipeline(
+        JournalTail(args.journal, checkpoint.state.get("offset", 0)),
+        checkpoint,
+        args.alerts,
+        TransactionService(base_url, args.token, token_manager),
+        TransactionIndex(args.index),
+        details_fetcher(base_url, args.token, args.max_per_host, token_manager),
+        model=model,
+        batch_size=args.batch_size,
+        score_threshold=args.score_threshold,
+        mse_threshold=args.mse_threshold,
+        pending_timeout=args.pending_timeout,
+        adaptive=adaptive
+    )
+    last_metrics = time.time()
+    failures = 0
+    try:
+        while True:
+            try:
+                done = pipeline.step()
+            except Exception as e:
+                # 5xx, сеть, неудачный refresh: смещение не сдвинуто, батч перечитается
+                pipeline.rollback()
+                failures += 1
+                if args.once and failures >= 3:
+                    raise
+                delay = min(args.max_backoff, args.poll * 2 ** (failures - 1))
+                print(f"Ошибка шага ({failures} подряд), повтор через {delay:.1f} с: {e}", file=sys.stderr)
+                time.sleep(delay)
+                continue
+            failures = 0
+            if time.time() - last_metrics >= args.metrics_every:
+                print(json.dumps(pipeline.metrics(), ensure_ascii=False))
+                last_metrics = time.time()
+            if done:
+                continue
+            if args.once:
+                break
+            time.sleep(args.poll)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.close()
+        print(json.dumps(pipeline.metrics(), ensure_ascii=False, indent=2))
+    return pipeline
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# latency.py
+"""
+HDR-подобные гистограммы задержек для нагрузочного теста.
+Значения хранятся в микросекундах в лог-линейных корзинах: относительная
+погрешность < 1% на всём диапазоне, память — несколько сотен счётчиков.
+"""
+
+import csv
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+class LatencyHistogram:
+    """Лог-линейная гистограмма (как HdrHistogram с 2 значащими цифрами)"""
+
+    SUB_BUCKET_BITS = 8  # 256 под-корзин: 2 * 10^2 значащих значений
+    SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+    SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+
+    def __init__(self):
+        self.counts: Dict[int, int] = defaultdict(int)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @classmethod
+    def _index(cls, value: int) -> int:
+        if value < cls.SUB_BUCKET_COUNT:
+            return value
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS
+        return shift * cls.SUB_BUCKET_HALF + (value >> shift)
+
+    @classmethod
+    def _highest_equivalent(cls, index: int) -> int:
+        if index < cls.SUB_BUCKET_COUNT:
+            return index
+        shift = index // cls.SUB_BUCKET_HALF - 1
+        sub = index - shift * cls.SUB_BUCKET_HALF
+        return ((sub + 1) << shift) - 1
+
+    def record(self, value_us: int):
+        value_us = max(int(value_us), 0)
+        self.counts[self._index(value_us)] += 1
+        self.count += 1
+        self.total += value_us
+        self.min = value_us if self.min is None else min(self.min, value_us)
+        self.max = max(self.max, value_us)
+
+    def merge(self, other: "LatencyHistogram"):
+        for index, n in other.counts.items():
+            self.counts[index] += n
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p: float) -> int:
+        if not self.count:
+            return 0
+        target = max(1, int(self.count * p / 100.0 + 0.5))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._highest_equivalent(index), self.max)
+        return self.max
+
+    def summary_ms(self) -> Dict[str, float]:
+        row = {"count": self.count, "mean": self.total / self.count / 1000 if self.count else 0.0}
+        for p in PERCENTILES:
+            row[f"p{p:g}"] = self.percentile(p) / 1000
+        row["max"] = self.max / 1000
+        return row
+
+
+class LatencyRecorder:
+    """
+    Потокобезопасный сбор задержек по эндпоинтам:
+    общая гистограмма, разрез по номеру попытки, разрез по KBK
+    и временной ряд по секундам от старта.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, str, object], LatencyHistogram] = defaultdict(LatencyHistogram)
+        self._series: Dict[Tuple[int, str], LatencyHistogram] = defaultdict(LatencyHistogram)
+        self.started_at = time.time()
+
+    def record(self, endpoint: str, seconds: float, attempt: Optional[int] = None, kbk=None, at: Optional[float] = None):
+        value_us = int(seconds * 1_000_000)
+        second = int((at if at is not None else time.time()) - self.started_at)
+        with self._lock:
+            self._histograms[(endpoint, "all", None)].record(value_us)
+            if attempt is not None:
+                self._histograms[(endpoint, "attempt", attempt)].record(value_us)
+            if kbk is not None:
+                self._histograms[(endpoint, "kbk", kbk)].record(value_us)
+            self._series[(second, endpoint)].record(value_us)
+
+    def report(self) -> List[Dict]:
+        """Строки: endpoint, разрез, ключ, count, mean, p50/p90/p99/p99.9, max (мс)"""
+        with self._lock:
+            items = sorted(self._histograms.items(), key=lambda kv: (kv[0][0], kv[0][1] != "all", kv[0][1], str(kv[0][2])))
+            return [
+                {"endpoint": endpoint, "group": group, "key": key, **histogram.summary_ms()}
+                for (endpoint, group, key), histogram in items
+            ]
+
+    def timeseries(self) -> List[Dict]:
+        """По одной строке на (секунда от старта, endpoint)"""
+        with self._lock:
+            return [
+                {"second": second, "endpoint": endpoint, **histogram.summary_ms()}
+                for (second, endpoint), histogram in sorted(self._series.items())
+            ]
+
+    def write_report(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2, default=str)
+
+    def write_timeseries(self, path: str):
+        rows = self.timeseries()
+        if not rows:
+            return
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def format_table(self, group: str = "all") -> str:
+        lines = [f"{'endpoint':<16}{'key':>10}{'count':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'p99.9':>9}{'max':>9}  (мс)"]
+        for row in self.report():
+            if row["group"] != group:
+                continue
+            lines.append(
+                f"{row['endpoint']:<16}{str(row['key'] if row['key'] is not None else '-'):>10}{row['count']:>8}"
+                f"{row['p50']:>9.1f}{row['p90']:>9.1f}{row['p99']:>9.1f}{row['p99.9']:>9.1f}{row['max']:>9.1f}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,378 @@
+# latent_index.py
+"""
+kNN-скоринг в латентном пространстве PaymentAutoencoder: латенты [32]
+известных нормальных платежей лежат в ANN-индексе, расстояние нового
+платежа до k ближайших — второй скор аномальности рядом с anomaly_scorer.
+Редкие, но легитимные комбинации KBK/KNP, которые MLP плохо восстанавливает,
+находят себе соседей и не поднимаются в алерты.
+
+    python latent_index.py --mode build --model models/payment_autoencoder_0.0801.pth \\
+        --journal successful_payloads.json --index latent_index
+    python latent_index.py --mode score --model models/payment_autoencoder_0.0801.pth \\
+        --journal new_payloads.jsonl --index latent_index
+    python latent_index.py --mode bench -n 1000000
+
+Бэкенды: hnsw (hnswlib, если установлен), ivf (k-means + инвертированные
+списки на numpy) и flat (точный перебор, для небольших наборов).
+backend="auto": hnsw, а без hnswlib — flat до flat_limit векторов и ivf после.
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:  # опциональная зависимость
+    hnswlib = None
+
+
+def encode(model, X_payload: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+    """Латенты PaymentAutoencoder.encoder для матрицы признаков [N, 21]"""
+    import torch
+    parts = []
+    with torch.no_grad():
+        for start in range(0, len(X_payload), batch_size):
+            batch = torch.from_numpy(np.ascontiguousarray(X_payload[start:start + batch_size], dtype=np.float32))
+            parts.append(model.encoder(batch).numpy())
+    return np.concatenate(parts) if parts else np.zeros((0, model.encoder[-2].out_features), dtype=np.float32)
+
+
+def _sq_distances(queries: np.ndarray, points: np.ndarray, point_norms: np.ndarray) -> np.ndarray:
+    d = point_norms[None, :] - 2.0 * queries @ points.T + np.einsum("ij,ij->i", queries, queries)[:, None]
+    return np.maximum(d, 0.0)
+
+
+def _kmeans(X: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = X[rng.choice(len(X), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _sq_distances(X, centroids, np.einsum("ij,ij->i", centroids, centroids)).argmin(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, X)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Пустые кластеры пересеваем случайными точками
+        centroids[empty] = X[rng.choice(len(X), size=empty.sum(), replace=False)]
+    return centroids
+
+
+class LatentIndex:
+    """
+    Инкрементальный ANN-индекс латентов с персистентностью.
+    add() — вставка батча, query() — (квадраты расстояний, id) k ближайших,
+    score() — среднее евклидово расстояние до k соседей (чем больше, тем аномальнее).
+    """
+
+    def __init__(
+        self,
+        dim: int = 32,
+        backend: str = "auto",
+        flat_limit: int = 50_000,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        hnsw_m: int = 16,
+        hnsw_ef: int = 64,
+        max_elements: int = 1_000_000
+    ):
+        if backend == "hnsw" and hnswlib is None:
+            raise ImportError("Для backend='hnsw' нужен пакет hnswlib")
+        if backend == "auto":
+            backend = "hnsw" if hnswlib is not None else "flat"
+            self._auto_ivf = hnswlib is None
+        else:
+            self._auto_ivf = False
+        self.dim = dim
+        self.backend = backend
+        self.flat_limit = flat_limit
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_ef = hnsw_ef
+
+        self._vectors = np.zeros((1024, dim), dtype=np.float32)
+        self._norms = np.zeros(1024, dtype=np.float32)
+        self.count = 0
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: list = []
+        self._list_sizes: Optional[np.ndarray] = None
+        self._hnsw = None
+        if backend == "hnsw":
+            self._hnsw = hnswlib.Index(space="l2", dim=dim)
+            self._hnsw.init_index(max_elements=max_elements, M=hnsw_m, ef_construction=200, allow_replace_deleted=False)
+            self._hnsw.set_ef(hnsw_ef)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        ids = np.arange(self.count, self.count + len(vectors))
+        if self.backend == "hnsw":
+            if self.count + len(vectors) > self._hnsw.get_max_elements():
+                self._hnsw.resize_index(max(2 * self._hnsw.get_max_elements(), self.count + len(vectors)))
+            self._hnsw.add_items(vectors, ids)
+            self.count += len(vectors)
+            return ids
+
+        self._reserve(self.count + len(vectors))
+        self._vectors[self.count:self.count + len(vectors)] = vectors
+        self._norms[self.count:self.count + len(vectors)] = np.einsum("ij,ij->i", vectors, vectors)
+        self.count += len(vectors)
+        if self.backend == "ivf" and self._centroids is None:
+            self.train_ivf()
+        elif self.backend == "ivf":
+            self._assign(ids)
+        elif self._auto_ivf and self.count > self.flat_limit:
+            self.train_ivf()
+        return ids
+
+    def train_ivf(self, sample: int = 100_000, seed: int = 0):
+        """Переход на IVF: k-means по выборке, затем раскладка всех векторов по спискам"""
+        n = self.count
+        nlist = min(n, self.nlist or int(min(4096, max(16, 4 * np.sqrt(n)))))
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(n, size=min(sample, n), replace=False)
+        self._centroids = _kmeans(self._vectors[rows], nlist, seed=seed)
+        self._centroid_norms = np.einsum("ij,ij->i", self._centroids, self._centroids)
+        self._lists = [np.zeros(0, dtype=np.int64) for _ in range(nlist)]
+        self._list_vectors = [np.zeros((0, self.dim), dtype=np.float32) for _ in range(nlist)]
+        self._list_norms = [np.zeros(0, dtype=np.float32) for _ in range(nlist)]
+        self._list_sizes = np.zeros(nlist, dtype=np.int64)
+        self.backend = "ivf"
+        self._assign(np.arange(n))
+
+    def _reserve(self, size: int):
+        if size <= len(self._vectors):
+            return
+        capacity = max(size, 2 * len(self._vectors))
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:self.count] = self._vectors[:self.count]
+        norms = np.zeros(capacity, dtype=np.float32)
+        norms[:self.count] = self._norms[:self.count]
+        self._vectors, self._norms = vectors, norms
+
+    def _assign(self, ids: np.ndarray, chunk: int = 65536):
+        for start in range(0, len(ids), chunk):
+            part = ids[start:start + chunk]
+            assign = _sq_distances(self._vectors[part], self._centroids, self._centroid_norms).argmin(axis=1)
+            order = np.argsort(assign, kind="stable")
+            bounds = np.searchsorted(assign[order], np.arange(len(self._centroids) + 1))
+            for c in np.flatnonzero(np.diff(bounds)):
+                members = part[order[bounds[c]:bounds[c + 1]]]
+                size = self._list_sizes[c]
+                if size + len(members) > len(self._lists[c]):
+                    capacity = max(2 * len(self._lists[c]), size + len(members), 16)
+                    grown = np.zeros(capacity, dtype=np.int64)
+                    grown[:size] = self._lists[c][:size]
+                    self._lists[c] = grown
+                    grown_vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+                    grown_vectors[:size] = self._list_vectors[c][:size]
+                    self._list_vectors[c] = grown_vectors
+                    grown_norms = np.zeros(capacity, dtype=np.float32)
+                    grown_norms[:size] = self._list_norms[c][:size]
+                    self._list_norms[c] = grown_norms
+                self._lists[c][size:size + len(members)] = members
+                # Копия векторов рядом со списком: запрос читает nprobe непрерывных блоков,
+                # а не тысячи случайных строк общей матрицы
+                self._list_vectors[c][size:size + len(members)] = self._vectors[members]
+                self._list_norms[c][size:size + len(members)] = self._norms[members]
+                self._list_sizes[c] = size + len(members)
+
+    def query(self, vectors: np.ndarray, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        k = min(k, self.count)
+        if k == 0:
+            return np.zeros((len(vectors), 0), dtype=np.float32), np.zeros((len(vectors), 0), dtype=np.int64)
+        if self.backend == "hnsw":
+            ids, distances = self._hnsw.knn_query(vectors, k=k)
+            return distances, ids.astype(np.int64)
+        if self.backend == "flat":
+            return self._query_flat(vectors, k)
+        return self._query_ivf(vectors, k)
+
+    def _query_flat(self, vectors: np.ndarray, k: int, chunk: int = 256):
+        distances = np.zeros((len(vectors), k), dtype=np.float32)
+        ids = np.zeros((len(vectors), k), dtype=np.int64)
+        points, norms = self._vectors[:self.count], self._norms[:self.count]
+        for start in range(0, len(vectors), chunk):
+            d = _sq_distances(vectors[start:start + chunk], points, norms)
+            top = np.argpartition(d, k - 1, axis=1)[:, :k]
+            top_d = np.take_along_axis(d, top, axis=1)
+            order = np.argsort(top_d, axis=1)
+            distances[start:start + chunk] = np.take_along_axis(top_d, order, axis=1)
+            ids[start:start + chunk] = np.take_along_axis(top, order, axis=1)
+        return distances, ids
+
+    def _query_ivf(self, vectors: np.ndarray, k: int):
+        distances = np.full((len(vectors), k), np.inf, dtype=np.float32)
+        ids = np.full((len(vectors), k), -1, dtype=np.int64)
+        nprobe = min(self.nprobe, len(self._centroids))
+        probes = np.argpartition(
+            _sq_distances(vectors, self._centroids, self._centroid_norms), nprobe - 1, axis=1
+        )[:, :nprobe]
+        for i, query in enumerate(vectors):
+            candidates = np.concatenate([self._lists[c][:self._list_sizes[c]] for c in probes[i]])
+            if not len(candidates):
+                continue
+            points = np.concatenate([self._list_vectors[c][:self._list_sizes[c]] for c in probes[i]])
+            norms = np.concatenate([self._list_norms[c][:self._list_sizes[c]] for c in probes[i]])
+            d = norms - 2.0 * (points @ query) + query @ query
+            kk = min(k, len(candidates))
+            top = np.argpartition(d, kk - 1)[:kk]
+            top = top[np.argsort(d[top])]
+            distances[i, :kk] = d[top]
+            ids[i, :kk] = candidates[top]
+        return distances, ids
+
+    def score(self, vectors: np.ndarray, k: int = 10) -> np.ndarray:
+        """
+        Средняя евклидова дистанция до k ближайших. IVF может найти меньше k
+        кандидатов (пустые слоты — inf) — усредняются только найденные;
+        пустой индекс или ни одного кандидата — inf.
+        """
+        distances, _ = self.query(vectors, k)
+        finite = np.isfinite(distances)
+        # Квадрат дистанции через нормы может уйти чуть ниже нуля — sqrt дал бы NaN
+        roots = np.sqrt(np.maximum(np.where(finite, distances, 0.0), 0.0))
+        found = finite.sum(axis=1)
+        return np.where(found > 0, roots.sum(axis=1) / np.maximum(found, 1), np.inf)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        meta = {
+            "dim": self.dim, "backend": self.backend, "count": self.count, "flat_limit": self.flat_limit,
+            "nlist": self.nlist, "nprobe": self.nprobe, "hnsw_ef": self.hnsw_ef, "auto_ivf": self._auto_ivf,
+        }
+        if self.backend == "hnsw":
+            self._hnsw.save_index(os.path.join(path, "hnsw.bin"))
+            meta["max_elements"] = self._hnsw.get_max_elements()
+        else:
+            arrays = {"vectors": self._vectors[:self.count]}
+            if self.backend == "ivf":
+                arrays["centroids"] = self._centroids
+                arrays["list_sizes"] = self._list_sizes
+                arrays["list_members"] = np.concatenate([self._lists[c][:s] for c, s in enumerate(self._list_sizes)])
+            np.savez(os.path.join(path, "vectors.npz"), **arrays)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "LatentIndex":
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        backend = meta["backend"]
+        index = cls(
+            dim=meta["dim"], backend="hnsw" if backend == "hnsw" else "flat", flat_limit=meta["flat_limit"],
+            nlist=meta["nlist"], nprobe=meta["nprobe"], hnsw_ef=meta["hnsw_ef"]
+        )
+        index._auto_ivf = meta["auto_ivf"]
+        if backend == "hnsw":
+            index._hnsw.load_index(os.path.join(path, "hnsw.bin"), max_elements=meta["max_elements"])
+            index._hnsw.set_ef(meta["hnsw_ef"])
+            index.count = meta["count"]
+            return index
+
+        arrays = np.load(os.path.join(path, "vectors.npz"))
+        vectors = arrays["vectors"]
+        index._reserve(len(vectors))
+        index._vectors[:len(vectors)] = vectors
+        index._norms[:len(vectors)] = np.einsum("ij,ij->i", vectors, vectors)
+        index.count = len(vectors)
+        if backend == "ivf":
+            index.backend = "ivf"
+            index._centroids = arrays["centroids"]
+            index._centroid_norms = np.einsum("ij,ij->i", index._centroids, index._centroids)
+            index._list_sizes = arrays["list_sizes"].copy()
+            bounds = np.concatenate([[0], np.cumsum(index._list_sizes)])
+            members = arrays["list_members"]
+            index._lists = [members[bounds[c]:bounds[c + 1]].copy() for c in range(len(index._list_sizes))]
+            index._list_vectors = [index._vectors[members_c] for members_c in index._lists]
+            index._list_norms = [index._norms[members_c] for members_c in index._lists]
+        return index
+
+
+def _payload_matrix(records: Iterable[dict]) -> Tuple[list, np.ndarray]:
+    from feature_extractor import PaymentFeatureExtractor
+    from services.models import PaymentPayload
+    payloads = [PaymentPayload.from_dict(record) for record in records]
+    X = np.stack([PaymentFeatureExtractor.payload_to_vector(p)['vector'] for p in payloads]) if payloads else np.zeros((0, 21), dtype=np.float32)
+    return payloads, X
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ANN-индекс латентов PaymentAutoencoder и kNN-скоринг")
+    parser.add_argument("--mode", choices=["build", "score", "bench"], default="build")
+    parser.add_argument("--model", default="models/payment_autoencoder_0.0801.pth")
+    parser.add_argument("--journal", default="successful_payloads.json", help="Нормальные платежи (build) или платежи для оценки (score)")
+    parser.add_argument("--index", default="latent_index", help="Каталог индекса")
+    parser.add_argument("--backend", choices=["auto", "hnsw", "ivf", "flat"], default="auto")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("-n", "--count", type=int, default=1_000_000, help="Размер синтетического индекса для bench")
+    parser.add_argument("--output", default="latent_scores.jsonl")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.mode == "bench":
+        rng = np.random.default_rng(0)
+        # Кластеризованные латенты: как у реальных платежей, сгруппированных по KBK/KNP
+        centers = rng.normal(size=(2000, 32)).astype(np.float32) * 4
+        vectors = centers[rng.integers(0, len(centers), size=args.count)] + rng.normal(size=(args.count, 32)).astype(np.float32)
+        index = LatentIndex(backend=args.backend)
+        started_at = time.perf_counter()
+        for start in range(0, args.count, 100_000):
+            index.add(vectors[start:start + 100_000])
+        print(f"build {args.count} -> {index.backend}: {time.perf_counter() - started_at:.1f} с")
+
+        queries = vectors[rng.choice(args.count, size=1000)] + rng.normal(size=(1000, 32)).astype(np.float32) * 0.1
+        for query in queries[:100]:
+            index.query(query, args.k)  # прогрев
+        latencies = []
+        for query in queries:
+            started_at = time.perf_counter()
+            index.query(query, args.k)
+            latencies.append(time.perf_counter() - started_at)
+        _, found = index.query(queries[:100], args.k)
+        exact = LatentIndex(backend="flat")
+        exact.add(vectors)
+        _, truth = exact.query(queries[:100], args.k)
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(found, truth)])
+        print(f"query p50={np.percentile(latencies, 50) * 1000:.3f} мс p99={np.percentile(latencies, 99) * 1000:.3f} мс recall@{args.k}={recall:.3f}")
+        return index
+
+    from model_testing import load_trained_model
+    from reconciliation import iter_journal
+    model = load_trained_model(args.model)
+    payloads, X = _payload_matrix(iter_journal(args.journal))
+    latents = encode(model, X)
+
+    if args.mode == "build":
+        index = LatentIndex.load(args.index) if os.path.exists(os.path.join(args.index, "meta.json")) else LatentIndex(dim=latents.shape[1], backend=args.backend)
+        index.add(latents)
+        index.save(args.index)
+        print(f"Индекс {args.index}: {len(index)} векторов ({index.backend})")
+        return index
+
+    index = LatentIndex.load(args.index)
+    knn = index.score(latents, args.k)
+    from model_testing import predict_vectors
+    _, scores = predict_vectors(X, model)
+    with open(args.output, "w", encoding="utf-8") as out:
+        for payload, distance, score in zip(payloads, knn, scores):
+            out.write(json.dumps({
+                "transactionId": payload.transaction_id,
+                "anomaly_score": float(score),
+                "knn_distance": float(distance),
+            }, ensure_ascii=False) + "\n")
+    print(f"{len(payloads)} платежей -> {args.output}")
+    return index
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,664 @@
+# load_test.py
+"""
+Headless нагрузочный тест платежей в бюджет (то же, что "Итерационное тестирование"
+в pages/taxes_auto.py, но без Streamlit):
+
+    python load_test.py --base-url https://sme-bff.kz.infra --token $TOKEN \\
+        --iterations 10000 --concurrency 16 --kbk 105276 --output results.jsonl
+
+Поля, переданные аргументами (--kbk, --knp, --amount, ...), фиксируются,
+остальные выбираются случайно для каждой итерации.
+
+Open-loop с целевым RPS (задержка "iteration" считается от планового времени
+отправки, "commission"/"payment" — от фактической):
+
+    python load_test.py --mode open --arrival poisson --rps 200 --duration 60 ...
+
+Офлайн-проверка самого генератора — против заглушки demo_testing/payment_stub_server.py.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+import urllib3
+from dateutil.relativedelta import relativedelta
+
+from data_generating import PaymentPayloadGenerator
+from latency import LatencyRecorder
+from payload_pipeline import PayloadPipeline, scenario_payloads
+from services.commission_batcher import CommissionBatcher
+from services.payment_service import PaymentService
+from token_manager import TokenManager
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+_journal_lock = threading.Lock()
+_local = threading.local()
+
+
+def save_successful_payload(payload, filename="successful_payloads.json"):
+    """
+    Загружает существующие данные из файла (ожидается список записей).
+    Если данные не являются списком, оборачивает их в список.
+    Затем добавляет новую запись с временной меткой и сохраняет обновлённый список обратно.
+    Потокобезопасна: запись идёт под общей блокировкой.
+    """
+    with _journal_lock:
+        try:
+            with open(filename, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # Если данные не являются списком, оборачиваем их в список
+            if not isinstance(data, list):
+                data = [data]
+        except Exception:
+            data = []
+
+        record = {
+            "timestamp": datetime.now().isoformat(),
+            "payload": payload
+        }
+        data.append(record)
+
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def _session() -> requests.Session:
+    """requests.Session на поток: keep-alive вместо нового TLS-соединения на каждый запрос"""
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+        _local.session.verify = False
+    return _local.session
+
+
+def build_commission_payload(payload: Dict) -> List[Dict]:
+    return [{
+        "transactionId": payload["transactionId"],
+        "transactionAmount": payload["amount"],
+        "currency": "KZT",
+        "urgent": False,
+        "futureValueDate": False
+    }]
+
+
+def commission_sender(
+    base_url: str,
+    token_manager: TokenManager,
+    latency: Optional[LatencyRecorder] = None
+) -> Callable[[List[Dict]], List[Dict]]:
+    """
+    send(items) для CommissionBatcher: один PUT multi-calculate на весь батч,
+    при 401 — refresh и один повтор. Время вызова пишется как "commission_batch".
+    """
+    def send(items: List[Dict]) -> List[Dict]:
+        for retry in (True, False):
+            token = token_manager.get_token()
+            sent_at = time.perf_counter()
+            resp = _session().put(
+                f"{base_url}{PaymentService.COMMISSION_ENDPOINT}",
+                headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
+                json=items
+            )
+            if latency is not None:
+                latency.record("commission_batch", time.perf_counter() - sent_at)
+            if resp.status_code == 401 and retry:
+                token_manager.refresh(stale_token=token)
+                continue
+            resp.raise_for_status()
+            return resp.json()
+    return send
+
+
+def send_iteration(
+    base_url: str,
+    iter_payload: Dict,
+    token_manager: TokenManager,
+    max_attempts: int = 5,
+    retry_delay: float = 0.5,
+    journal: Optional[str] = "successful_payloads.json",
+    latency: Optional[LatencyRecorder] = None,
+    intended_at: Optional[float] = None,
+    commission_batcher: Optional[CommissionBatcher] = None,
+    commission_payload: Optional[List[Dict]] = None
+) -> Dict:
+    """
+    Комиссия + платёж с повторами: на каждую попытку новый transactionId,
+    комиссия пересчитывается, между попытками пауза retry_delay.
+    Не трогает Streamlit, поэтому безопасна для пула потоков.
+    latency — куда писать время каждого вызова (по попытке и KBK).
+    intended_at (perf_counter) — плановое время отправки в open-loop режиме:
+    от него считается задержка всей итерации ("iteration", поправка на
+    coordinated omission). "commission" и "payment" всегда меряются от
+    фактической отправки запроса, чтобы в одном ряду не смешивать
+    скорректированные и нескорректированные значения.
+    commission_batcher — считать комиссию общим батчем вместо отдельного PUT.
+    commission_payload — заранее собранный (PayloadPipeline); первая попытка
+    идёт с уже выданным transactionId, новые генерируются только для повторов.
+    """
+    session = _session()
+    kbk_code = iter_payload["kbk"]["code"]
+    if commission_payload is None:
+        commission_payload = build_commission_payload(iter_payload)
+
+    attempt = 0
+    commission_status = None
+    commission_text = ""
+    payment_status = None
+    payment_text = ""
+    while attempt < max_attempts:
+        if attempt or not iter_payload.get("transactionId"):
+            iter_transaction_id = f"APP_INDNTRTAX_{uuid.uuid4()}"
+            commission_payload[0]["transactionId"] = iter_transaction_id
+            iter_payload["transactionId"] = iter_transaction_id
+        token = token_manager.get_token()
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+        # Пересчитываем комиссию
+        sent_at = time.perf_counter()
+        try:
+            if commission_batcher is not None:
+                commission = commission_batcher.calculate(commission_payload[0])
+                _record(latency, "commission", sent_at, attempt + 1, kbk_code)
+                commission_status = 200
+                commission_text = json.dumps(commission, ensure_ascii=False)
+            else:
+                commission_resp = session.put(f"{base_url}{PaymentService.COMMISSION_ENDPOINT}", headers=headers, json=commission_payload)
+                _record(latency, "commission", sent_at, attempt + 1, kbk_code)
+                commission_resp.raise_for_status()
+                commission_status = commission_resp.status_code
+                commission_text = commission_resp.text
+        except Exception as e:
+            commission_status = None
+            commission_text = str(e)
+
+        # Попытка отправки платежа
+        sent_at = time.perf_counter()
+        try:
+            payment_resp = session.post(f"{base_url}{PaymentService.PAYMENT_ENDPOINT}", headers=headers, json=iter_payload)
+            _record(latency, "payment", sent_at, attempt + 1, kbk_code)
+            payment_resp.raise_for_status()
+            payment_status = payment_resp.status_code
+            payment_text = payment_resp.text
+            if journal:
+                save_successful_payload(iter_payload, filename=journal)
+            # Если запрос прошёл успешно, выходим из цикла
+            break
+        except requests.exceptions.RequestException as e:
+            if e.response is not None and e.response.status_code == 401:
+                token_manager.refresh(stale_token=token)
+            attempt += 1
+            if attempt < max_attempts:
+                time.sleep(retry_delay)  # небольшая задержка перед повторной попыткой
+            else:
+                payment_status = None
+                if e.response is not None:
+                    payment_text = f"Попытка {attempt}/{max_attempts} — Exception: {e}\nServer Response:\n{e.response.text}"
+                else:
+                    payment_text = f"Попытка {attempt}/{max_attempts} — Exception: {e}"
+                break
+
+    if latency is not None and intended_at is not None:
+        latency.record("iteration", time.perf_counter() - intended_at, kbk=kbk_code)
+
+    return {
+        "Attempts": attempt,
+        "Commission Status": commission_status,
+        "Payment Status": payment_status,
+        "Commission Response": commission_text,
+        "Payment Response": payment_text,
+        "Payload": iter_payload,
+    }
+
+
+def _record(latency: Optional[LatencyRecorder], endpoint: str, sent_at: float, attempt: int, kbk_code):
+    if latency is not None:
+        latency.record(endpoint, time.perf_counter() - sent_at, attempt=attempt, kbk=kbk_code)
+
+
+def build_payload(
+    generator: PaymentPayloadGenerator,
+    iban: Optional[str] = None,
+    kbk_code=None,
+    knp_code: Optional[str] = None,
+    amount: Optional[float] = None,
+    purpose: Optional[str] = None,
+    period: Optional[str] = None,
+    ugd_code: Optional[str] = None
+) -> Dict:
+    """Payload одной итерации: заданные поля фиксированы, остальные случайные"""
+    op_type = generator.selected_operation_type
+    if kbk_code is not None:
+        kbk = generator.dictionary.kbk_by_code(op_type).get(kbk_code)
+        if not kbk:
+            raise ValueError(f"KBK с кодом {kbk_code} не найден")
+    else:
+        kbk = random.choice(generator.kbk_list)
+
+    if knp_code is not None:
+        knp = generator.dictionary.knp_by_kbk(op_type).get((kbk["code"], knp_code))
+        if not knp:
+            raise ValueError(f"KNP с кодом {knp_code} не найден для KBK {kbk['code']}")
+    else:
+        knp = random.choice(kbk["knpList"])
+
+    return generator.generate_payload(
+        iban=iban or random.choice(generator.valid_accounts)["iban"],
+        kbk_code=kbk["code"],
+        knp_code=knp["knpCode"],
+        amount=amount if amount is not None else round(random.uniform(100.0, 10000.0), 2),
+        purpose=purpose if purpose is not None else f"{knp['knpName']}_{random.randint(1000, 9999)}",
+        period=period or (date.today() - relativedelta(days=random.randint(1, 365))).isoformat(),
+        ugd_code=ugd_code
+    )
+
+
+class ResultsBuffer:
+    """
+    Колоночный буфер результатов: append — это по одному list.append на колонку,
+    без пересборки DataFrame. Счётчики сводки обновляются на лету.
+    """
+
+    STATUS_COLUMNS = ("Commission Status", "Payment Status")
+
+    def __init__(self):
+        self.columns: Dict[str, List] = {}
+        self.count = 0
+        self.ok = {name: 0 for name in self.STATUS_COLUMNS}
+
+    def append(self, row: Dict):
+        for name, value in row.items():
+            column = self.columns.get(name)
+            if column is None:
+                # Колонка появилась позже первых строк — добиваем None
+                column = self.columns[name] = [None] * self.count
+            column.append(value)
+        self.count += 1
+        for name in self.columns:
+            if len(self.columns[name]) < self.count:
+                self.columns[name].append(None)
+        for name in self.STATUS_COLUMNS:
+            status = row.get(name)
+            if status is not None and 200 <= int(status) < 300:
+                self.ok[name] += 1
+
+    def tail(self, n: int) -> Dict[str, List]:
+        """Последние n строк в колоночном виде (годится для pd.DataFrame)"""
+        return {name: column[-n:] for name, column in self.columns.items()}
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "Итераций": self.count,
+            "Комиссия OK": self.ok["Commission Status"],
+            "Платёж OK": self.ok["Payment Status"],
+            "Платёж с ошибкой": self.count - self.ok["Payment Status"],
+        }
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def result_row(payload: Dict, sent: Dict) -> Dict:
+    """Строка результатов в формате таблицы taxes_auto"""
+    return {
+        "Kbk": payload["kbk"]["code"],
+        "Knp": payload["knp"],
+        "Amount": payload["amount"],
+        "Purpose": payload["purpose"],
+        "Period": payload.get("period") or payload.get("quarter"),
+        **sent,
+    }
+
+
+def _unpack(item) -> Tuple[Dict, Optional[List[Dict]]]:
+    """make_payload может вернуть payload или готовую пару (payload, commission_payload)"""
+    if isinstance(item, tuple):
+        return item
+    return item, None
+
+
+def run_load_test(
+    make_payload: Callable[[], Dict],
+    base_url: str,
+    token_manager: TokenManager,
+    iterations: int,
+    concurrency: int = 1,
+    max_attempts: int = 5,
+    retry_delay: float = 0.5,
+    journal: Optional[str] = None,
+    on_result: Optional[Callable[[Dict], None]] = None,
+    latency: Optional[LatencyRecorder] = None,
+    commission_batcher: Optional[CommissionBatcher] = None
+) -> Dict:
+    """
+    Закрытый цикл: в работе не больше concurrency итераций одновременно.
+    on_result вызывается в вызывающем потоке для каждой завершённой итерации.
+    make_payload может быть PayloadPipeline: тогда здесь только забирается готовая пара.
+    """
+    started_at = time.perf_counter()
+    submitted = 0
+    completed = 0
+    succeeded = 0
+    in_flight = {}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while submitted < iterations or in_flight:
+            while submitted < iterations and len(in_flight) < concurrency:
+                payload, commission_payload = _unpack(make_payload())
+                future = executor.submit(
+                    send_iteration, base_url, payload, token_manager, max_attempts, retry_delay, journal, latency,
+                    commission_batcher=commission_batcher, commission_payload=commission_payload
+                )
+                in_flight[future] = payload
+                submitted += 1
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                payload = in_flight.pop(future)
+                row = result_row(payload, future.result())
+                completed += 1
+                succeeded += row["Payment Status"] is not None
+                if on_result:
+                    on_result(row)
+
+    elapsed = time.perf_counter() - started_at
+    return {
+        "iterations": completed,
+        "succeeded": succeeded,
+        "failed": completed - succeeded,
+        "elapsed_s": elapsed,
+        "throughput_rps": completed / elapsed if elapsed else 0.0,
+    }
+
+
+def arrival_times(
+    kind: str,
+    rps: float,
+    count: Optional[int] = None,
+    duration: Optional[float] = None,
+    rps_end: Optional[float] = None,
+    seed: Optional[int] = None
+) -> Iterator[float]:
+    """
+    Плановые моменты отправки (секунды от старта), не зависящие от ответов:
+    constant — ровно rps в секунду; ramp — линейно от rps до rps_end за duration;
+    poisson — пуассоновский поток со средней интенсивностью rps.
+    Останавливается по count или duration (что наступит раньше).
+    """
+    if count is None and duration is None:
+        raise ValueError("Нужно задать count или duration")
+    if kind == "ramp" and (duration is None or rps_end is None):
+        raise ValueError("Для ramp нужны duration и rps_end")
+    if rps <= 0:
+        raise ValueError("rps должен быть больше нуля")
+    if kind == "ramp" and rps_end < 0:
+        raise ValueError("rps_end не может быть отрицательным")
+
+    rng = random.Random(seed)
+    slope = (rps_end - rps) / duration if kind == "ramp" else 0.0
+    i = 0
+    t = 0.0
+    while count is None or i < count:
+        if kind == "constant":
+            t = i / rps
+        elif kind == "ramp":
+            # N(t) = rps*t + slope*t^2/2; t_i — корень N(t) = i
+            discriminant = rps * rps + 2 * slope * i
+            if discriminant < 0:
+                return  # спад до rps_end: больше i отправок рампа не даёт
+            t = i / rps if slope == 0 else (math.sqrt(discriminant) - rps) / slope
+        elif kind == "poisson":
+            t += rng.expovariate(rps) if i else 0.0
+        else:
+            raise ValueError(f"Неизвестный тип расписания: {kind}")
+        if duration is not None and t >= duration:
+            return
+        yield t
+        i += 1
+
+
+def run_open_loop(
+    make_payload: Callable[[], Dict],
+    base_url: str,
+    token_manager: TokenManager,
+    schedule: Iterable[float],
+    max_workers: int = 64,
+    max_attempts: int = 5,
+    retry_delay: float = 0.5,
+    journal: Optional[str] = None,
+    on_result: Optional[Callable[[Dict], None]] = None,
+    latency: Optional[LatencyRecorder] = None,
+    commission_batcher: Optional[CommissionBatcher] = None
+) -> Dict:
+    """
+    Открытый цикл: итерации запускаются по расписанию schedule независимо от того,
+    ответил ли backend на предыдущие. Если все max_workers заняты, итерация ждёт
+    в очереди пула, и это ожидание попадает в задержку ("iteration" в latency).
+    on_result вызывается из потоков пула под общей блокировкой.
+    """
+    latency = latency if latency is not None else LatencyRecorder()
+    result_lock = threading.Lock()
+    stats = {"completed": 0, "succeeded": 0, "errors": 0, "first_error": None}
+
+    def on_done(future):
+        # Исключение в задаче пула иначе потеряется молча
+        error = future.exception()
+        if error is not None:
+            with result_lock:
+                stats["errors"] += 1
+                stats["first_error"] = stats["first_error"] or repr(error)
+
+    def task(intended_at: float):
+        payload, commission_payload = _unpack(make_payload())
+        row = result_row(payload, send_iteration(
+            base_url, payload, token_manager, max_attempts, retry_delay, journal, latency, intended_at,
+            commission_batcher, commission_payload
+        ))
+        with result_lock:
+            stats["completed"] += 1
+            stats["succeeded"] += row["Payment Status"] is not None
+            if on_result:
+                on_result(row)
+
+    scheduled = 0
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for offset in schedule:
+            intended_at = started_at + offset
+            delay = intended_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Диспетчер не успевает за расписанием — это видно в отчёте
+                latency.record("dispatch_lag", -delay)
+            executor.submit(task, intended_at).add_done_callback(on_done)
+            scheduled += 1
+        dispatched_for = time.perf_counter() - started_at
+
+    elapsed = time.perf_counter() - started_at
+    return {
+        "iterations": stats["completed"],
+        "succeeded": stats["succeeded"],
+        "failed": stats["completed"] - stats["succeeded"],
+        "elapsed_s": elapsed,
+        "offered_rps": scheduled / dispatched_for if dispatched_for else 0.0,
+        "throughput_rps": stats["completed"] / elapsed if elapsed else 0.0,
+        "errors": stats["errors"],
+        "first_error": stats["first_error"],
+    }
+
+
+def _positive_float(value: str) -> float:
+    number = float(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError("должно быть больше нуля")
+    return number
+
+
+def _non_negative_float(value: str) -> float:
+    number = float(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError("не может быть отрицательным")
+    return number
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест платежей в бюджет")
+    parser.add_argument("--base-url", default="https://sme-bff.kz.infra")
+    parser.add_argument("--token", default=os.environ.get("PAYMENT_API_TOKEN"), help="Access-токен (или PAYMENT_API_TOKEN)")
+    parser.add_argument("--refresh-token", default=os.environ.get("PAYMENT_API_REFRESH_TOKEN"))
+    parser.add_argument("--child-refresh", default=os.environ.get("PAYMENT_API_CHILD_REFRESH"))
+    parser.add_argument("--token-store", help="Общий файл токенов для нескольких процессов")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=1, help="Параллельность закрытого цикла")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed",
+                        help="closed — следующая итерация после ответа; open — по расписанию с целевым RPS")
+    parser.add_argument("--arrival", choices=["constant", "ramp", "poisson"], default="constant")
+    parser.add_argument("--rps", type=_positive_float, default=10.0, help="Целевой RPS (open)")
+    parser.add_argument("--rps-end", type=_non_negative_float, help="Конечный RPS для ramp")
+    parser.add_argument("--duration", type=float, help="Длительность open-loop прогона, с")
+    parser.add_argument("--max-workers", type=int, default=64, help="Потоков отправки в open-loop")
+    parser.add_argument("--commission-batch", type=int, default=1,
+                        help="Считать комиссию батчами до N транзакций (1 — без батчинга)")
+    parser.add_argument("--commission-batch-ms", type=float, default=20.0,
+                        help="Максимальное ожидание заполнения батча комиссии, мс")
+    parser.add_argument("--prefetch", type=int, default=0,
+                        help="Готовить payload'ы заранее в очередь такого размера (0 — прямо перед отправкой)")
+    parser.add_argument("--producers", type=int, default=1, help="Потоков-генераторов для --prefetch")
+    parser.add_argument("--scenario", help="Воспроизводить payload'ы из JSONL (например, прошлый --output)")
+    parser.add_argument("--max-attempts", type=int, default=5)
+    parser.add_argument("--retry-delay", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, help="Seed для случайных полей")
+    # Фиксированные поля; если не заданы — случайные
+    parser.add_argument("--iban")
+    parser.add_argument("--kbk", type=int)
+    parser.add_argument("--knp")
+    parser.add_argument("--amount", type=float)
+    parser.add_argument("--purpose")
+    parser.add_argument("--period", help="YYYY-MM-DD")
+    parser.add_argument("--ugd", help="Код УГД")
+    parser.add_argument("--output", default="load_test_results.jsonl", help="Куда писать результаты (JSONL)")
+    parser.add_argument("--journal", help="Дописывать успешные payload'ы в этот JSON (как taxes_auto)")
+    parser.add_argument("--latency-report", default="load_test_latency.json", help="Перцентили задержек по эндпоинтам/попыткам/KBK")
+    parser.add_argument("--latency-timeseries", default="load_test_latency.csv", help="Задержки по секундам (CSV)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.token:
+        raise SystemExit("Нужен --token или переменная окружения PAYMENT_API_TOKEN")
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    token_manager = TokenManager(
+        args.base_url,
+        args.token,
+        refresh_token=args.refresh_token,
+        child_refresh=args.child_refresh,
+        store_path=args.token_store
+    )
+    pipeline = None
+    if args.scenario:
+        # Replay не требует справочников — генератор не создаём
+        pipeline = PayloadPipeline(
+            scenario_payloads(args.scenario), build_commission_payload, capacity=args.prefetch or 256
+        )
+    else:
+        generator = PaymentPayloadGenerator(args.base_url, token_manager.get_token(), token_manager=token_manager)
+
+        def generate():
+            return build_payload(
+                generator,
+                iban=args.iban,
+                kbk_code=args.kbk,
+                knp_code=args.knp,
+                amount=args.amount,
+                purpose=args.purpose,
+                period=args.period,
+                ugd_code=args.ugd
+            )
+
+        if args.prefetch:
+            pipeline = PayloadPipeline(
+                generate, build_commission_payload, capacity=args.prefetch, producers=args.producers
+            )
+    make_payload = pipeline if pipeline is not None else generate
+
+    latency = LatencyRecorder()
+    commission_batcher = None
+    if args.commission_batch > 1:
+        commission_batcher = CommissionBatcher(
+            commission_sender(args.base_url.rstrip('/'), token_manager, latency),
+            max_batch=args.commission_batch,
+            max_delay_ms=args.commission_batch_ms
+        )
+    with open(args.output, "w", encoding="utf-8") as out:
+        def on_result(row):
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+        if args.mode == "open":
+            schedule = arrival_times(
+                args.arrival,
+                args.rps,
+                count=None if args.duration else args.iterations,
+                duration=args.duration,
+                rps_end=args.rps_end,
+                seed=args.seed
+            )
+            summary = run_open_loop(
+                make_payload,
+                args.base_url.rstrip('/'),
+                token_manager,
+                schedule,
+                max_workers=args.max_workers,
+                max_attempts=args.max_attempts,
+                retry_delay=args.retry_delay,
+                journal=args.journal,
+                on_result=on_result,
+                latency=latency,
+                commission_batcher=commission_batcher
+            )
+        else:
+            summary = run_load_test(
+                make_payload,
+                args.base_url.rstrip('/'),
+                token_manager,
+                iterations=args.iterations,
+                concurrency=args.concurrency,
+                max_attempts=args.max_attempts,
+                retry_delay=args.retry_delay,
+                journal=args.journal,
+                on_result=on_result,
+                latency=latency,
+                commission_batcher=commission_batcher
+            )
+
+    if pipeline is not None:
+        pipeline.close()
+        summary["payloads_starved"] = pipeline.starved
+    if commission_batcher is not None:
+        commission_batcher.close()
+        summary["commission_batches"] = commission_batcher.batches
+        summary["commission_mean_batch"] = commission_batcher.mean_batch_size
+    latency.write_report(args.latency_report)
+    latency.write_timeseries(args.latency_timeseries)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    print(latency.format_table())
+    print(latency.format_table("attempt"))
+    return summary
+
+
+if __name__ == "__main__":
+    main()
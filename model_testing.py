@@ -1,4 +1,5 @@
 import numpy as np
+from typing import List
 import torch
 import torch.nn as nn
 
@@ -47,6 +48,31 @@ def predict(payload_data: dict, model: PaymentAutoencoder):
     
     return decoded, anomaly_score
 
+def predict_batch(payloads: List[dict], model: PaymentAutoencoder, batch_size: int = 1024):
+    """
+    То же, что predict, но для списка payload'ов: векторизация по одному,
+    прогон модели батчами по batch_size. Возвращает:
+      - decoded [N, 37]
+      - anomaly_scores [N]
+    """
+    if not payloads:
+        return np.zeros((0, 37), dtype=np.float32), np.zeros(0, dtype=np.float32)
+    vectors = np.stack([
+        PaymentFeatureExtractor.payload_to_vector(PaymentPayload.from_dict(p))['vector'] for p in payloads
+    ])
+    return predict_vectors(vectors, model, batch_size)
+
+def predict_vectors(vectors: np.ndarray, model: PaymentAutoencoder, batch_size: int = 1024):
+    """Прогон готовой матрицы признаков [N, 21] через модель батчами"""
+    decoded_parts, score_parts = [], []
+    with torch.no_grad():
+        for start in range(0, len(vectors), batch_size):
+            batch = torch.from_numpy(np.ascontiguousarray(vectors[start:start + batch_size], dtype=np.float32))
+            decoded, anomaly_score = model(batch)
+            decoded_parts.append(decoded.numpy())
+            score_parts.append(anomaly_score.squeeze(1).numpy())
+    return np.concatenate(decoded_parts), np.concatenate(score_parts)
+
 if __name__ == "__main__":
     # 1) Грузим модель
     trained_model = load_trained_model("models/payment_autoencoder_0.0801.pth")
@@ -0,0 +1,288 @@
+# nn_training.py
+"""
+Автоэнкодер payload'ов для pages/nn_page.py: векторизация, синтетические
+"идеальные" данные, обучение и фоновые задачи обучения (TrainingJobManager).
+"""
+
+import datetime
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from dateutil.relativedelta import relativedelta
+from torch.utils.data import DataLoader, TensorDataset
+
+# Размерность входного вектора (например, 10 признаков)
+INPUT_DIM = 10
+
+
+# Определяем автоэнкодер для входного вектора
+class Autoencoder(nn.Module):
+    def __init__(self, input_dim):
+        super(Autoencoder, self).__init__()
+        self.encoder = nn.Sequential(
+            nn.Linear(input_dim, 64),
+            nn.ReLU(),
+            nn.Linear(64, 32),
+            nn.ReLU(),
+            nn.Linear(32, 16)
+        )
+        self.decoder = nn.Sequential(
+            nn.Linear(16, 32),
+            nn.ReLU(),
+            nn.Linear(32, 64),
+            nn.ReLU(),
+            nn.Linear(64, input_dim)
+        )
+
+    def forward(self, x):
+        encoded = self.encoder(x)
+        decoded = self.decoder(encoded)
+        return decoded
+
+
+# Функция преобразования payload в числовой вектор.
+# В этом примере берем 4 признака: amount, период (timestamp), kbk.code (как число) и длину purpose.
+def payload_to_vector(payload, input_dim=10):
+    amount = payload.get("amount", 0.0)
+    period_str = payload.get("period", None)
+    if period_str:
+        try:
+            period_dt = datetime.datetime.fromisoformat(period_str)
+            period_val = period_dt.timestamp()  # преобразуем дату в секунды
+        except Exception:
+            period_val = 0.0
+    else:
+        period_val = 0.0
+    kbk = payload.get("kbk", {})
+    kbk_code = kbk.get("code", "0")
+    try:
+        kbk_val = float(kbk_code)
+    except:
+        kbk_val = sum([ord(c) for c in kbk_code]) / 1000.0
+    purpose = payload.get("purpose", "")
+    purpose_len = len(purpose)
+    vec = [amount, period_val, kbk_val, purpose_len]
+    # Если размерность меньше input_dim, дополним нулями.
+    vec += [0.0] * (input_dim - len(vec))
+    return torch.tensor(vec, dtype=torch.float32)
+
+
+PURPOSE_OPTIONS = [
+    "Налог на прибыль",
+    "НДС",
+    "Социальный налог",
+    "Акцизный сбор",
+    "Платеж за услуги"
+]
+
+
+# Генерируем набор обучающих примеров из идеальных payload'ов формы nn_page:
+# сумма 100..1 000 000, период за последние 2 года, 6-значный KBK, purpose из
+# PURPOSE_OPTIONS — и та же векторизация, что в payload_to_vector, но сразу
+# столбцами numpy в одну матрицу [N, input_dim], без промежуточных dict'ов.
+def generate_training_data_from_payloads(num_samples=1000, input_dim=10):
+    data = np.zeros((num_samples, input_dim), dtype=np.float32)
+    data[:, 0] = np.random.uniform(100.0, 1000000.0, size=num_samples)
+    # Период: случайная дата за последние 2 года. Timestamp (в локальном времени,
+    # как datetime.fromisoformat(...).timestamp()) считаем один раз на каждую дату
+    start_date = date.today() - relativedelta(years=2)
+    day_timestamps = np.array([
+        datetime.datetime.combine(start_date + timedelta(days=d), datetime.time()).timestamp()
+        for d in range(365*2)
+    ])
+    data[:, 1] = day_timestamps[np.random.randint(0, 365*2, size=num_samples)]
+    data[:, 2] = np.random.randint(100000, 999999, size=num_samples)
+    purpose_lengths = np.array([len(p) for p in PURPOSE_OPTIONS])
+    data[:, 3] = purpose_lengths[np.random.randint(0, len(PURPOSE_OPTIONS), size=num_samples)]
+    return torch.from_numpy(data)
+
+
+# Функция обучения автоэнкодера.
+# on_epoch(epoch, epochs, loss, seconds) вызывается после каждой эпохи.
+def train_autoencoder(model, data, epochs=20, batch_size=32, learning_rate=0.001,
+                      on_epoch: Optional[Callable[[int, int, float, float], None]] = None):
+    dataset = TensorDataset(data)
+    dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
+    criterion = nn.MSELoss()
+    optimizer = optim.Adam(model.parameters(), lr=learning_rate)
+
+    for epoch in range(epochs):
+        started_at = time.perf_counter()
+        running_loss = 0.0
+        for batch in dataloader:
+            inputs = batch[0]
+            optimizer.zero_grad()
+            outputs = model(inputs)
+            loss = criterion(outputs, inputs)
+            loss.backward()
+            optimizer.step()
+            running_loss += loss.item() * inputs.size(0)
+        epoch_loss = running_loss / len(dataset)
+        if on_epoch:
+            on_epoch(epoch + 1, epochs, epoch_loss, time.perf_counter() - started_at)
+    return model
+
+
+# Функция для вычисления аномальности: среднеквадратичная ошибка между входным вектором и его восстановлением
+def compute_anomaly_score(model, input_vector):
+    model.eval()
+    with torch.no_grad():
+        reconstructed = model(input_vector)
+        loss = nn.functional.mse_loss(reconstructed, input_vector, reduction='mean')
+    return loss.item()
+
+
+def _training_worker(params: Dict, progress):
+    """Тело фонового процесса: данные -> обучение -> state_dict в очередь"""
+    try:
+        torch.set_num_threads(params.get("threads", 1))
+        input_dim = params["input_dim"]
+        progress.put({"stage": "data"})
+        data = generate_training_data_from_payloads(num_samples=params["num_samples"], input_dim=input_dim)
+
+        def on_epoch(epoch, epochs, loss, seconds):
+            progress.put({
+                "stage": "train",
+                "epoch": epoch,
+                "epochs": epochs,
+                "loss": loss,
+                "samples_per_sec": len(data) / seconds if seconds else 0.0,
+                "epoch_seconds": seconds,
+            })
+
+        model = train_autoencoder(
+            Autoencoder(input_dim=input_dim),
+            data,
+            epochs=params["epochs"],
+            batch_size=params["batch_size"],
+            learning_rate=params["learning_rate"],
+            on_epoch=on_epoch
+        )
+        # Веса numpy-массивами: тензоры torch ушли бы в очередь через shared memory,
+        # которая исчезает вместе с завершившимся процессом
+        state_dict = {k: v.detach().cpu().numpy() for k, v in model.state_dict().items()}
+        progress.put({"stage": "done", "state_dict": state_dict})
+    except Exception as e:
+        progress.put({"stage": "failed", "error": repr(e)})
+
+
+class TrainingJobManager:
+    """
+    Обучение в отдельном процессе: страница не блокируется, прогресс
+    (loss, samples/sec, ETA) забирается через poll(). Готовые модели
+    публикуются в общий реестр менеджера; в Streamlit менеджер держится
+    в st.cache_resource, поэтому модель видна всем сессиям и переживает reload.
+    """
+
+    def __init__(self):
+        self._ctx = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self.jobs: Dict[str, Dict] = {}
+        self.models: Dict[str, nn.Module] = {}
+
+    def start(
+        self,
+        num_samples: int = 1000,
+        epochs: int = 200,
+        batch_size: int = 32,
+        learning_rate: float = 0.001,
+        input_dim: int = INPUT_DIM,
+        name: str = "latest"
+    ) -> str:
+        params = {
+            "num_samples": num_samples,
+            "epochs": epochs,
+            "batch_size": batch_size,
+            "learning_rate": learning_rate,
+            "input_dim": input_dim,
+        }
+        progress = self._ctx.Queue()
+        process = self._ctx.Process(target=_training_worker, args=(params, progress), daemon=True)
+        job_id = uuid.uuid4().hex[:8]
+        with self._lock:
+            self.jobs[job_id] = {
+                "id": job_id,
+                "name": name,
+                "params": params,
+                "state": "running",
+                "stage": "start",
+                "epoch": 0,
+                "epochs": epochs,
+                "loss": None,
+                "history": [],
+                "samples_per_sec": None,
+                "eta_s": None,
+                "error": None,
+                "started_at": time.time(),
+                "_process": process,
+                "_progress": progress,
+            }
+        process.start()
+        return job_id
+
+    def running_job(self) -> Optional[str]:
+        with self._lock:
+            for job_id, job in self.jobs.items():
+                if job["state"] == "running":
+                    return job_id
+        return None
+
+    def poll(self, job_id: str) -> Dict:
+        """Забирает накопившийся прогресс и возвращает публичное состояние задачи"""
+        with self._lock:
+            job = self.jobs[job_id]
+            if job["state"] == "running":
+                self._drain(job)
+            return {k: v for k, v in job.items() if not k.startswith("_")}
+
+    def cancel(self, job_id: str):
+        with self._lock:
+            job = self.jobs[job_id]
+            if job["state"] == "running":
+                job["_process"].terminate()
+                job["state"] = "cancelled"
+
+    def get_model(self, name: str = "latest") -> Optional[nn.Module]:
+        with self._lock:
+            return self.models.get(name)
+
+    def _drain(self, job: Dict):
+        while True:
+            try:
+                message = job["_progress"].get_nowait()
+            except queue.Empty:
+                break
+            job["stage"] = message["stage"]
+            if message["stage"] == "train":
+                job["epoch"] = message["epoch"]
+                job["loss"] = message["loss"]
+                job["samples_per_sec"] = message["samples_per_sec"]
+                job["history"].append(message["loss"])
+                # ETA по скользящему среднему последних эпох
+                job.setdefault("_epoch_times", []).append(message["epoch_seconds"])
+                recent = job["_epoch_times"][-10:]
+                job["eta_s"] = (job["epochs"] - job["epoch"]) * sum(recent) / len(recent)
+            elif message["stage"] == "done":
+                model = Autoencoder(input_dim=job["params"]["input_dim"])
+                model.load_state_dict({k: torch.from_numpy(v) for k, v in message["state_dict"].items()})
+                model.eval()
+                self.models[job["name"]] = model
+                job["state"] = "done"
+                job["eta_s"] = 0.0
+                job["_process"].join(timeout=1)
+            elif message["stage"] == "failed":
+                job["state"] = "failed"
+                job["error"] = message["error"]
+
+        if job["state"] == "running" and not job["_process"].is_alive() and job["_progress"].empty():
+            job["state"] = "failed"
+            job["error"] = job["error"] or f"Процесс обучения завершился с кодом {job['_process'].exitcode}"
@@ -0,0 +1,358 @@
+# offline_generator.py
+"""
+Офлайн-генерация синтетических платежей без доступа к API.
+Справочники берутся из снапшота CachedDictionaryService (dictionary_cache.json),
+все случайные поля сэмплируются массивами через seeded numpy.random.Generator:
+
+    python offline_generator.py --snapshot dictionary_cache.json -n 1000000 --seed 42 --jsonl synthetic.jsonl
+    python offline_generator.py -n 1000000 --seed 42 --features synthetic_features.npy
+
+JSONL — в формате журнала successful_payloads ({"timestamp", "payload"}),
+матрица признаков — ровно то, что дал бы PaymentFeatureExtractor.payload_to_vector.
+Признаки из hash() строк (kbk_name, ugd_name, iban_prefix, нецифровой knp)
+солятся на процесс: в .npy они пишутся нулями, если не задан PYTHONHASHSEED,
+иначе один и тот же --seed давал бы разные матрицы.
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from services.dictionary_service import DictionaryService
+
+QUARTERS = ("FIRST", "SECOND", "THIRD", "FOURTH")
+PAYLOAD_FEATURES = [
+    'amount', 'kbk_code', 'knp', 'year',
+    'quarter_1', 'quarter_2', 'quarter_3', 'quarter_4', 'has_period',
+    'op_individual', 'op_corporate', 'op_employee',
+    'kbk_employee_flag', 'kbk_ugd_flag', 'kbk_name',
+    'has_ugd', 'ugd_code', 'ugd_bin', 'ugd_name',
+    'purpose_len', 'iban_prefix'
+]
+TRANSACTION_FEATURES = [
+    'amount', 'another_amount', 'commission', 'kbk_code',
+    'status_completed', 'status_failed', 'status_pending', 'status_reversed',
+    'type_empltax', 'type_indntrtax', 'type_corptax', 'type_indtax',
+    'is_debit', 'has_error',
+    'payment_year', 'payment_quarter', 'payment_half_year',
+    'created_hour', 'modified_hour', 'has_period', 'period_length',
+    'currency_kzt', 'another_currency_present', 'exchange_dir_present', 'iban_credit_present',
+    'has_ugd', 'ugd_bin_hash', 'credit_id_hash', 'sender_iin_present',
+    'purpose_len', 'counterparty_len', 'iban_debit_prefix',
+    'kbk_name_hash', 'knp_code_present', 'knp_present',
+    'sender_name_present', 'employees_count'
+]
+# Колонки payload-матрицы, которые считаются через hash() строки (knp — только у нецифровых кодов)
+HASHED_PAYLOAD_FEATURES = ('knp', 'kbk_name', 'ugd_name', 'iban_prefix')
+
+
+def hash_is_seeded() -> bool:
+    """hash() строк воспроизводим между запусками только при фиксированном PYTHONHASHSEED"""
+    return os.environ.get("PYTHONHASHSEED", "random") not in ("", "random")
+
+
+def _hash_unit(values: Sequence[str]) -> np.ndarray:
+    """hash(s) % 10000 / 10000, как в PaymentFeatureExtractor; по разу на уникальную строку"""
+    return np.array([float(hash(v or "") % 10000) / 10000 for v in values], dtype=np.float64)
+
+
+def _float_hash_unit(values: Sequence[str]) -> np.ndarray:
+    """float(hash(s)) % 10000 / 10000 — вариант из transaction_to_vector (остаток от float)"""
+    return np.array([float(hash(v)) % 10000 / 10000 if v else 0.0 for v in values], dtype=np.float64)
+
+
+class OfflinePayloadGenerator:
+    """
+    Векторная версия PaymentPayloadGenerator.generate_random_payload:
+    KBK -> случайный KNP из его knpList, сумма 100..10000, purpose "<knpName>_NNNN",
+    для KBK на '1' — квартал и год, иначе дата периода за последний год,
+    UGD — если ugdLoadingRequired.
+    """
+
+    def __init__(
+        self,
+        kbk_list: List[Dict],
+        ugd_list: List[Dict],
+        ibans: Optional[Sequence[str]] = None,
+        operation_type: str = "INDIVIDUAL_ENTREPRENEUR",
+        seed: Optional[int] = None
+    ):
+        self.rng = np.random.default_rng(seed)
+        self.operation_type = operation_type
+        self.kbk_list = [kbk for kbk in kbk_list if kbk.get("knpList")]
+        self.ugd_list = list(ugd_list)
+        if not self.kbk_list:
+            raise ValueError("В снапшоте нет KBK с непустым knpList")
+        if not self.ugd_list:
+            raise ValueError("В снапшоте нет UGD")
+
+        if not ibans:
+            # Синтетические счета в формате KZ + 18 цифр
+            digits = self.rng.integers(0, 10, size=(50, 18))
+            ibans = ["KZ" + "".join(map(str, row)) for row in digits]
+        self.ibans = list(ibans)
+
+        # Плоские таблицы справочников: сэмплируются индексы, а не dict'ы
+        self.knp_offsets = np.cumsum([0] + [len(kbk["knpList"]) for kbk in self.kbk_list])[:-1]
+        self.knp_counts = np.array([len(kbk["knpList"]) for kbk in self.kbk_list])
+        self.pairs = [(kbk, knp) for kbk in self.kbk_list for knp in kbk["knpList"]]
+        self.kbk_has_quarters = np.array([str(kbk["code"]).startswith('1') for kbk in self.kbk_list])
+        self.kbk_needs_ugd = np.array([bool(kbk.get("ugdLoadingRequired")) for kbk in self.kbk_list])
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        path: str = "dictionary_cache.json",
+        ibans: Optional[Sequence[str]] = None,
+        operation_type: str = "INDIVIDUAL_ENTREPRENEUR",
+        seed: Optional[int] = None
+    ) -> "OfflinePayloadGenerator":
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f).get("entries", {})
+        kbk_entry = entries.get(DictionaryService.kbk_endpoint(operation_type))
+        ugd_entry = entries.get(DictionaryService.UGD_ENDPOINT)
+        if kbk_entry is None or ugd_entry is None:
+            raise ValueError(f"В снапшоте {path} нет справочников KBK/UGD для {operation_type}")
+        return cls(kbk_entry["data"], ugd_entry["data"], ibans, operation_type, seed)
+
+    def sample(self, n: int) -> Dict[str, np.ndarray]:
+        """n платежей колонками (индексы в справочники + числовые поля)"""
+        rng = self.rng
+        kbk_idx = rng.integers(0, len(self.kbk_list), size=n)
+        pair_idx = self.knp_offsets[kbk_idx] + (rng.random(n) * self.knp_counts[kbk_idx]).astype(np.int64)
+        has_quarter = self.kbk_has_quarters[kbk_idx]
+        this_year = date.today().year
+        return {
+            "kbk_idx": kbk_idx,
+            "pair_idx": pair_idx,
+            "iban_idx": rng.integers(0, len(self.ibans), size=n),
+            "ugd_idx": np.where(self.kbk_needs_ugd[kbk_idx], rng.integers(0, len(self.ugd_list), size=n), -1),
+            "amount": np.round(rng.uniform(100.0, 10000.0, size=n), 2),
+            "purpose_suffix": rng.integers(1000, 10000, size=n),
+            "has_quarter": has_quarter,
+            "quarter_idx": np.where(has_quarter, rng.integers(0, 4, size=n), -1),
+            "year": np.where(has_quarter, rng.integers(this_year - 2, this_year, size=n), 0),
+            "period_days": np.where(has_quarter, 0, rng.integers(1, 366, size=n)),
+            "uuid_bytes": rng.integers(0, 256, size=(n, 16), dtype=np.uint8),
+            "timestamp": datetime.now().isoformat(),
+        }
+
+    def records(self, columns: Dict[str, np.ndarray]) -> Iterator[Dict]:
+        """Записи журнала {"timestamp", "payload"} по колонкам из sample()"""
+        today = date.today()
+        timestamp = columns["timestamp"]
+        uuid_bytes = columns["uuid_bytes"].copy()
+        # UUID v4: версия и вариант в нужных битах, остальное — из того же seeded RNG
+        uuid_bytes[:, 6] = (uuid_bytes[:, 6] & 0x0F) | 0x40
+        uuid_bytes[:, 8] = (uuid_bytes[:, 8] & 0x3F) | 0x80
+        for i in range(len(columns["amount"])):
+            kbk, knp = self.pairs[columns["pair_idx"][i]]
+            raw = uuid_bytes[i].tobytes().hex()
+            payload = {
+                "transactionId": f"APP_INDNTRTAX_{raw[:8]}-{raw[8:12]}-{raw[12:16]}-{raw[16:20]}-{raw[20:]}",
+                "ibanDebit": self.ibans[columns["iban_idx"][i]],
+                "amount": float(columns["amount"][i]),
+                "kbk": {
+                    "name": kbk["name"],
+                    "code": kbk["code"],
+                    "employeeLoadingRequired": kbk["employeeLoadingRequired"],
+                    "ugdLoadingRequired": kbk["ugdLoadingRequired"]
+                },
+                "knp": knp["knpCode"],
+                "purpose": f"{knp['knpName']}_{columns['purpose_suffix'][i]}",
+                "taxesPaymentOperationType": self.operation_type
+            }
+            if columns["has_quarter"][i]:
+                payload["quarter"] = QUARTERS[columns["quarter_idx"][i]]
+                payload["year"] = int(columns["year"][i])
+            else:
+                payload["period"] = (today - timedelta(days=int(columns["period_days"][i]))).isoformat()
+            if columns["ugd_idx"][i] >= 0:
+                ugd = self.ugd_list[columns["ugd_idx"][i]]
+                payload["ugd"] = {"bin": ugd["bin"], "name": ugd["name"], "code": ugd["code"]}
+            yield {"timestamp": timestamp, "payload": payload}
+
+    def features(self, columns: Dict[str, np.ndarray], hashed: bool = True) -> np.ndarray:
+        """
+        Матрица [n, 21] float32, совпадающая с PaymentFeatureExtractor.payload_to_vector.
+        hash() строк солится на процесс, поэтому сравнимо только с векторами,
+        посчитанными в этом же процессе (как и сам payload_to_vector).
+        hashed=False — колонки HASHED_PAYLOAD_FEATURES нулями, матрица
+        зависит только от seed.
+        """
+        n = len(columns["amount"])
+        kbk_idx = columns["kbk_idx"]
+        pair_idx = columns["pair_idx"]
+        ugd_idx = columns["ugd_idx"]
+        has_ugd = ugd_idx >= 0
+        safe_ugd = np.where(has_ugd, ugd_idx, 0)
+
+        # Таблицы признаков по справочникам: каждая уникальная строка обрабатывается один раз
+        kbk_code = np.array([float(kbk["code"]) for kbk in self.kbk_list]) / 1_000_000
+        kbk_employee = np.array([float(kbk["employeeLoadingRequired"]) for kbk in self.kbk_list])
+        kbk_ugd = np.array([float(kbk["ugdLoadingRequired"]) for kbk in self.kbk_list])
+        kbk_name = _hash_unit([kbk["name"] for kbk in self.kbk_list])
+        knp_value = np.array([
+            float(knp["knpCode"]) if knp["knpCode"].isdigit()
+            else float(hash(knp["knpCode"]) % 10000) / 10000 if hashed else 0.0
+            for _, knp in self.pairs
+        ])
+        purpose_len = np.array([len(knp["knpName"]) + 5 for _, knp in self.pairs]) / 200
+        ugd_code = np.array([float(ugd["code"] or 0) for ugd in self.ugd_list]) / 10000
+        ugd_bin = np.array([float(ugd["bin"] or 0) for ugd in self.ugd_list]) / 10000
+        ugd_name = _hash_unit([ugd["name"] for ugd in self.ugd_list])
+        iban_hash = _hash_unit(self.ibans)
+
+        quarter_idx = columns["quarter_idx"]
+        X = np.zeros((n, len(PAYLOAD_FEATURES)), dtype=np.float32)
+        X[:, 0] = columns["amount"] / 1_000_000
+        X[:, 1] = kbk_code[kbk_idx]
+        X[:, 2] = knp_value[pair_idx]
+        X[:, 3] = np.where(columns["has_quarter"], (columns["year"] - 2000) / 50, 0.0)
+        for q in range(4):
+            X[:, 4 + q] = quarter_idx == q
+        X[:, 8] = ~columns["has_quarter"]
+        X[:, 9] = self.operation_type == "INDIVIDUAL_ENTREPRENEUR"
+        X[:, 10] = self.operation_type == "CORPORATE"
+        X[:, 11] = self.operation_type == "EMPLOYEE"
+        X[:, 12] = kbk_employee[kbk_idx]
+        X[:, 13] = kbk_ugd[kbk_idx]
+        X[:, 14] = kbk_name[kbk_idx]
+        X[:, 15] = has_ugd
+        X[:, 16] = np.where(has_ugd, ugd_code[safe_ugd], 0.0)
+        X[:, 17] = np.where(has_ugd, ugd_bin[safe_ugd], 0.0)
+        X[:, 18] = np.where(has_ugd, ugd_name[safe_ugd], 0.0)
+        X[:, 19] = purpose_len[pair_idx]
+        X[:, 20] = iban_hash[columns["iban_idx"]]
+        if not hashed:
+            X[:, [PAYLOAD_FEATURES.index(name) for name in HASHED_PAYLOAD_FEATURES[1:]]] = 0.0
+        return X
+
+    def transaction_features(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Матрица [n, 37] float32 для идеальных транзакций: то же, что
+        transaction_to_vector(TransactionDetail.from_dict(generate_ideal_output(payload))),
+        но без построения dict'ов.
+        """
+        n = len(columns["amount"])
+        kbk_idx = columns["kbk_idx"]
+        ugd_idx = columns["ugd_idx"]
+        has_ugd = ugd_idx >= 0
+        safe_ugd = np.where(has_ugd, ugd_idx, 0)
+        hour = datetime.fromisoformat(columns["timestamp"]).hour / 24
+
+        kbk_code = np.array([float(str(kbk["code"])) for kbk in self.kbk_list]) / 1_000_000
+        kbk_name = _float_hash_unit([kbk["name"] for kbk in self.kbk_list])
+        purpose_len = np.array([len(knp["knpName"]) + 5 for _, knp in self.pairs]) / 200
+        ugd_bin = _float_hash_unit([ugd["bin"] for ugd in self.ugd_list])
+        ugd_code = _float_hash_unit([ugd["code"] for ugd in self.ugd_list])
+        counterparty_len = np.array([len(ugd["name"] or "") for ugd in self.ugd_list]) / 200
+        transaction_type = {"INDIVIDUAL_ENTREPRENEUR": 11, "CORPORATE": 10}.get(self.operation_type, 8)
+
+        T = np.zeros((n, len(TRANSACTION_FEATURES)), dtype=np.float32)
+        T[:, 0] = columns["amount"] / 1_000_000
+        T[:, 2] = 150 / 1000
+        T[:, 3] = kbk_code[kbk_idx]
+        T[:, 4] = 1.0  # COMPLETED
+        T[:, transaction_type] = 1.0
+        T[:, 12] = 1.0  # debit
+        T[:, 14] = np.where(columns["has_quarter"], (columns["year"] - 2000) / 50, 0.0)
+        T[:, 15] = np.where(columns["has_quarter"], (columns["quarter_idx"] + 1) / 4, 0.0)
+        T[:, 17] = hour
+        T[:, 18] = hour
+        # PaymentPayload.to_dict всегда отдаёт ключ period, поэтому у квартальных
+        # платежей generate_ideal_output оставляет period=None
+        T[:, 19] = ~columns["has_quarter"]
+        T[:, 20] = np.where(columns["has_quarter"], 0.0, 10 / 50)
+        T[:, 21] = 1.0
+        T[:, 24] = 1.0
+        T[:, 25] = has_ugd
+        T[:, 26] = np.where(has_ugd, ugd_bin[safe_ugd], 0.0)
+        T[:, 27] = np.where(has_ugd, ugd_code[safe_ugd], 0.0)
+        T[:, 29] = purpose_len[columns["pair_idx"]]
+        T[:, 30] = np.where(has_ugd, counterparty_len[safe_ugd], 0.0)
+        T[:, 32] = kbk_name[kbk_idx]
+        T[:, 33] = 1.0
+        T[:, 34] = 1.0
+        return T
+
+    def iter_records(self, n: int, batch_size: int = 100_000) -> Iterator[Dict]:
+        for start in range(0, n, batch_size):
+            yield from self.records(self.sample(min(batch_size, n - start)))
+
+    def feature_matrix(self, n: int, batch_size: int = 1_000_000) -> np.ndarray:
+        return np.concatenate([
+            self.features(self.sample(min(batch_size, n - start)))
+            for start in range(0, n, batch_size)
+        ]) if n else np.zeros((0, len(PAYLOAD_FEATURES)), dtype=np.float32)
+
+    def write(
+        self,
+        n: int,
+        jsonl_path: Optional[str] = None,
+        features_path: Optional[str] = None,
+        batch_size: int = 100_000,
+        hashed: Optional[bool] = None
+    ) -> int:
+        """
+        JSONL и/или .npy из одних и тех же сэмплов (строка i JSONL = строка i матрицы).
+        hashed=None — hash-колонки в .npy только при заданном PYTHONHASHSEED, иначе нули.
+        """
+        if hashed is None:
+            hashed = hash_is_seeded()
+        blocks = []
+        out = open(jsonl_path, "w", encoding="utf-8") if jsonl_path else None
+        try:
+            for start in range(0, n, batch_size):
+                columns = self.sample(min(batch_size, n - start))
+                if out:
+                    out.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in self.records(columns))
+                if features_path:
+                    blocks.append(self.features(columns, hashed=hashed))
+        finally:
+            if out:
+                out.close()
+        if features_path:
+            np.save(features_path, np.concatenate(blocks) if blocks else np.zeros((0, len(PAYLOAD_FEATURES)), dtype=np.float32))
+        return n
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-генератор синтетических платежей")
+    parser.add_argument("--snapshot", default="dictionary_cache.json", help="Снапшот CachedDictionaryService")
+    parser.add_argument("-n", "--count", type=int, default=100_000)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--operation-type", default="INDIVIDUAL_ENTREPRENEUR")
+    parser.add_argument("--iban", action="append", help="Счёт списания (можно несколько раз)")
+    parser.add_argument("--jsonl", help="Записать payload'ы в JSONL (формат журнала)")
+    parser.add_argument(
+        "--features",
+        help="Записать матрицу признаков [N, 21] в .npy. Колонки из hash() строк "
+             "(knp с нецифровым кодом, kbk_name, ugd_name, iban_prefix) солятся на процесс, "
+             "поэтому без PYTHONHASHSEED они пишутся нулями; задайте PYTHONHASHSEED=0, "
+             "чтобы сохранить их воспроизводимо"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.jsonl and not args.features:
+        raise SystemExit("Укажите --jsonl и/или --features")
+
+    generator = OfflinePayloadGenerator.from_snapshot(args.snapshot, args.iban, args.operation_type, args.seed)
+    if args.features and not hash_is_seeded():
+        print(f"PYTHONHASHSEED не задан: hash-колонки {', '.join(HASHED_PAYLOAD_FEATURES)} в {args.features} "
+              f"заполнены нулями (knp — только у нецифровых кодов)")
+    started_at = time.perf_counter()
+    generator.write(args.count, jsonl_path=args.jsonl, features_path=args.features)
+    print(f"{args.count} платежей за {time.perf_counter() - started_at:.1f} с -> {args.jsonl or ''} {args.features or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,12 @@
 import streamlit as st
 import requests
 import json
-import torch
-import torch.nn as nn
-import torch.optim as optim
-from torch.utils.data import DataLoader, TensorDataset
-import numpy as np
-from datetime import date, timedelta
+import time
+from datetime import date
 from dateutil.relativedelta import relativedelta
 import uuid
-import datetime
+
+from nn_training import INPUT_DIM, TrainingJobManager, compute_anomaly_score, payload_to_vector
 
 st.set_page_config(layout="wide")
 st.title("💳 Платежи в бюджет — Налоги компании (с расчётом комиссии)")
@@ -147,158 +144,62 @@ if st.button("📊 Рассчитать комиссию и отправить 
 
 st.header("🤖 Детектор аномалий (ML)")
 
-# Определяем автоэнкодер для входного вектора
-class Autoencoder(nn.Module):
-    def __init__(self, input_dim):
-        super(Autoencoder, self).__init__()
-        self.encoder = nn.Sequential(
-            nn.Linear(input_dim, 64),
-            nn.ReLU(),
-            nn.Linear(64, 32),
-            nn.ReLU(),
-            nn.Linear(32, 16)
-        )
-        self.decoder = nn.Sequential(
-            nn.Linear(16, 32),
-            nn.ReLU(),
-            nn.Linear(32, 64),
-            nn.ReLU(),
-            nn.Linear(64, input_dim)
-        )
-        
-    def forward(self, x):
-        encoded = self.encoder(x)
-        decoded = self.decoder(encoded)
-        return decoded
-
-# Функция преобразования payload в числовой вектор.
-# В этом примере берем 4 признака: amount, период (timestamp), kbk.code (как число) и длину purpose.
-def payload_to_vector(payload, input_dim=10):
-    amount = payload.get("amount", 0.0)
-    period_str = payload.get("period", None)
-    if period_str:
-        try:
-            period_dt = datetime.datetime.fromisoformat(period_str)
-            period_val = period_dt.timestamp()  # преобразуем дату в секунды
-        except Exception:
-            period_val = 0.0
-    else:
-        period_val = 0.0
-    kbk = payload.get("kbk", {})
-    kbk_code = kbk.get("code", "0")
-    try:
-        kbk_val = float(kbk_code)
-    except:
-        kbk_val = sum([ord(c) for c in kbk_code]) / 1000.0
-    purpose = payload.get("purpose", "")
-    purpose_len = len(purpose)
-    vec = [amount, period_val, kbk_val, purpose_len]
-    # Если размерность меньше input_dim, дополним нулями.
-    vec += [0.0] * (input_dim - len(vec))
-    return torch.tensor(vec, dtype=torch.float32)
-
-# Функция генерации идеального (нормального) payload на основе вашей формы
-def generate_ideal_payload():
-    tid = f"APP_INDNTRTAX_{uuid.uuid4()}"
-    iban = "KZ" + "".join(np.random.choice(list("0123456789"), size=18))
-    amount = np.random.uniform(100.0, 1000000.0)
-    # Генерируем kbk с кодом из 6 цифр
-    code = str(np.random.randint(100000, 999999))
-    kbk = {
-         "name": "KBK-" + code,
-         "code": code,
-         "employeeLoadingRequired": np.random.choice([True, False]),
-         "ugdLoadingRequired": np.random.choice([True, False])
-    }
-    # knp (не используется в векторизации, но добавляем)
-    knp = str(np.random.randint(100, 999))
-    purpose_options = [
-        "Налог на прибыль", 
-        "НДС", 
-        "Социальный налог", 
-        "Акцизный сбор", 
-        "Платеж за услуги"
-    ]
-    purpose = np.random.choice(purpose_options)
-    # Период: случайная дата за последние 2 года
-    start_date = date.today() - relativedelta(years=2)
-    random_days = np.random.randint(0, 365*2)
-    period_date = start_date + timedelta(days=int(random_days))
-    period_str = period_date.isoformat()
-    taxesPaymentOperationType = "INDIVIDUAL_ENTREPRENEUR"
-    payload = {
-         "transactionId": tid,
-         "ibanDebit": iban,
-         "amount": amount,
-         "kbk": kbk,
-         "knp": knp,
-         "purpose": purpose,
-         "period": period_str,
-         "taxesPaymentOperationType": taxesPaymentOperationType
-    }
-    if kbk["ugdLoadingRequired"]:
-         payload["bin"] = str(np.random.randint(100000000, 999999999))
-    return payload
-
-# Генерируем набор обучающих примеров из идеальных payload'ов
-def generate_training_data_from_payloads(num_samples=1000, input_dim=10):
-    vectors = []
-    for _ in range(num_samples):
-        p = generate_ideal_payload()
-        vec = payload_to_vector(p, input_dim=input_dim)
-        vectors.append(vec.unsqueeze(0))
-    return torch.cat(vectors, dim=0)
-
-# Функция обучения автоэнкодера
-def train_autoencoder(model, data, epochs=20, batch_size=32, learning_rate=0.001):
-    dataset = TensorDataset(data)
-    dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
-    criterion = nn.MSELoss()
-    optimizer = optim.Adam(model.parameters(), lr=learning_rate)
-    
-    for epoch in range(epochs):
-        running_loss = 0.0
-        for batch in dataloader:
-            inputs = batch[0]
-            optimizer.zero_grad()
-            outputs = model(inputs)
-            loss = criterion(outputs, inputs)
-            loss.backward()
-            optimizer.step()
-            running_loss += loss.item() * inputs.size(0)
-        epoch_loss = running_loss / len(dataset)
-        st.write(f"Epoch {epoch+1}/{epochs}, Loss: {epoch_loss:.4f}")
-    return model
+# Реестр задач обучения и обученных моделей — один на процесс Streamlit:
+# обучение не блокирует страницу, а модель видна всем сессиям и переживает reload
+@st.cache_resource
+def get_training_manager():
+    return TrainingJobManager()
 
-# Функция для вычисления аномальности: среднеквадратичная ошибка между входным вектором и его восстановлением
-def compute_anomaly_score(model, input_vector):
-    model.eval()
-    with torch.no_grad():
-        reconstructed = model(input_vector)
-        loss = nn.functional.mse_loss(reconstructed, input_vector, reduction='mean')
-    return loss.item()
-
-# Задаем размерность входного вектора (например, 10 признаков)
-INPUT_DIM = 10
+manager = get_training_manager()
 
 st.sidebar.header("ML Детектор аномалий")
 
 # Кнопка обучения модели на идеальных (синтетических) данных, сгенерированных по вашей форме
-if st.sidebar.button("Обучить модель на идеальных данных"):
-    st.sidebar.write("Генерация обучающих данных и обучение автоэнкодера...")
-    training_data = generate_training_data_from_payloads(num_samples=1000, input_dim=INPUT_DIM)
-    model = Autoencoder(input_dim=INPUT_DIM)
-    trained_model = train_autoencoder(model, training_data, epochs=200)
-    st.session_state.autoencoder_model = trained_model
-    st.sidebar.success("Модель обучена!")
+num_samples = st.sidebar.number_input("Обучающих примеров", 1000, 1000000, 1000, step=1000)
+job_id = manager.running_job()
+if job_id is None and st.sidebar.button("Обучить модель на идеальных данных"):
+    job_id = manager.start(num_samples=int(num_samples), epochs=200)
+    st.session_state.training_job = job_id
+elif job_id is None:
+    job_id = st.session_state.get("training_job")
+
+if job_id is not None:
+    if manager.poll(job_id)["state"] == "running" and st.sidebar.button("Отменить обучение"):
+        manager.cancel(job_id)
+    progress_bar = st.sidebar.progress(0.0)
+    status = st.sidebar.empty()
+    # Обучение идёт в отдельном процессе; здесь только опрос прогресса.
+    # Любое действие на странице прерывает цикл, но не обучение.
+    while True:
+        job = manager.poll(job_id)
+        progress_bar.progress(job["epoch"] / job["epochs"] if job["epochs"] else 0.0)
+        if job["state"] == "running":
+            if job["loss"] is None:
+                status.write("Генерация обучающих данных...")
+            else:
+                status.write(
+                    f"Epoch {job['epoch']}/{job['epochs']}, Loss: {job['loss']:.4f}, "
+                    f"{job['samples_per_sec']:.0f} samples/s, ETA {job['eta_s']:.0f} с"
+                )
+            time.sleep(0.5)
+            continue
+        if job["state"] == "done":
+            status.success(f"Модель обучена! Loss: {job['loss']:.4f}")
+        elif job["state"] == "cancelled":
+            status.warning("Обучение отменено.")
+        else:
+            status.error(f"Ошибка обучения: {job['error']}")
+        break
+
+autoencoder_model = manager.get_model()
 
 # Если модель уже обучена и имеется последний payload, оцениваем аномальность
-if "autoencoder_model" in st.session_state:
+if autoencoder_model is not None:
     st.sidebar.subheader("Анализ текущего запроса")
     if "last_payload" in st.session_state:
         vec = payload_to_vector(st.session_state.last_payload, input_dim=INPUT_DIM)
         vec = vec.unsqueeze(0)  # добавляем размер батча = 1
-        anomaly_score = compute_anomaly_score(st.session_state.autoencoder_model, vec)
+        anomaly_score = compute_anomaly_score(autoencoder_model, vec)
         st.sidebar.write(f"Аномалия (MSE): {anomaly_score:.4f}")
         # Задаем порог для аномалии (подберите опытным путем)
         if anomaly_score > 0.5:
@@ -1,46 +1,20 @@
 import streamlit as st
-import requests
-import json
 import uuid
 import random
 import pandas as pd
-from datetime import date, datetime
+from datetime import date
 from dateutil.relativedelta import relativedelta
-from utils import fetch_api_data
+from utils import fetch_api_data, fetch_dictionary_data, get_token_manager, sync_session_tokens
+from services.period_resolver import PaymentPeriodResolver
+from load_test import ResultsBuffer, commission_sender, run_load_test
+from services.commission_batcher import CommissionBatcher
+from latency import LatencyRecorder
 import time
 
 st.set_page_config(layout="wide")
 st.title("💳 Платежи в бюджет — Налоги компании (с расчётом комиссии)")
 
 
-import json
-from datetime import datetime
-
-def save_successful_payload(payload, filename="successful_payloads.json"):
-    """
-    Загружает существующие данные из файла (ожидается список записей).
-    Если данные не являются списком, оборачивает их в список.
-    Затем добавляет новую запись с временной меткой и сохраняет обновлённый список обратно.
-    """
-    try:
-        with open(filename, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        # Если данные не являются списком, оборачиваем их в список
-        if not isinstance(data, list):
-            data = [data]
-    except Exception:
-        data = []
-    
-    record = {
-        "timestamp": datetime.now().isoformat(),
-        "payload": payload
-    }
-    data.append(record)
-    
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-
 # @st.cache_data
 # def fetch_api_data(endpoint):
 #     try:
@@ -85,8 +59,8 @@ max_attempts = st.number_input("Количество попыток отправ
 
 # Справочники
 selected_operation_type = "INDIVIDUAL_ENTREPRENEUR"
-ugd_list = fetch_api_data(base_url=base_url, endpoint="/api/dictionary/dictionary/ugd/all")
-kbk_list = fetch_api_data(base_url=base_url, endpoint=f"/api/dictionary/dictionary/kbk/kbk-to-knp-list?taxesPaymentOperationType={selected_operation_type}")
+ugd_list = fetch_dictionary_data(base_url=base_url, endpoint="/api/dictionary/dictionary/ugd/all")
+kbk_list = fetch_dictionary_data(base_url=base_url, endpoint=f"/api/dictionary/dictionary/kbk/kbk-to-knp-list?taxesPaymentOperationType={selected_operation_type}")
 quarters_list = None
 
 if not kbk_list:
@@ -97,14 +71,16 @@ ugd_options = {f"{u['name']} ({u['code']})": u for u in ugd_list}
 # kbk_selected = st.selectbox("Выберите KBK", list(kbk_options.keys()))
 # kbk = kbk_options[kbk_selected]
 
-def fetch_period_list(kbkCode, knpCode):
-    period_data = fetch_api_data(base_url=base_url, endpoint=
-        f"/api/dictionary/dictionary/payment-period?"
-        f"operationType=INDIVIDUAL_ENTREPRENEUR"
-        f"&kbk={kbkCode}"
-        f"&knp={knpCode}"
-        f"&id=0"
+# Периоды кэшируются на сессию: одна и та же пара (kbk, knp) запрашивается один раз
+if st.session_state.get('period_resolver_url') != base_url:
+    st.session_state['period_resolver'] = PaymentPeriodResolver(
+        lambda endpoint: fetch_api_data(base_url=base_url, endpoint=endpoint)
     )
+    st.session_state['period_resolver_url'] = base_url
+period_resolver = st.session_state['period_resolver']
+
+def fetch_period_list(kbkCode, knpCode):
+    period_data = period_resolver.get(selected_operation_type, kbkCode, knpCode)
 
     # Если нет ответа или periodType не указан – вернем пустой список
     if not period_data:
@@ -192,164 +168,174 @@ st.header("🔄 Итерационное тестирование")
 
 # Настройки итераций
 iterations = st.number_input("Количество итераций", value=100, step=1, key="iterations")
+concurrency = st.number_input("Параллельность (одновременных итераций)", min_value=1, max_value=64, value=1, step=1, key="concurrency")
+commission_batch = st.number_input(
+    "Батч комиссии (транзакций в одном multi-calculate, 1 — без батчинга)",
+    min_value=1, max_value=500, value=1, step=1, key="commission_batch"
+)
+
+col_every, col_secs, col_window = st.columns(3)
+with col_every:
+    render_every = st.number_input("Обновлять таблицу каждые N итераций", min_value=1, value=20, step=1, key="render_every")
+with col_secs:
+    render_interval = st.number_input("…или каждые T секунд", min_value=0.1, value=1.0, step=0.5, key="render_interval")
+with col_window:
+    live_window = st.number_input("Строк в живой таблице", min_value=10, value=50, step=10, key="live_window")
 
 # Контейнер для динамической таблицы и текстового прогресса
 progress_text = st.empty()
 progress_bar = st.progress(0)
+throughput_text = st.empty()
+summary_placeholder = st.empty()
 table_placeholder = st.empty()
 
-if st.button("Запустить итерационные тесты"):
-    results = []
-    for i in range(iterations):
-        # Обновляем текст прогресса
-        progress_text.text(f"Итерация {i+1} из {iterations}")
-        
-        # Генерируем уникальный transactionId для итерации
-        iter_transaction_id = f"APP_INDNTRTAX_{uuid.uuid4()}"
-        
-        #################
-        random_kbk_key = random.choice(list(kbk_options.keys()))
-        kbk_dict = kbk_options[random_kbk_key]
-        iter_kbk = base_kbk if fix_kbk else kbk_dict
-
-        # Используем фиксированные или случайные значения
-        knp_options = {f"{k['knpName']} ({k['knpCode']})": k for k in iter_kbk['knpList']}
-        random_knp_key = random.choice(list(knp_options.keys()))
-        knp_dict = knp_options[random_knp_key]
-        iter_knp = base_knp if fix_knp else knp_dict
-
-        iter_amount = base_amount if fix_amount else round(random.uniform(100.0, 10000.0), 2)
-        iter_purpose = base_purpose if fix_purpose else f"{base_purpose}_{random.randint(1000, 9999)}"
-
-        kbk_code_str = str(iter_kbk["code"])
-        if kbk_code_str.startswith('1'):
-            iter_period_list = fetch_period_list(iter_kbk["code"], iter_knp["knpCode"])
-            if iter_period_list == []:
-                iter_period = base_period.isoformat() if fix_period else (base_period + relativedelta(days=random.randint(-100, 10))).isoformat()
-            else:
-                random_period = random.choice(iter_period_list)
-                iter_year = random_period["year"]
-                iter_quarter = random_period["quarter"]
-                iter_period = base_period if fix_period else iter_quarter
-        else:
+def build_iteration_payload():
+    """Случайные/фиксированные поля одной итерации. Вызывается в потоке Streamlit (нужен fetch_period_list)."""
+    # Генерируем уникальный transactionId для итерации
+    iter_transaction_id = f"APP_INDNTRTAX_{uuid.uuid4()}"
+    
+    #################
+    random_kbk_key = random.choice(list(kbk_options.keys()))
+    kbk_dict = kbk_options[random_kbk_key]
+    iter_kbk = base_kbk if fix_kbk else kbk_dict
+
+    # Используем фиксированные или случайные значения
+    knp_options = {f"{k['knpName']} ({k['knpCode']})": k for k in iter_kbk['knpList']}
+    random_knp_key = random.choice(list(knp_options.keys()))
+    knp_dict = knp_options[random_knp_key]
+    iter_knp = base_knp if fix_knp else knp_dict
+
+    iter_amount = base_amount if fix_amount else round(random.uniform(100.0, 10000.0), 2)
+    iter_purpose = base_purpose if fix_purpose else f"{base_purpose}_{random.randint(1000, 9999)}"
+
+    kbk_code_str = str(iter_kbk["code"])
+    if kbk_code_str.startswith('1'):
+        iter_period_list = fetch_period_list(iter_kbk["code"], iter_knp["knpCode"])
+        if iter_period_list == []:
             iter_period = base_period.isoformat() if fix_period else (base_period + relativedelta(days=random.randint(-100, 10))).isoformat()
-        
-        if iter_kbk.get("ugdLoadingRequired"):
-            random_choice = random.choice(list(ugd_options.keys()))
-            iter_ugd = base_ugd if fix_ugd else ugd_options[random_choice]
-        
-        #################
-
-        # Формируем payload
-        iter_payload = {
-            "transactionId": iter_transaction_id,
-            "ibanDebit": iban_debit,
-            "amount": iter_amount,
-            "kbk": {
-                "name": iter_kbk["name"],
-                "code": iter_kbk["code"],
-                "employeeLoadingRequired": iter_kbk["employeeLoadingRequired"],
-                "ugdLoadingRequired": iter_kbk["ugdLoadingRequired"]
-            },
-            "knp": iter_knp["knpCode"],
-            "purpose": iter_purpose,
-            "taxesPaymentOperationType": selected_operation_type
-        }
-
-        if kbk_code_str.startswith('1') and iter_period_list != []:
-            iter_payload["quarter"] = iter_period
-            iter_payload['year'] = iter_year
-        elif kbk_code_str.startswith('1') and iter_period_list == ["Нет кварталов"]:
-            iter_payload['year'] = iter_year
         else:
-            iter_payload["period"] = iter_period
-
-        if iter_kbk.get("ugdLoadingRequired"):
-            iter_payload["ugd"] = iter_ugd
-
-        
-        # Формируем commission_payload вне цикла (так как amount и transactionId фиксированы для данной итерации)
-        commission_payload = [{
-            "transactionId": iter_transaction_id,
-            "transactionAmount": iter_amount,
-            "currency": "KZT",
-            "urgent": False,
-            "futureValueDate": False
-        }]
-
-        attempt = 0
-        payment_status = None
-        payment_text = ""
-        while attempt < max_attempts:
-            iter_transaction_id = f"APP_INDNTRTAX_{uuid.uuid4()}"
-            commission_payload[0]["transactionId"] = iter_transaction_id
-            iter_payload["transactionId"] = iter_transaction_id
-            # Пересчитываем комиссию
-            try:
-                commission_url = f"{base_url}/api/charge-calculator/api/v1/charges/trn/multi-calculate"
-                commission_resp = requests.put(commission_url, headers=headers, json=commission_payload, verify=False)
-                commission_resp.raise_for_status()
-                commission_status = commission_resp.status_code
-                commission_text = commission_resp.text
-            except Exception as e:
-                commission_status = None
-                commission_text = str(e)
-            
-            # Попытка отправки платежа
-            try:
-                payment_url = f"{base_url}/api/payment/api/v5/budget/init/entrepreneur"
-                payment_resp = requests.post(payment_url, headers=headers, json=iter_payload, verify=False)
-                payment_resp.raise_for_status()
-                payment_status = payment_resp.status_code
-                payment_text = payment_resp.text
-                save_successful_payload(iter_payload, filename="successful_payloads.json")
-                # Если запрос прошёл успешно, выходим из цикла
-                break
-            except requests.exceptions.RequestException as e:
-                attempt += 1
-                if attempt < max_attempts:
-                    progress_text.text(f"Попытка {attempt}/{max_attempts} не удалась, пересчитываем комиссию и повторяем...")
-                    time.sleep(0.5)  # небольшая задержка перед повторной попыткой
-                else:
-                    payment_status = None
-                    if hasattr(e, 'response') and e.response is not None:
-                        payment_text = f"Попытка {attempt}/{max_attempts} — Exception: {e}\nServer Response:\n{e.response.text}"
-                    else:
-                        payment_text = f"Попытка {attempt}/{max_attempts} — Exception: {e}"
-                    break
-
-        results.append({
-            # "TransactionID": iter_transaction_id,
-            "Kbk": iter_kbk['code'],
-            "Knp": iter_knp['knpCode'],
-            "Amount": iter_amount,
-            "Purpose": iter_purpose,
-            "Period": iter_period,
-            "Attempts": attempt,
-            "Commission Status": commission_status,
-            "Payment Status": payment_status,
-            "Commission Response": commission_text,
-            "Payment Response": payment_text,
-            "Payload": iter_payload,
-        })
-        progress_bar.progress((i+1) / iterations)
-        # Обновляем динамическую таблицу после каждой итерации
-        df_results = pd.DataFrame(results)
-        
-        # Функция для окрашивания ячеек по статусу
-        def color_status(val):
-            try:
-                if 200 <= int(val) < 300:
-                    color = 'green'
-                else:
-                    color = 'red'
-            except:
-                color = 'orange'
-            return f'color: {color}'
-
-        styled_df = df_results.style.map(color_status, subset=['Commission Status', 'Payment Status'])
-        table_placeholder.dataframe(styled_df, height=500)
-        # # Добавим небольшую задержку для наглядности обновления (не обязательно)
-        # time.sleep(0.001)
+            random_period = random.choice(iter_period_list)
+            iter_year = random_period["year"]
+            iter_quarter = random_period["quarter"]
+            iter_period = base_period if fix_period else iter_quarter
+    else:
+        iter_period = base_period.isoformat() if fix_period else (base_period + relativedelta(days=random.randint(-100, 10))).isoformat()
+    
+    if iter_kbk.get("ugdLoadingRequired"):
+        random_choice = random.choice(list(ugd_options.keys()))
+        iter_ugd = base_ugd if fix_ugd else ugd_options[random_choice]
+    
+    #################
+
+    # Формируем payload
+    iter_payload = {
+        "transactionId": iter_transaction_id,
+        "ibanDebit": iban_debit,
+        "amount": iter_amount,
+        "kbk": {
+            "name": iter_kbk["name"],
+            "code": iter_kbk["code"],
+            "employeeLoadingRequired": iter_kbk["employeeLoadingRequired"],
+            "ugdLoadingRequired": iter_kbk["ugdLoadingRequired"]
+        },
+        "knp": iter_knp["knpCode"],
+        "purpose": iter_purpose,
+        "taxesPaymentOperationType": selected_operation_type
+    }
+
+    if kbk_code_str.startswith('1') and iter_period_list != []:
+        iter_payload["quarter"] = iter_period
+        iter_payload['year'] = iter_year
+    elif kbk_code_str.startswith('1') and iter_period_list == ["Нет кварталов"]:
+        iter_payload['year'] = iter_year
+    else:
+        iter_payload["period"] = iter_period
+
+    if iter_kbk.get("ugdLoadingRequired"):
+        iter_payload["ugd"] = iter_ugd
+
+    return iter_payload
+
+
+# Функция для окрашивания ячеек по статусу
+def color_status(val):
+    try:
+        if 200 <= int(val) < 300:
+            color = 'green'
+        else:
+            color = 'red'
+    except:
+        color = 'orange'
+    return f'color: {color}'
+
+
+def render_results(buffer, rows=None):
+    """Сводка + таблица (последние rows строк или весь буфер)"""
+    summary_placeholder.table(pd.DataFrame([buffer.summary()]))
+    if not len(buffer):
+        # В пустом DataFrame нет колонок статусов, и style.map(subset=...) падает с KeyError
+        table_placeholder.empty()
+        return
+    df_results = pd.DataFrame(buffer.tail(rows) if rows else buffer.columns)
+    styled_df = df_results.style.map(color_status, subset=list(ResultsBuffer.STATUS_COLUMNS))
+    table_placeholder.dataframe(styled_df, height=500)
+
+
+if st.button("Запустить итерационные тесты"):
+    results = ResultsBuffer()
+    latency = LatencyRecorder()
+    token_manager = get_token_manager(base_url)
+    started_at = time.perf_counter()
+    last_render = {"count": 0, "at": started_at}
+    commission_batcher = None
+    if commission_batch > 1:
+        commission_batcher = CommissionBatcher(
+            commission_sender(base_url, token_manager, latency),
+            max_batch=int(commission_batch)
+        )
+
+    def on_result(row):
+        results.append(row)
+        completed = len(results)
+        now = time.perf_counter()
+        # UI перерисовываем не чаще, чем раз в render_every итераций или render_interval секунд
+        if completed - last_render["count"] < render_every and now - last_render["at"] < render_interval:
+            return
+        last_render.update(count=completed, at=now)
+        elapsed = now - started_at
+        # Обновляем текст прогресса
+        progress_text.text(f"Итерация {completed} из {iterations}")
+        progress_bar.progress(completed / iterations)
+        throughput_text.text(f"Пропускная способность: {completed / elapsed:.2f} итераций/с ({elapsed:.1f} с)")
+        render_results(results, rows=int(live_window))
+
+    # payload собирается в потоке Streamlit (fetch_period_list может писать в UI),
+    # а комиссия и платёж уходят в пул из concurrency потоков
+    summary = run_load_test(
+        build_iteration_payload,
+        base_url,
+        token_manager,
+        iterations=int(iterations),
+        concurrency=int(concurrency),
+        max_attempts=int(max_attempts),
+        journal="successful_payloads.json",
+        on_result=on_result,
+        latency=latency,
+        commission_batcher=commission_batcher
+    )
+    if commission_batcher is not None:
+        commission_batcher.close()
     
+    sync_session_tokens(token_manager)
+    progress_bar.progress(1.0)
+    throughput_text.text(f"Пропускная способность: {summary['throughput_rps']:.2f} итераций/с ({summary['elapsed_s']:.1f} с)")
+    # Полная таблица — один раз, в конце
+    render_results(results)
+
+    st.subheader("⏱ Задержки (мс)")
+    latency_df = pd.DataFrame(latency.report())
+    st.dataframe(latency_df[latency_df["group"] == "all"], hide_index=True)
+    with st.expander("По номеру попытки и по KBK"):
+        st.dataframe(latency_df[latency_df["group"] != "all"], hide_index=True)
+    st.line_chart(pd.DataFrame(latency.timeseries()).pivot(index="second", columns="endpoint", values="p99"))
     progress_text.text("Итерационные тесты завершены.")
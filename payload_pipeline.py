@@ -0,0 +1,148 @@
+# payload_pipeline.py
+"""
+Предварительная генерация payload'ов для нагрузочного теста.
+Producer-потоки заранее собирают пары (payload, commission_payload)
+в ограниченную очередь, а отправляющие потоки только забирают готовое —
+выбор KBK/KNP, период и transactionId больше не лежат между запросами.
+"""
+
+import json
+import queue
+import threading
+import uuid
+from itertools import cycle
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+PayloadPair = Tuple[Dict, List[Dict]]
+
+_DONE = object()
+
+
+class PayloadPipeline:
+    """
+    Ограниченная очередь готовых пар (payload, commission_payload).
+    source — функция без аргументов (например, обёртка над build_payload)
+    или итерируемый сценарий payload'ов (replay из JSONL).
+    Для воспроизводимости с фиксированным seed используйте один producer:
+    тогда порядок payload'ов совпадает с порядком генерации.
+    """
+
+    def __init__(
+        self,
+        source,
+        build_commission: Callable[[Dict], List[Dict]],
+        capacity: int = 256,
+        producers: int = 1
+    ):
+        self.build_commission = build_commission
+        self.produced = 0
+        self.starved = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=capacity)
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+
+        if callable(source):
+            self._next = source
+            self._source_lock = None
+        else:
+            iterator = iter(source)
+            self._next = lambda: next(iterator)
+            # Итератор не потокобезопасен — next() под блокировкой
+            self._source_lock = threading.Lock()
+
+        self._threads = [
+            threading.Thread(target=self._produce, name=f"payload-producer-{i}", daemon=True)
+            for i in range(max(1, producers))
+        ]
+        self._alive = len(self._threads)
+        for thread in self._threads:
+            thread.start()
+
+    def get(self, timeout: Optional[float] = None) -> PayloadPair:
+        """Следующая готовая пара; StopIteration, если сценарий закончился"""
+        if self._queue.empty():
+            # Очередь пуста — producer не успевает, это видно в starved
+            with self._lock:
+                self.starved += 1
+        item = self._queue.get(timeout=timeout)
+        if item is _DONE:
+            self._queue.put(_DONE)
+            if self._error is not None:
+                raise self._error
+            raise StopIteration
+        return item
+
+    def __call__(self) -> PayloadPair:
+        return self.get()
+
+    def close(self):
+        self._stop.set()
+        # Освобождаем producer'ов, застрявших на put в полную очередь
+        while any(thread.is_alive() for thread in self._threads):
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            for thread in self._threads:
+                thread.join(timeout=0.05)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _produce(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    if self._source_lock is None:
+                        payload = self._next()
+                    else:
+                        with self._source_lock:
+                            payload = self._next()
+                except StopIteration:
+                    break
+                pair = (payload, self.build_commission(payload))
+                while not self._stop.is_set():
+                    try:
+                        self._queue.put(pair, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                with self._lock:
+                    self.produced += 1
+        except BaseException as e:
+            self._error = e
+        finally:
+            with self._lock:
+                self._alive -= 1
+                last = self._alive == 0
+            if last:
+                self._queue.put(_DONE)
+
+
+def scenario_payloads(path: str, loop: bool = True) -> Iterator[Dict]:
+    """
+    Сценарий из JSONL: строки результатов load_test.py (поле "Payload")
+    или просто payload'ы по одному на строку. loop — повторять по кругу.
+    """
+    payloads = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                payloads.append(record.get("Payload", record))
+    if not payloads:
+        raise ValueError(f"В сценарии {path} нет payload'ов")
+
+    def replay(source: Iterable[Dict]) -> Iterator[Dict]:
+        for payload in source:
+            # Копия, чтобы повторы не делили один dict, и новый transactionId на каждый повтор
+            payload = json.loads(json.dumps(payload))
+            payload["transactionId"] = f"APP_INDNTRTAX_{uuid.uuid4()}"
+            yield payload
+
+    # Файл читается сразу, а не при первом next(): его можно перезаписать (--output) после вызова
+    return replay(cycle(payloads) if loop else payloads)
@@ -0,0 +1,320 @@
+# reconciliation.py
+"""
+Сверка отправленных платежей (журнал successful_payloads) с тем, что записал backend
+(история транзакций), одним проходом hash join по transactionId:
+
+    python reconciliation.py --base-url https://sme-bff.kz.infra --token $TOKEN \\
+        --journal successful_payloads.json --date-from 2025-04-03T00:00:00Z \\
+        --model models/payment_autoencoder_0.0801.pth --output reconciliation.jsonl
+
+Индекс строится по меньшей стороне (--build auto определяет её сам), большая
+читается потоком; совпавшие пары сразу уходят на батчевый скоринг моделью,
+несовпавшие transactionId пишутся в --output по мере обнаружения.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from feature_extractor import PaymentFeatureExtractor
+from services.async_api import AsyncPaymentSystemAPI
+from services.models import PaymentPayload, TransactionDetail
+from services.transaction_service import TransactionService
+
+
+def sent_key(record: Dict) -> Optional[str]:
+    """transactionId записи журнала ({"timestamp", "payload"}) или голого payload"""
+    return record.get("payload", record).get("transactionId")
+
+
+def recorded_key(record: Dict) -> Optional[str]:
+    return record.get("transactionId")
+
+
+@dataclass
+class ReconciliationReport:
+    matched: int = 0
+    missing: int = 0       # отправили, а на сервере нет
+    unexpected: int = 0    # на сервере есть, а мы не отправляли
+    duplicates: int = 0    # повторы transactionId на любой стороне
+
+    def summary(self) -> Dict:
+        return {
+            "matched": self.matched,
+            "missing": self.missing,
+            "unexpected": self.unexpected,
+            "duplicates": self.duplicates,
+        }
+
+
+_MATCHED = object()  # надгробие в индексе: ключ уже сопоставлен, запись отпущена
+_END = object()
+
+
+class TransactionJoin:
+    """
+    Hash join по transactionId за O(|sent| + |recorded|).
+    Индексируется build-сторона; совпавшая запись заменяется в индексе надгробием,
+    так что повтор ключа на probe-стороне распознаётся как дубликат без
+    отдельного множества. Сироты (missing / unexpected) не копятся, а отдаются
+    в on_orphan(kind, transactionId) по одному разу на ключ; чтобы не отдать
+    повтор probe-сироты дважды, помнится только множество их ключей.
+    build_side="auto" читает обе стороны попеременно, пока одна не кончится:
+    она и становится build-стороной, поэтому память ограничена меньшей стороной.
+    Результат (пары, сироты, счётчики) не зависит от выбора стороны.
+    Пары всегда отдаются как (sent, recorded).
+    """
+
+    def __init__(
+        self,
+        build_side: str = "auto",
+        sent_key: Callable[[Dict], Optional[str]] = sent_key,
+        recorded_key: Callable[[Dict], Optional[str]] = recorded_key,
+        on_orphan: Optional[Callable[[str, str], None]] = None
+    ):
+        if build_side not in ("auto", "sent", "recorded"):
+            raise ValueError("build_side должен быть 'auto', 'sent' или 'recorded'")
+        self.build_side = build_side
+        self.sent_key = sent_key
+        self.recorded_key = recorded_key
+        self.on_orphan = on_orphan
+        self.report = ReconciliationReport()
+
+    def run(self, sent: Iterable[Dict], recorded: Iterable[Dict]) -> Iterator[Tuple[Dict, Dict]]:
+        report = self.report = ReconciliationReport()
+        build_side = self.build_side
+        if build_side == "auto":
+            build_side, sent, recorded = _smaller_side(sent, recorded)
+        if build_side == "sent":
+            build, build_key, probe, probe_key = sent, self.sent_key, recorded, self.recorded_key
+            build_kind, probe_kind = "missing", "unexpected"
+        else:
+            build, build_key, probe, probe_key = recorded, self.recorded_key, sent, self.sent_key
+            build_kind, probe_kind = "unexpected", "missing"
+
+        index: Dict[str, object] = {}
+        for record in build:
+            key = build_key(record)
+            if key in index:
+                report.duplicates += 1
+                continue
+            index[key] = record
+
+        probe_orphans = set()
+        for record in probe:
+            key = probe_key(record)
+            hit = index.get(key)
+            if hit is _MATCHED or (hit is None and key in probe_orphans):
+                report.duplicates += 1
+                continue
+            if hit is None:
+                probe_orphans.add(key)
+                self._orphan(probe_kind, key)
+                continue
+            index[key] = _MATCHED
+            report.matched += 1
+            yield (hit, record) if build_side == "sent" else (record, hit)
+
+        # Всё, что в индексе осталось без надгробия, не нашло пары
+        for key, value in index.items():
+            if value is not _MATCHED:
+                self._orphan(build_kind, key)
+
+    def _orphan(self, kind: str, key: str):
+        setattr(self.report, kind, getattr(self.report, kind) + 1)
+        if self.on_orphan is not None:
+            self.on_orphan(kind, key)
+
+
+def _smaller_side(sent: Iterable[Dict], recorded: Iterable[Dict]) -> Tuple[str, Iterable[Dict], Iterable[Dict]]:
+    """
+    Читает стороны по очереди, пока одна не закончится. Буферы не больше
+    меньшей стороны; прочитанное возвращается перед остатком итератора.
+    """
+    sent_it, recorded_it = iter(sent), iter(recorded)
+    sent_buf, recorded_buf = [], []
+    while True:
+        record = next(sent_it, _END)
+        if record is _END:
+            return "sent", sent_buf, itertools.chain(recorded_buf, recorded_it)
+        sent_buf.append(record)
+        record = next(recorded_it, _END)
+        if record is _END:
+            return "recorded", itertools.chain(sent_buf, sent_it), recorded_buf
+        recorded_buf.append(record)
+
+
+def iter_journal(path: str, chunk_size: int = 1 << 20) -> Iterator[Dict]:
+    """
+    Журнал отправленных: JSON-список (successful_payloads.json) или JSONL.
+    Список разбирается потоково по элементам, без json.load всего файла.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(1)
+        while head.isspace():
+            head = f.read(1)
+        if head == "[":
+            yield from _iter_json_array(f, chunk_size)
+            return
+        f.seek(0)
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _iter_json_array(f, chunk_size: int) -> Iterator[Dict]:
+    """Элементы JSON-списка из файла, позиционированного сразу после '['"""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    while True:
+        while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == ","):
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+            # Элемент у самого конца буфера может быть обрезан (число) — дочитываем
+            if end < len(buffer) or eof:
+                yield item
+                pos = end
+                continue
+        except json.JSONDecodeError:
+            if eof:
+                raise
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        if eof and pos >= len(buffer):
+            raise ValueError("Незавершённый JSON-список журнала")
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+def details_fetcher(
+    base_url: str,
+    token: str,
+    max_per_host: int = 20,
+    token_manager=None
+) -> Callable[[List[Tuple[str, str]]], List[Optional[Dict]]]:
+    """
+    fetch(ids) -> детали для пар (id, type) одним асинхронным батчем.
+    С token_manager токен берётся из него на каждый батч; запросы, получившие
+    401, повторяются один раз после refresh.
+    """
+    async def fetch_many(ids, token):
+        async with AsyncPaymentSystemAPI(base_url, token, max_per_host=max_per_host) as api:
+            return await api.get_transaction_details_many(ids, return_exceptions=True)
+
+    def fetch(ids: List[Tuple[str, str]]) -> List[Optional[Dict]]:
+        current = token_manager.get_token() if token_manager is not None else token
+        results = asyncio.run(fetch_many(ids, current))
+        unauthorized = [i for i, result in enumerate(results) if isinstance(result, BaseException) and " 401 " in str(result)]
+        if unauthorized and token_manager is not None and token_manager.refresh(stale_token=current):
+            retried = asyncio.run(fetch_many([ids[i] for i in unauthorized], token_manager.get_token()))
+            for i, result in zip(unauthorized, retried):
+                results[i] = result
+        return [None if isinstance(result, BaseException) else result for result in results]
+    return fetch
+
+
+def score_pairs(
+    pairs: Iterable[Tuple[Dict, Dict]],
+    model,
+    fetch_details: Optional[Callable[[List[Tuple[str, str]]], List[Optional[Dict]]]] = None,
+    batch_size: int = 512
+) -> Iterator[Dict]:
+    """
+    Батчевый скоринг совпавших пар: payload -> модель, реальная транзакция ->
+    transaction_to_vector, ошибка реконструкции MSE между ними + anomaly_score.
+    recorded из списка истории — это не детали; тогда fetch_details добирает
+    их пачкой по (id, transactionType).
+    """
+    from model_testing import predict_vectors
+
+    def flush(batch):
+        sent_records = [s for s, _ in batch]
+        recorded_records = [r for _, r in batch]
+        if fetch_details is not None:
+            recorded_records = fetch_details([(r["id"], r["transactionType"]) for r in recorded_records])
+
+        rows, payload_vectors, actual_vectors = [], [], []
+        for sent, recorded in zip(sent_records, recorded_records):
+            transaction_id = sent_key(sent)
+            if not recorded:
+                rows.append({"transactionId": transaction_id, "error": "Не удалось получить детали транзакции"})
+                continue
+            record = sent if "payload" in sent else {"timestamp": recorded.get("createdDate"), "payload": sent}
+            payload_vectors.append(PaymentFeatureExtractor.payload_to_vector(PaymentPayload.from_dict(record))['vector'])
+            actual_vectors.append(PaymentFeatureExtractor.transaction_to_vector(TransactionDetail.from_dict(recorded))['vector'])
+            rows.append({"transactionId": transaction_id, "status": recorded.get("status")})
+
+        if payload_vectors:
+            decoded, scores = predict_vectors(np.stack(payload_vectors), model, batch_size)
+            mse = np.mean((decoded - np.stack(actual_vectors)) ** 2, axis=1)
+            scored = (row for row in rows if "error" not in row)
+            for row, score, error in zip(scored, scores, mse):
+                row["anomaly_score"] = float(score)
+                row["reconstruction_mse"] = float(error)
+        return rows
+
+    batch = []
+    for pair in pairs:
+        batch.append(pair)
+        if len(batch) >= batch_size:
+            yield from flush(batch)
+            batch = []
+    if batch:
+        yield from flush(batch)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Сверка журнала отправленных платежей с историей транзакций")
+    parser.add_argument("--base-url", required=True)
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--journal", default="successful_payloads.json")
+    parser.add_argument("--date-from", help="Фильтр истории dateFrom (ISO, Z)")
+    parser.add_argument("--date-to", help="Фильтр истории dateTo (ISO, Z)")
+    parser.add_argument("--build", choices=["auto", "sent", "recorded"], default="auto",
+                        help="Сторона для hash-индекса (auto — меньшая)")
+    parser.add_argument("--model", help="Веса PaymentAutoencoder; без них только сверка")
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--max-per-host", type=int, default=20)
+    parser.add_argument("--output", default="reconciliation.jsonl")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    base_url = args.base_url.rstrip('/')
+    filters = {k: v for k, v in {"dateFrom": args.date_from, "dateTo": args.date_to}.items() if v}
+    recorded = TransactionService(base_url, args.token).iter_transactions(filters, prefetch=True)
+
+    with open(args.output, "w", encoding="utf-8") as out:
+        def on_orphan(kind, transaction_id):
+            out.write(json.dumps({"transactionId": transaction_id, "reconciliation": kind}) + "\n")
+
+        join = TransactionJoin(build_side=args.build, on_orphan=on_orphan)
+        pairs = join.run(iter_journal(args.journal), recorded)
+        if args.model:
+            from model_testing import load_trained_model
+            rows = score_pairs(
+                pairs,
+                load_trained_model(args.model),
+                details_fetcher(base_url, args.token, args.max_per_host),
+                args.batch_size
+            )
+        else:
+            rows = ({"transactionId": sent_key(s), "status": r.get("status")} for s, r in pairs)
+        for row in rows:
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    print(json.dumps(join.report.summary(), ensure_ascii=False, indent=2))
+    return join.report
+
+
+if __name__ == "__main__":
+    main()
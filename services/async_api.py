@@ -0,0 +1,191 @@
+import asyncio
+import aiohttp
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .models import Transaction
+from .transaction_service import TransactionService
+
+
+class AsyncHTTPPool:
+    """Общий пул соединений и ограничение параллельности по хостам"""
+
+    def __init__(self, max_per_host: int = 20, limit: int = 100, timeout: float = 60.0):
+        self.max_per_host = max_per_host
+        self.limit = limit
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def session(self) -> aiohttp.ClientSession:
+        # Сессия создаётся лениво, уже внутри работающего event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.max_per_host,
+                ssl=False
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    def semaphore(self, host: str) -> asyncio.Semaphore:
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        return self._semaphores[host]
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class AsyncBaseAPIClient:
+    def __init__(self, base_url: str, token: str, pool: Optional[AsyncHTTPPool] = None):
+        self.base_url = base_url.rstrip('/')
+        self.host = urlsplit(self.base_url).netloc
+        self.headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+        self.pool = pool or AsyncHTTPPool()
+
+    async def _request(self, method: str, endpoint: str, **kwargs) -> Dict:
+        url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        async with self.pool.semaphore(self.host):
+            try:
+                async with self.pool.session().request(
+                    method,
+                    url,
+                    headers=self.headers,
+                    **kwargs
+                ) as response:
+                    text = await response.text()
+                    if response.status >= 400:
+                        raise Exception(
+                            f"Request to {url} failed: {response.status} {response.reason}"
+                            f"\nResponse: {text}"
+                        )
+                    return await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise Exception(f"Request to {url} failed: {str(e)}")
+
+
+class AsyncTransactionService(AsyncBaseAPIClient):
+    async def get_transactions(self, **kwargs) -> Dict:
+        """Получение транзакций с фильтрами"""
+        return await self._request(
+            "POST",
+            "/api/payment-history/api/v1/history/transactions",
+            json=TransactionService._search_payload(**kwargs)
+        )
+
+    async def get_transaction_details(self, id: str, type: str) -> Optional[Dict]:
+        """Получение деталей транзакции по ID"""
+        response = await self._request(
+            "POST",
+            "/api/payment-history/api/v1/history/transaction",
+            json={"id": id, "type": type}
+        )
+        return response.get('transaction')
+
+    async def get_by_id_in_transactions(self, transaction_id: str) -> Optional[Transaction]:
+        """Получение транзакции по ID"""
+        result = await self.get_transactions()
+        for tx in result.get('transactions', []):
+            if tx.get('transactionId') == transaction_id:
+                return TransactionService._parse_transaction(tx)
+        return None
+
+    async def get_transaction_details_by_transaction_id(self, tr_id: str) -> Optional[Dict]:
+        tx = await self.get_by_id_in_transactions(tr_id)
+        if not tx:
+            raise Exception("Транзакция не найдена!!")
+        return await self.get_transaction_details(tx.id, tx.transaction_type)
+
+    async def get_transaction_details_many(
+        self,
+        ids: Iterable[Tuple[str, str]],
+        return_exceptions: bool = False
+    ) -> List[Optional[Dict]]:
+        """Детали для списка пар (id, type); порядок результатов совпадает со входом"""
+        return await asyncio.gather(
+            *(self.get_transaction_details(id, type) for id, type in ids),
+            return_exceptions=return_exceptions
+        )
+
+
+class AsyncAccountService(AsyncBaseAPIClient):
+    async def get_accounts(self) -> List[Dict]:
+        return (await self._request("GET", "/api/account/accounts")).get('accounts', [])
+
+    async def get_open_accounts(self) -> List[Dict]:
+        return [
+            acc for acc in await self.get_accounts()
+            if acc.get('accountStatus') == 'OPEN'
+            and not acc.get('fullyBlocked')
+        ]
+
+
+class AsyncDictionaryService(AsyncBaseAPIClient):
+    async def get_kbk_list(self, operation_type: str) -> List[Dict]:
+        return await self._request(
+            "GET",
+            f"/api/dictionary/dictionary/kbk/kbk-to-knp-list?taxesPaymentOperationType={operation_type}"
+        )
+
+    async def get_ugd_list(self) -> List[Dict]:
+        return await self._request("GET", "/api/dictionary/dictionary/ugd/all")
+
+
+class AsyncPaymentService(AsyncBaseAPIClient):
+    async def calculate_commission(self, payload: Dict) -> Dict:
+        return await self._request(
+            "PUT",
+            "/api/charge-calculator/api/v1/charges/trn/multi-calculate",
+            json=[payload]
+        )
+
+    async def make_payment(self, payload: Dict) -> Dict:
+        return await self._request(
+            "POST",
+            "/api/payment/api/v5/budget/init/entrepreneur",
+            json=payload
+        )
+
+    async def make_payment_many(self, payloads: Iterable[Dict], return_exceptions: bool = True) -> List:
+        return await asyncio.gather(
+            *(self.make_payment(p) for p in payloads),
+            return_exceptions=return_exceptions
+        )
+
+
+class AsyncPaymentSystemAPI:
+    """
+    Асинхронный аналог PaymentSystemAPI. Все сервисы делят один пул соединений
+    и один семафор на хост:
+
+        async with AsyncPaymentSystemAPI(base_url, token) as api:
+            details = await api.transactions.get_transaction_details_many(ids)
+    """
+
+    def __init__(self, base_url: str, token: str, max_per_host: int = 20):
+        self.pool = AsyncHTTPPool(max_per_host=max_per_host)
+        self.transactions = AsyncTransactionService(base_url, token, self.pool)
+        self.accounts = AsyncAccountService(base_url, token, self.pool)
+        self.dictionary = AsyncDictionaryService(base_url, token, self.pool)
+        self.payments = AsyncPaymentService(base_url, token, self.pool)
+
+    async def get_transaction_details_many(self, ids: Iterable[Tuple[str, str]], **kwargs) -> List[Optional[Dict]]:
+        return await self.transactions.get_transaction_details_many(ids, **kwargs)
+
+    async def close(self):
+        await self.pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
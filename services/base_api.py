@@ -1,32 +1,51 @@
 import requests
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 class BaseAPIClient:
-    def __init__(self, base_url: str, token: str):
+    def __init__(self, base_url: str, token: str, token_manager=None):
+        """
+        token_manager (TokenManager) — для долгих процессов: токен берётся из него
+        перед каждым запросом, на 401 делается refresh и один повтор.
+        """
         self.base_url = base_url.rstrip('/')
+        self.token_manager = token_manager
         self.headers = {
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/json"
         }
     
     def _request(self, method: str, endpoint: str, **kwargs) -> Dict:
+        return self._send(method, endpoint, **kwargs).json()
+
+    def _send(self, method: str, endpoint: str, headers: Optional[Dict] = None, **kwargs) -> requests.Response:
+        """Запрос без разбора тела; коды 304 и 2xx считаются успешными"""
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
         try:
-            response = requests.request(
-                method,
-                url,
-                headers=self.headers,
-                verify=False,
-                **kwargs
-            )
-            response.raise_for_status()
-            return response.json()
+            token = self.token_manager.get_token() if self.token_manager is not None else None
+            response = self._send_once(method, url, token, headers, **kwargs)
+            if response.status_code == 401 and token is not None and self.token_manager.refresh(stale_token=token):
+                response = self._send_once(method, url, self.token_manager.get_token(), headers, **kwargs)
+            if response.status_code != 304:
+                response.raise_for_status()
+            return response
         except requests.exceptions.RequestException as e:
             error_msg = f"Request to {url} failed: {str(e)}"
             if e.response:
                 error_msg += f"\nResponse: {e.response.text}"
             raise Exception(error_msg)
 
+    def _send_once(
+        self, method: str, url: str, token: Optional[str], headers: Optional[Dict] = None, **kwargs
+    ) -> requests.Response:
+        auth = {"Authorization": f"Bearer {token}"} if token is not None else {}
+        return requests.request(
+            method,
+            url,
+            headers={**self.headers, **auth, **(headers or {})},
+            verify=False,
+            **kwargs
+        )
+
 class APIError(Exception):
     """Базовое исключение для ошибок API"""
     pass
\ No newline at end of file
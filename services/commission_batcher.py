@@ -0,0 +1,119 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+_STOP = object()
+
+
+class CommissionBatcher:
+    """
+    Склейка расчётов комиссии в один вызов multi-calculate (он принимает список).
+    - submit(item) сразу возвращает Future с ответом для этого item;
+    - батч уходит, когда набралось max_batch элементов или прошло max_delay_ms
+      с момента первого элемента в батче;
+    - ответ раскладывается по transactionId, а если сервер его не вернул —
+      по позиции (когда длины запроса и ответа совпадают);
+    - до max_in_flight батчей могут быть в полёте одновременно.
+    send(items) -> list — любая функция PUT multi-calculate (PaymentService.calculate_commission_batch и т.п.).
+    """
+
+    def __init__(
+        self,
+        send: Callable[[List[Dict]], List[Dict]],
+        max_batch: int = 50,
+        max_delay_ms: float = 20.0,
+        max_in_flight: int = 4
+    ):
+        self.send = send
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.batches = 0
+        self.items = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._thread = threading.Thread(target=self._run, name="commission-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Dict) -> Future:
+        future = Future()
+        # Под замком: иначе item может лечь в очередь после _STOP и его Future не завершится никогда
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("CommissionBatcher закрыт")
+            self._queue.put((item, future))
+        return future
+
+    def calculate(self, item: Dict, timeout: Optional[float] = None) -> Dict:
+        """Блокирующий вариант submit: ответ multi-calculate для одного item"""
+        return self.submit(item).result(timeout)
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
+
+    def close(self):
+        """Отправляет остаток очереди и дожидается всех батчей; дальше submit бросает RuntimeError"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self.batches += 1
+            self.items += len(batch)
+            self._executor.submit(self._flush, batch)
+
+    def _flush(self, batch: List[Tuple[Dict, Future]]):
+        try:
+            results = self.send([item for item, _ in batch])
+        except BaseException as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        results = results if isinstance(results, list) else []
+        by_id = {
+            result.get("transactionId"): result
+            for result in results if isinstance(result, dict) and result.get("transactionId")
+        }
+        positional = len(results) == len(batch)
+        for position, (item, future) in enumerate(batch):
+            result = by_id.get(item.get("transactionId"))
+            if result is None and positional:
+                result = results[position]
+            if result is None:
+                future.set_exception(KeyError(f"Нет комиссии для transactionId {item.get('transactionId')}"))
+            else:
+                future.set_result(result)
@@ -0,0 +1,143 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .dictionary_service import DictionaryService
+
+# Память процесса: path снапшота -> {endpoint: запись}. Общая для всех экземпляров,
+# поэтому повторное создание сервиса (rerun страницы, новый генератор) не читает диск.
+_MEMO: Dict[str, Dict[str, Dict]] = {}
+_MEMO_LOCK = threading.Lock()
+
+
+class CachedDictionaryService(DictionaryService):
+    """
+    DictionaryService с кэшем справочников: память процесса + снапшот на диске.
+    Запись старше ttl перепроверяется условным GET (If-None-Match / If-Modified-Since);
+    на 304 просто продлевается срок жизни. Каждая запись помнит base_url, с которого
+    получена: записи другого сервера (или старого снапшота без base_url) не
+    используются и перезаписываются при первом запросе.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        token: str,
+        cache_path: str = "dictionary_cache.json",
+        ttl: float = 24 * 3600,
+        token_manager=None
+    ):
+        super().__init__(base_url, token, token_manager)
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self._indexes: Dict[Tuple[str, str], Tuple[Any, Dict]] = {}
+
+    # --- справочники ---
+
+    def get_kbk_list(self, operation_type: str) -> List[Dict]:
+        return self.get_cached(self.kbk_endpoint(operation_type))
+
+    def get_ugd_list(self) -> List[Dict]:
+        return self.get_cached(self.UGD_ENDPOINT)
+
+    # --- индексы ---
+
+    def kbk_by_code(self, operation_type: str) -> Dict[Any, Dict]:
+        return self._index(self.kbk_endpoint(operation_type), "kbk_by_code",
+                           lambda data: {k["code"]: k for k in data})
+
+    def knp_by_kbk(self, operation_type: str) -> Dict[Tuple[Any, Any], Dict]:
+        """(kbk code, knpCode) -> элемент knpList"""
+        return self._index(self.kbk_endpoint(operation_type), "knp_by_kbk",
+                           lambda data: {(k["code"], n["knpCode"]): n for k in data for n in k.get("knpList", [])})
+
+    def ugd_by_code(self) -> Dict[Any, Dict]:
+        return self._index(self.UGD_ENDPOINT, "ugd_by_code", lambda data: {u["code"]: u for u in data})
+
+    def ugd_by_bin(self) -> Dict[Any, Dict]:
+        return self._index(self.UGD_ENDPOINT, "ugd_by_bin", lambda data: {u["bin"]: u for u in data})
+
+    # --- снапшот ---
+
+    def store(self, endpoint: str, data: Any, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Кладёт ответ в кэш (например, полученный в обход сервиса)"""
+        entries = self._entries()
+        with _MEMO_LOCK:
+            entries[endpoint] = {
+                "base_url": self.base_url,
+                "data": data,
+                "etag": etag,
+                "last_modified": last_modified,
+                "fetched_at": time.time()
+            }
+            self._save(entries)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Закэшированные справочники этого base_url: endpoint -> данные"""
+        return {
+            endpoint: entry["data"]
+            for endpoint, entry in self._entries().items()
+            if entry.get("base_url") == self.base_url
+        }
+
+    def get_cached(self, endpoint: str) -> Any:
+        """GET справочника через кэш"""
+        entries = self._entries()
+        entry = entries.get(endpoint)
+        if entry and entry.get("base_url") != self.base_url:
+            entry = None  # справочник другого сервера: ни данные, ни ETag не годятся
+        if entry and time.time() - entry["fetched_at"] < self.ttl:
+            return entry["data"]
+
+        conditional = {}
+        if entry and entry.get("etag"):
+            conditional["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            conditional["If-Modified-Since"] = entry["last_modified"]
+
+        response = self._send("GET", endpoint, headers=conditional)
+        if response.status_code == 304 and entry:
+            with _MEMO_LOCK:
+                entry["fetched_at"] = time.time()
+                self._save(entries)
+            return entry["data"]
+
+        data = response.json()
+        self.store(
+            endpoint,
+            data,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified")
+        )
+        return data
+
+    def _index(self, endpoint: str, name: str, build) -> Dict:
+        data = self.get_cached(endpoint)
+        cached = self._indexes.get((endpoint, name))
+        # Индекс перестраиваем только если сами данные обновились (не на 304)
+        if cached is None or cached[0] is not data:
+            cached = (data, build(data))
+            self._indexes[(endpoint, name)] = cached
+        return cached[1]
+
+    def _entries(self) -> Dict[str, Dict]:
+        with _MEMO_LOCK:
+            if self.cache_path not in _MEMO:
+                _MEMO[self.cache_path] = self._load()
+            return _MEMO[self.cache_path]
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("entries", {})
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries: Dict[str, Dict]):
+        # Пишем во временный файл и переименовываем, чтобы не оставить битый снапшот
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"entries": entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
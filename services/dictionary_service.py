@@ -2,11 +2,14 @@ from .base_api import BaseAPIClient
 from typing import List, Dict
 
 class DictionaryService(BaseAPIClient):
+    UGD_ENDPOINT = "/api/dictionary/dictionary/ugd/all"
+
+    @staticmethod
+    def kbk_endpoint(operation_type: str) -> str:
+        return f"/api/dictionary/dictionary/kbk/kbk-to-knp-list?taxesPaymentOperationType={operation_type}"
+
     def get_kbk_list(self, operation_type: str) -> List[Dict]:
-        return self._request(
-            "GET",
-            f"/api/dictionary/dictionary/kbk/kbk-to-knp-list?taxesPaymentOperationType={operation_type}"
-        )
+        return self._request("GET", self.kbk_endpoint(operation_type))
     
     def get_ugd_list(self) -> List[Dict]:
-        return self._request("GET", "/api/dictionary/dictionary/ugd/all")
\ No newline at end of file
+        return self._request("GET", self.UGD_ENDPOINT)
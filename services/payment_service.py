@@ -1,18 +1,29 @@
 from .base_api import BaseAPIClient
 from .models import PaymentPayload
-from typing import Dict
+from typing import Dict, List
 
 class PaymentService(BaseAPIClient):
+    COMMISSION_ENDPOINT = "/api/charge-calculator/api/v1/charges/trn/multi-calculate"
+    PAYMENT_ENDPOINT = "/api/payment/api/v5/budget/init/entrepreneur"
+
     def calculate_commission(self, payload: Dict) -> Dict:
         return self._request(
             "PUT",
-            "/api/charge-calculator/api/v1/charges/trn/multi-calculate",
+            self.COMMISSION_ENDPOINT,
             json=[payload]
         )
+
+    def calculate_commission_batch(self, payloads: List[Dict]) -> List[Dict]:
+        """Комиссия сразу для нескольких транзакций одним вызовом (см. CommissionBatcher)"""
+        return self._request(
+            "PUT",
+            self.COMMISSION_ENDPOINT,
+            json=payloads
+        )
     
     def make_payment(self, payload: PaymentPayload) -> Dict:
         return self._request(
             "POST",
-            "/api/payment/api/v5/budget/init/entrepreneur",
+            self.PAYMENT_ENDPOINT,
             json=payload
         )
\ No newline at end of file
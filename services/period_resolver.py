@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+PeriodKey = Tuple[str, str, str]
+
+
+class PaymentPeriodResolver:
+    """
+    Мемоизация /api/dictionary/dictionary/payment-period.
+    - LRU на maxsize ключей (operationType, kbk, knp);
+    - single-flight: одновременные одинаковые запросы ждут один общий;
+    - prefetch: прогрев всех пар KBK/KNP из справочника.
+    fetch(endpoint) -> dict | None — любая функция GET (requests, fetch_api_data и т.п.).
+    """
+
+    def __init__(self, fetch: Callable[[str], Optional[Dict]], maxsize: int = 1024):
+        self.fetch = fetch
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[PeriodKey, Dict]" = OrderedDict()
+        self._inflight: Dict[PeriodKey, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoint(operation_type: str, kbk, knp) -> str:
+        return (
+            f"/api/dictionary/dictionary/payment-period?"
+            f"operationType={operation_type}"
+            f"&kbk={kbk}"
+            f"&knp={knp}"
+            f"&id=0"
+        )
+
+    def get(self, operation_type: str, kbk, knp) -> Optional[Dict]:
+        """Сырой ответ payment-period (как вернул бы fetch)"""
+        key = (operation_type, str(kbk), str(knp))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+                self.misses += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            data = self.fetch(self.endpoint(operation_type, kbk, knp))
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._inflight[key]
+            # Ошибки (None, не-dict) не кэшируем, чтобы следующий вызов повторил запрос
+            if isinstance(data, dict):
+                self._cache[key] = data
+                if len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+        future.set_result(data)
+        return data
+
+    def prefetch(self, operation_type: str, kbk_list: Iterable[Dict], max_workers: int = 8) -> int:
+        """Прогревает кэш для всех пар KBK/KNP, у которых KBK начинается с '1'"""
+        pairs = {
+            (kbk["code"], knp["knpCode"])
+            for kbk in kbk_list if str(kbk["code"]).startswith('1')
+            for knp in kbk.get("knpList", [])
+        }
+
+        def warm(pair):
+            try:
+                return self.get(operation_type, *pair)
+            except Exception:
+                # Прогрев best-effort: упавшая пара просто запросится позже
+                return None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(warm, pairs))
+        return len(pairs)
+
+    def __len__(self) -> int:
+        return len(self._cache)
@@ -0,0 +1,223 @@
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from services.models import PaymentPayload
+
+HLL_PRECISION = 7  # 128 регистров по байту: ~9% погрешности, для малых множеств почти точно
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+
+def _hll_add(registers: bytearray, value: str):
+    # Стабильный между процессами хеш (hash() солится)
+    h = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+    index = h >> (64 - HLL_PRECISION)
+    rest = h & ((1 << (64 - HLL_PRECISION)) - 1)
+    rank = (64 - HLL_PRECISION) - rest.bit_length() + 1
+    if rank > registers[index]:
+        registers[index] = rank
+
+
+def _hll_count(registers: bytearray) -> float:
+    m = HLL_REGISTERS
+    estimate = (0.7213 / (1 + 1.079 / m)) * m * m / sum(2.0 ** -r for r in registers)
+    zeros = registers.count(0)
+    if estimate <= 2.5 * m and zeros:
+        return m * math.log(m / zeros)  # linear counting для малых кардинальностей
+    return estimate
+
+
+@dataclass
+class IbanProfile:
+    """Агрегаты по ключу (ibanDebit или ibanDebit|KBK), обновляются за O(1) на событие"""
+    key: str
+    count: int = 0
+    ewma_amount: float = 0.0
+    mean_amount: float = 0.0
+    m2_amount: float = 0.0  # сумма квадратов отклонений (Welford)
+    first_seen: Optional[float] = None
+    last_seen: Optional[float] = None
+    kbk_hll: bytearray = field(default_factory=lambda: bytearray(HLL_REGISTERS))
+    ugd_hll: bytearray = field(default_factory=lambda: bytearray(HLL_REGISTERS))
+
+    @property
+    def std_amount(self) -> float:
+        return math.sqrt(self.m2_amount / (self.count - 1)) if self.count > 1 else 0.0
+
+    @property
+    def distinct_kbk(self) -> float:
+        return _hll_count(self.kbk_hll)
+
+    @property
+    def distinct_ugd(self) -> float:
+        return _hll_count(self.ugd_hll)
+
+    def apply(self, amount: float, at: float, kbk: str, ugd: Optional[str], alpha: float):
+        self.count += 1
+        self.ewma_amount = amount if self.count == 1 else self.ewma_amount + alpha * (amount - self.ewma_amount)
+        delta = amount - self.mean_amount
+        self.mean_amount += delta / self.count
+        self.m2_amount += delta * (amount - self.mean_amount)
+        self.first_seen = at if self.first_seen is None else min(self.first_seen, at)
+        self.last_seen = at if self.last_seen is None else max(self.last_seen, at)
+        _hll_add(self.kbk_hll, kbk)
+        if ugd:
+            _hll_add(self.ugd_hll, ugd)
+
+
+class ProfileStore:
+    """
+    Поведенческие профили плательщиков в SQLite (как TransactionIndex).
+    Горячие профили держатся в LRU-кеше на max_cached записей и пишутся
+    обратно при вытеснении и flush(), поэтому память ограничена при любом
+    числе IBAN'ов; на диске профиль занимает ~300 байт.
+    per_kbk=True дополнительно ведёт профили по ключу "IBAN|KBK".
+    """
+
+    def __init__(
+        self,
+        path: str = "profile_store.sqlite",
+        alpha: float = 0.1,
+        per_kbk: bool = False,
+        max_cached: int = 100_000
+    ):
+        self.path = path
+        self.alpha = alpha
+        self.per_kbk = per_kbk
+        self.max_cached = max_cached
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, IbanProfile]" = OrderedDict()
+        self._dirty = set()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL: запись батча профилей не блокирует читателей и не требует fsync на каждый commit
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            " key TEXT PRIMARY KEY,"
+            " count INTEGER NOT NULL,"
+            " ewma_amount REAL, mean_amount REAL, m2_amount REAL,"
+            " first_seen REAL, last_seen REAL,"
+            " kbk_hll BLOB, ugd_hll BLOB)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[IbanProfile]:
+        with self._lock:
+            return self._get(key)
+
+    def update(self, payload: PaymentPayload) -> Optional[IbanProfile]:
+        """
+        Учитывает платёж в профиле и возвращает профиль ДО него —
+        именно с ним сравнивается текущий платёж (profile_to_vector).
+        """
+        return self.update_many([payload])[0]
+
+    def update_many(self, payloads: Iterable[PaymentPayload]) -> List[Optional[IbanProfile]]:
+        events = []
+        for payload in payloads:
+            amount, at, kbk, ugd = _event(payload)
+            keys = [payload.iban_debit]
+            if self.per_kbk:
+                keys.append(f"{payload.iban_debit}|{kbk}")
+            events.append((keys, amount, at, kbk, ugd))
+
+        before = []
+        with self._lock:
+            self._load([key for keys, *_ in events for key in keys if key not in self._cache])
+            for keys, amount, at, kbk, ugd in events:
+                for i, key in enumerate(keys):
+                    # После _load всё, что есть на диске, уже в кеше: промах — новый ключ
+                    profile = self._cache.get(key)
+                    if i == 0:
+                        before.append(_copy(profile) if profile is not None else None)
+                    if profile is None:
+                        profile = IbanProfile(key)
+                    self._put(key, profile)
+                    profile.apply(amount, at, kbk, ugd, self.alpha)
+                    self._dirty.add(key)
+            self._evict()
+        return before
+
+    def flush(self):
+        with self._lock:
+            self._write([self._cache[key] for key in self._dirty if key in self._cache])
+
+    def __len__(self) -> int:
+        self.flush()
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    def _get(self, key: str) -> Optional[IbanProfile]:
+        if key not in self._cache:
+            self._load([key])
+        profile = self._cache.get(key)
+        if profile is not None:
+            self._cache.move_to_end(key)
+            # Чтение тоже поднимает профили в кеш: без вытеснения он рос бы с числом IBAN'ов
+            self._evict()
+        return profile
+
+    def _load(self, keys: List[str], chunk: int = 500):
+        """Поднимает в кеш профили батча: один SELECT ... IN на chunk ключей"""
+        keys = list(dict.fromkeys(keys))
+        for start in range(0, len(keys), chunk):
+            part = keys[start:start + chunk]
+            rows = self._conn.execute(
+                "SELECT key, count, ewma_amount, mean_amount, m2_amount, first_seen, last_seen, kbk_hll, ugd_hll"
+                f" FROM profiles WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            for row in rows:
+                self._put(row[0], IbanProfile(*row[:7], bytearray(row[7]), bytearray(row[8])))
+
+    def _put(self, key: str, profile: IbanProfile):
+        self._cache[key] = profile
+        self._cache.move_to_end(key)
+
+    def _evict(self):
+        evicted = []
+        while len(self._cache) > self.max_cached:
+            _, profile = self._cache.popitem(last=False)
+            if profile.key in self._dirty:
+                evicted.append(profile)
+        self._write(evicted)
+
+    def _write(self, profiles: List[IbanProfile]):
+        if not profiles:
+            return
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (p.key, p.count, p.ewma_amount, p.mean_amount, p.m2_amount, p.first_seen, p.last_seen,
+                 bytes(p.kbk_hll), bytes(p.ugd_hll))
+                for p in profiles
+            ]
+        )
+        self._conn.commit()
+        self._dirty.difference_update(p.key for p in profiles)
+
+
+def _copy(profile: IbanProfile) -> IbanProfile:
+    return IbanProfile(
+        profile.key, profile.count, profile.ewma_amount, profile.mean_amount, profile.m2_amount,
+        profile.first_seen, profile.last_seen, bytearray(profile.kbk_hll), bytearray(profile.ugd_hll)
+    )
+
+
+def _event(payload: PaymentPayload) -> Tuple[float, float, str, Optional[str]]:
+    try:
+        at = datetime.fromisoformat(payload.timestamp).timestamp()
+    except (TypeError, ValueError):
+        at = time.time()
+    ugd = payload.ugd.code if payload.ugd else None
+    return float(payload.amount), at, str(payload.kbk.code), str(ugd) if ugd else None
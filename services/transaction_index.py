@@ -0,0 +1,132 @@
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class TransactionIndex:
+    """
+    Локальный индекс transactionId -> (id, type) в SQLite.
+    Синхронизируется инкрементально: запоминаем максимальный createdDate
+    (watermark) и при следующем sync забираем только более новые записи.
+    """
+
+    def __init__(self, path: str = "transaction_index.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tx_index ("
+            " transaction_id TEXT PRIMARY KEY,"
+            " id TEXT NOT NULL,"
+            " type TEXT NOT NULL,"
+            " created_date TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.commit()
+
+    def get(self, transaction_id: str) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, type FROM tx_index WHERE transaction_id = ?",
+                (transaction_id,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def add_many(self, transactions: Iterable[Dict]) -> int:
+        """Добавляет сырые записи списка транзакций, двигает watermark"""
+        added, newest = self._insert(transactions)
+        self._advance_watermark(newest)
+        return added
+
+    @property
+    def watermark(self) -> Optional[str]:
+        with self._lock:
+            return self._get_meta("watermark")
+
+    def sync(self, service, page_size: int = 100, **filters) -> int:
+        """
+        Догружает в индекс транзакции новее watermark.
+        Список отсортирован по createdDate DESC, поэтому останавливаемся
+        на первой записи не новее watermark. Watermark сдвигается только
+        после полного обхода: если обход прервётся, следующий sync пройдёт
+        тот же диапазон заново, а не остановится на новой границе, потеряв
+        более старые записи. С фильтрами (выборка может быть неполной)
+        watermark не трогаем.
+        """
+        advance = not filters
+        watermark = self.watermark
+        if watermark and 'dateFrom' not in filters:
+            filters['dateFrom'] = watermark if watermark.endswith('Z') else watermark + "Z"
+        border = _parse_date(watermark) if watermark else None
+
+        added = 0
+        newest = None
+        batch = []
+        for tx in service.iter_transactions(filters, page_size=page_size):
+            if border is not None and tx.get('createdDate') and _parse_date(tx['createdDate']) < border:
+                break
+            batch.append(tx)
+            if len(batch) >= page_size:
+                count, batch_newest = self._insert(batch)
+                added += count
+                newest = _later(newest, batch_newest)
+                batch = []
+        count, batch_newest = self._insert(batch)
+        added += count
+        newest = _later(newest, batch_newest)
+        if advance:
+            self._advance_watermark(newest)
+        return added
+
+    def _insert(self, transactions: Iterable[Dict]) -> Tuple[int, Optional[str]]:
+        """Пишет записи без watermark; возвращает (число, максимальный createdDate)"""
+        rows = [
+            (tx['transactionId'], tx['id'], tx['transactionType'], tx.get('createdDate'))
+            for tx in transactions
+            if tx.get('transactionId') and tx.get('id')
+        ]
+        if not rows:
+            return 0, None
+        newest = max((r[3] for r in rows if r[3]), key=_parse_date, default=None)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tx_index VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+        return len(rows), newest
+
+    def _advance_watermark(self, newest: Optional[str]):
+        if not newest:
+            return
+        with self._lock:
+            watermark = self._get_meta("watermark")
+            if watermark is None or _parse_date(newest) > _parse_date(watermark):
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('watermark', ?)", (newest,)
+                )
+                self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tx_index").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+
+def _parse_date(value: str) -> datetime:
+    # fromisoformat в 3.10 не понимает суффикс Z; сравниваем без таймзоны
+    return datetime.fromisoformat(value.replace('Z', '')).replace(tzinfo=None)
+
+
+def _later(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    if a is None or b is None:
+        return a or b
+    return a if _parse_date(a) >= _parse_date(b) else b
@@ -1,31 +1,36 @@
 from .base_api import BaseAPIClient
 from .models import Transaction, TransactionDetail
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterator, Optional
 import json
 
 class TransactionService(BaseAPIClient):
     def get_transactions(self, **kwargs) -> Dict:
         """Получение транзакций с фильтрами"""
-        payload = {
+        return self._request(
+            "POST",
+            "/api/payment-history/api/v1/history/transactions",
+            json=self._search_payload(**kwargs)
+        )
+
+    @staticmethod
+    def _search_payload(page: int = 0, size: int = 20, **kwargs) -> Dict:
+        """Тело запроса поиска транзакций (фильтры + пагинация)"""
+        return {
             "search": {
                 "iban": None,
                 **kwargs
             },
             "pageable": {
-                "page": 0,
-                "size": 20,
+                "page": page,
+                "size": size,
                 "sort": {
                     "property": "createdDate",
                     "direction": "DESC"
                 }
             }
         }
-        return self._request(
-            "POST",
-            "/api/payment-history/api/v1/history/transactions",
-            json=payload
-        )
     
     def get_transaction_details(self, id: str, type: str) -> Optional[Dict]:
         """Получение деталей транзакции по ID"""
@@ -40,33 +45,75 @@ class TransactionService(BaseAPIClient):
         )
         return response.get('transaction')
 
-    def get_by_id_in_transactions(self, transaction_id: str) -> Optional[Transaction]:
-        """Получение транзакции по ID"""
-        result = self.get_transactions()
-        for tx in result.get('transactions', []):
+    def iter_transactions(
+        self,
+        filters: Optional[Dict] = None,
+        page_size: int = 100,
+        prefetch: bool = False
+    ) -> Iterator[Dict]:
+        """
+        Обходит все страницы списка транзакций (новые первыми).
+        prefetch=True запрашивает следующую страницу параллельно с обработкой текущей.
+        """
+        filters = filters or {}
+
+        def fetch(page: int) -> List[Dict]:
+            return self.get_transactions(page=page, size=page_size, **filters).get('transactions', [])
+
+        if not prefetch:
+            page = 0
+            while True:
+                items = fetch(page)
+                yield from items
+                if len(items) < page_size:
+                    return
+                page += 1
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            page = 0
+            future = executor.submit(fetch, page)
+            while True:
+                items = future.result()
+                if len(items) < page_size:
+                    yield from items
+                    return
+                page += 1
+                future = executor.submit(fetch, page)
+                yield from items
+
+    def get_by_id_in_transactions(self, transaction_id: str, **filters) -> Optional[Transaction]:
+        """Получение транзакции по ID (поиск по всем страницам)"""
+        for tx in self.iter_transactions(filters):
             if tx.get('transactionId') == transaction_id:
                 return self._parse_transaction(tx)
         return None
     
-    def get_transaction_details_by_transaction_id(self, tr_id: str):
-        # Тест 1: Получение списка транзакций
-        transactions = self.get_transactions(
-            dateFrom=(datetime.now() - timedelta(days=7)).isoformat() + "Z",
-            status=["COMPLETED"]
-        )
-        
-        if transactions.get('transactions'):
-            
-            # Получаем id нужной транзакции. Для теста берем самый первый. id и transactionId не одно и тоже
-            tx_details = self.get_by_id_in_transactions(tr_id)
-
-            if tx_details:
-                # Получаем объект Transaction
-                return self.get_transaction_details(tx_details.id, tx_details.transaction_type)
-            else:
+    def get_transaction_details_by_transaction_id(self, tr_id: str, index=None):
+        """
+        Детали по transactionId. Если передан TransactionIndex, то при попадании
+        в индекс это один запрос; при промахе индекс сначала досинхронизируется,
+        и если транзакции нет и после этого, повторно историю не обходим.
+        Без индекса — поиск по всей истории, без фильтров по статусу и дате.
+        """
+        if index is not None:
+            found = index.get(tr_id)
+            if found is None:
+                index.sync(self)
+                found = index.get(tr_id)
+            if found is None:
                 raise Exception("Транзакция не найдена!!")
+            return self.get_transaction_details(*found)
+
+        # id и transactionId не одно и тоже
+        tx_details = self.get_by_id_in_transactions(tr_id)
+
+        if tx_details:
+            return self.get_transaction_details(tx_details.id, tx_details.transaction_type)
+        else:
+            raise Exception("Транзакция не найдена!!")
     
-    def _parse_transaction(self, data: Dict) -> Transaction:
+    @staticmethod
+    def _parse_transaction(data: Dict) -> Transaction:
         """Парсинг сырых данных в объект Transaction"""
         return Transaction(
             id=data['id'],
@@ -0,0 +1,328 @@
+# streaming_detector.py
+"""
+Онлайн-детектор аномалий для потока значений (скаляров или векторов признаков):
+
+    detector = StreamingDetector(dim=1, window=2000, retrain_every=5000)
+    flags = detector.update(chunk)  # [len(chunk)] bool, по мере поступления
+
+На точку — O(1): EWMA среднего/дисперсии и сравнение с медианой/MAD окна.
+Медиана/MAD пересчитываются по кольцевому буферу последних window нормальных
+точек раз в mad_every точек; тот же буфер служит обучающей выборкой для
+автоэнкодера, который переобучается раз в retrain_every нормальных точек
+в фоне и подменяется целиком (старая модель скорит, пока новая учится).
+Память постоянна: буфер фиксированного размера и одна-две модели.
+
+Для векторов признаков (dim > 1) z/MAD проверяются только по непрерывным
+колонкам (больше max_levels различных значений в окне); дискретные (one-hot,
+коды справочников) остаются автоэнкодеру. Нулевой MAD заменяется std окна
+или единицей, а не делится на ноль.
+
+Аномальные точки статистики не обновляют, поэтому после устойчивого сдвига
+уровня (среднее 50 -> 150) детектор флагал бы всё навсегда. Если подряд
+помечено rebaseline_after точек, это считается новой нормой: EWMA, окно
+MAD и автоэнкодер перестраиваются по этим точкам (они сами остаются
+помеченными — сдвиг должен быть виден в отчёте).
+
+Демо на потоке demo_testing/server.py:
+
+    python streaming_detector.py --server-url http://127.0.0.1:5000 --points 200000
+"""
+
+import argparse
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+MAD_SCALE = 1.4826  # MAD -> sigma для нормального распределения
+
+
+def _default_model(dim: int) -> nn.Module:
+    from nn_training import Autoencoder
+    return Autoencoder(input_dim=dim)
+
+
+class StreamingDetector:
+    """
+    Точка аномальна, если после warmup точек выполнено хотя бы одно:
+      - |x - ewma_mean| / ewma_std > z_threshold (по любой непрерывной координате);
+      - |x - median| / (1.4826 * MAD) > mad_threshold (по любой непрерывной координате);
+      - ошибка восстановления автоэнкодера выше его порога (если он обучен).
+    Аномальные точки не обновляют статистики и не попадают в обучающее окно,
+    чтобы выброс не сдвигал норму.
+    """
+
+    def __init__(
+        self,
+        dim: int = 1,
+        window: int = 1000,
+        alpha: Optional[float] = None,
+        z_threshold: float = 4.0,
+        mad_threshold: float = 6.0,
+        warmup: int = 100,
+        mad_every: int = 256,
+        retrain_every: int = 0,
+        ae_epochs: int = 30,
+        ae_quantile: float = 0.99,
+        build_model: Callable[[int], nn.Module] = _default_model,
+        background: bool = True,
+        rebaseline_after: int = 200,
+        max_levels: int = 10
+    ):
+        self.dim = dim
+        self.window = window
+        self.alpha = alpha if alpha is not None else 2.0 / (window + 1)
+        self.z_threshold = z_threshold
+        self.mad_threshold = mad_threshold
+        self.warmup = warmup
+        self.mad_every = mad_every
+        self.retrain_every = retrain_every
+        self.ae_epochs = ae_epochs
+        self.ae_quantile = ae_quantile
+        self.build_model = build_model
+        self.background = background
+        self.rebaseline_after = rebaseline_after
+        self.max_levels = max_levels
+
+        self.mean = np.zeros(dim)
+        self.var = np.zeros(dim)
+        self.median = np.zeros(dim)
+        self.mad = np.ones(dim)
+        self._robust_scale = np.full(dim, MAD_SCALE)
+        self._continuous = np.ones(dim, dtype=bool)  # колонки, к которым применимы z/MAD
+        self.seen = 0
+        self.normal = 0
+        self.flagged = 0
+        self.retrains = 0
+        self.rebaselines = 0
+
+        self._buffer = np.zeros((window, dim), dtype=np.float32)
+        self._buffer_pos = 0
+        self._buffer_len = 0
+        self._since_mad = 0
+        self._since_train = 0
+        # Последние подряд помеченные точки: из них строится новая норма
+        self._run = np.zeros((max(rebaseline_after, 1), dim), dtype=np.float32)
+        self._run_len = 0
+        self._lock = threading.Lock()
+        self._ae = None  # (model, center, scale, threshold) — подменяется целиком
+        self._generation = 0  # номер нормы; _rebaseline увеличивает, устаревшее обучение отбрасывается
+        self._training: Optional[threading.Thread] = None
+        self._training_generation = 0
+        self._stale_trainings: List[threading.Thread] = []  # обучения старой нормы, ещё не завершённые
+
+    def update(self, values) -> np.ndarray:
+        X = np.asarray(values, dtype=np.float64).reshape(-1, self.dim)
+        flags = np.zeros(len(X), dtype=bool)
+        ae_flags = self._ae_flags(X)
+
+        alpha = self.alpha
+        for i, x in enumerate(X):
+            self.seen += 1
+            if self.seen > self.warmup:
+                std = np.sqrt(self.var)
+                z = np.abs(x - self.mean) / np.where(std > 0, std, 1.0)
+                robust = np.abs(x - self.median) / self._robust_scale
+                continuous = self._continuous
+                if (z[continuous] > self.z_threshold).any() or (robust[continuous] > self.mad_threshold).any() or ae_flags[i]:
+                    flags[i] = True
+                    self.flagged += 1
+                    if self.rebaseline_after:
+                        self._run[self._run_len] = x
+                        self._run_len += 1
+                        if self._run_len == self.rebaseline_after:
+                            self._rebaseline()
+                            ae_flags[i + 1:] = False  # флаги старой модели для остатка чанка
+                    continue
+            self._run_len = 0
+
+            # EWMA среднего и дисперсии (инкрементальная форма Уэста)
+            if self.normal == 0:
+                self.mean = x.copy()
+            else:
+                diff = x - self.mean
+                increment = alpha * diff
+                self.mean = self.mean + increment
+                self.var = (1 - alpha) * (self.var + diff * increment)
+            self.normal += 1
+
+            self._buffer[self._buffer_pos] = x
+            self._buffer_pos = (self._buffer_pos + 1) % self.window
+            self._buffer_len = min(self._buffer_len + 1, self.window)
+            self._since_mad += 1
+            self._since_train += 1
+            if self._since_mad >= self.mad_every or self.normal == self.warmup:
+                self._refresh_mad()
+            if self.retrain_every and self._since_train >= self.retrain_every:
+                self.retrain()
+        return flags
+
+    def _rebaseline(self):
+        """Новая норма по последним rebaseline_after подряд помеченным точкам"""
+        recent = self._run[:self._run_len].astype(np.float64)
+        self.mean = recent.mean(axis=0)
+        self.var = recent.var(axis=0)
+        kept = recent[-self.window:]
+        self._buffer[:len(kept)] = kept
+        self._buffer_len = len(kept)
+        self._buffer_pos = len(kept) % self.window
+        self._refresh_mad()
+        self._run_len = 0
+        self.rebaselines += 1
+        with self._lock:
+            self._generation += 1
+            self._ae = None  # модель учила старую норму
+        if self.retrain_every:
+            self.retrain()
+
+    def _refresh_mad(self):
+        recent = self._buffer[:self._buffer_len]
+        self.median = np.median(recent, axis=0)
+        self.mad = np.median(np.abs(recent - self.median), axis=0)
+        if self.dim > 1:
+            # Дискретные колонки (one-hot, коды справочников) z/MAD не оценить: редкое значение
+            # флагается, в статистику не попадает, и разброс схлопывается. Их проверяет только AE
+            recent_sorted = np.sort(recent, axis=0)
+            levels = 1 + (np.diff(recent_sorted, axis=0) != 0).sum(axis=0)
+            self._continuous = levels > self.max_levels
+        # MAD = 0 у почти константных колонок: тогда берём std окна, а если
+        # и он 0 — единицу (как scale в _train), иначе любое отклонение бесконечно
+        scale = MAD_SCALE * self.mad
+        degenerate = scale == 0
+        if degenerate.any():
+            scale[degenerate] = recent[:, degenerate].std(axis=0)
+            scale[scale == 0] = 1.0
+        self._robust_scale = scale
+        self._since_mad = 0
+
+    def _ae_flags(self, X: np.ndarray) -> np.ndarray:
+        """Весь чанк одной прогонкой через текущую модель"""
+        ae = self._ae
+        if ae is None:
+            return np.zeros(len(X), dtype=bool)
+        model, center, scale, threshold = ae
+        with torch.no_grad():
+            errors = self._errors(model, torch.from_numpy(((X - center) / scale).astype(np.float32)))
+        return errors > threshold
+
+    @staticmethod
+    def _errors(model: nn.Module, X: torch.Tensor) -> np.ndarray:
+        return (model(X) - X).pow(2).mean(dim=1).numpy()
+
+    def retrain(self):
+        """Переобучение AE на окне нормальных точек; в фоне, если предыдущее уже закончилось"""
+        self._since_train = 0
+        if self._training is not None and self._training.is_alive() and self._training_generation == self._generation:
+            return  # обучение на старой норме не ждём: его результат всё равно отбросится
+        window = self._buffer[:self._buffer_len].copy()
+        if len(window) < self.warmup:
+            return
+        if self._training is not None and self._training.is_alive():
+            self._stale_trainings.append(self._training)
+        self._stale_trainings = [t for t in self._stale_trainings if t.is_alive()]
+        self._training_generation = self._generation
+        if self.background:
+            self._training = threading.Thread(
+                target=self._train, args=(window, self._generation), name="ae-retrain", daemon=True
+            )
+            self._training.start()
+        else:
+            self._train(window, self._generation)
+
+    def _train(self, window: np.ndarray, generation: int):
+        center = np.median(window, axis=0)
+        scale = MAD_SCALE * np.median(np.abs(window - center), axis=0)
+        scale[scale == 0] = 1.0
+        X = torch.from_numpy(((window - center) / scale).astype(np.float32))
+
+        # Модель учится с нуля на копии окна, текущая продолжает скорить
+        model = self.build_model(self.dim)
+        optimizer = optim.Adam(model.parameters(), lr=1e-3)
+        criterion = nn.MSELoss()
+        model.train()
+        for _ in range(self.ae_epochs):
+            for start in range(0, len(X), 256):
+                batch = X[start:start + 256]
+                optimizer.zero_grad()
+                loss = criterion(model(batch), batch)
+                loss.backward()
+                optimizer.step()
+        model.eval()
+        with torch.no_grad():
+            threshold = float(np.quantile(self._errors(model, X), self.ae_quantile))
+
+        with self._lock:
+            if generation != self._generation:
+                return  # пока учились, норма сменилась (_rebaseline) — модель устарела
+            self._ae = (model, center, scale, threshold)
+            self.retrains += 1
+
+    def wait(self, timeout: Optional[float] = None):
+        """Дождаться фонового переобучения (для тестов и скриптов)"""
+        for thread in self._stale_trainings + [self._training]:
+            if thread is not None:
+                thread.join(timeout)
+
+    def state(self) -> Dict:
+        return {
+            "seen": self.seen,
+            "normal": self.normal,
+            "flagged": self.flagged,
+            "retrains": self.retrains,
+            "rebaselines": self.rebaselines,
+            "mean": self.mean.tolist(),
+            "std": np.sqrt(self.var).tolist(),
+            "median": self.median.tolist(),
+            "mad": self.mad.tolist(),
+            "ae_threshold": self._ae[3] if self._ae is not None else None,
+        }
+
+
+def stream_points(server_url: str, total: int, rate: float, chunk: int):
+    """Чанки (data, labels) из /data/stream demo-сервера"""
+    import requests
+    with requests.get(f"{server_url}/data/stream", params={"n": total, "rate": rate, "chunk": chunk}, stream=True) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            if line:
+                out = json.loads(line)
+                yield np.asarray(out["data"], dtype=np.float64), np.asarray(out["labels"], dtype=np.int8)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Онлайн-детекция на потоке demo-сервера")
+    parser.add_argument("--server-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--points", type=int, default=100_000)
+    parser.add_argument("--chunk", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=0.07)
+    parser.add_argument("--window", type=int, default=2000)
+    parser.add_argument("--retrain-every", type=int, default=10_000, help="0 — без автоэнкодера")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from sklearn.metrics import f1_score, precision_score, recall_score
+
+    args = parse_args(argv)
+    detector = StreamingDetector(dim=1, window=args.window, retrain_every=args.retrain_every)
+    flags, labels = [], []
+    started_at = time.perf_counter()
+    for data, chunk_labels in stream_points(args.server_url, args.points, args.rate, args.chunk):
+        flags.append(detector.update(data))
+        labels.append(chunk_labels)
+    elapsed = time.perf_counter() - started_at
+    detector.wait()
+
+    flags, labels = np.concatenate(flags), np.concatenate(labels)
+    print(f"{len(labels)} точек за {elapsed:.2f} с ({len(labels) / elapsed:.0f} точек/с), переобучений AE: {detector.retrains}")
+    print(f"Stream => Precision={precision_score(labels, flags):.3f}, Recall={recall_score(labels, flags):.3f}, F1={f1_score(labels, flags):.3f}")
+    return detector
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# token_manager.py
+
+import base64
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import requests
+
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессной блокировки нет, остаётся только потоковая
+    fcntl = None
+
+
+class TokenManager:
+    """
+    Хранит access/refresh токены и обновляет их через /api/v3/token/refresh/parent_child.
+    - single-flight: одновременно идёт только один refresh, остальные ждут его результат;
+    - проактивный refresh за skew секунд до exp из JWT;
+    - store_path: общий JSON-файл под файловой блокировкой, чтобы несколько
+      процессов генератора нагрузки делили одни токены, а не рефрешили их наперегонки.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        access_token: str,
+        refresh_token: Optional[str] = None,
+        child_refresh: Optional[str] = None,
+        store_path: Optional[str] = None,
+        skew: float = 60.0
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.tokens: Dict[str, Optional[str]] = {
+            "token": access_token,
+            "refresh_token": refresh_token,
+            "child_token": None,
+            "child_refresh": child_refresh,
+        }
+        self.store_path = store_path
+        self.skew = skew
+        self.refresh_count = 0
+        self._retry_after = 0.0
+        self._lock = threading.Lock()
+        self._load_store()
+
+    @property
+    def token(self) -> str:
+        return self.tokens["token"]
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.get_token()}",
+            "Content-Type": "application/json"
+        }
+
+    def get_token(self) -> str:
+        """Текущий access-токен; если он вот-вот истечёт — сначала refresh"""
+        token = self.token
+        if self._expiring(token) and time.time() >= self._retry_after:
+            if not self.refresh(stale_token=token):
+                # Не долбим refresh на каждом запросе, если он падает
+                self._retry_after = time.time() + 5.0
+        return self.token
+
+    def refresh(self, stale_token: Optional[str] = None) -> bool:
+        """
+        Обновляет токены. stale_token — токен, с которым получили 401:
+        если к моменту захвата блокировки его уже заменили (другой поток или процесс),
+        повторный refresh не делаем.
+        """
+        with self._lock:
+            if self._already_refreshed(stale_token):
+                return True
+            with self._file_lock():
+                self._load_store()
+                if self._already_refreshed(stale_token):
+                    return True
+                if not self._do_refresh():
+                    return False
+                self._save_store()
+                return True
+
+    @staticmethod
+    def jwt_exp(token: Optional[str]) -> Optional[float]:
+        """Claim exp из JWT без проверки подписи"""
+        try:
+            payload = token.split('.')[1]
+            payload += '=' * (-len(payload) % 4)
+            return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+        except Exception:
+            return None
+
+    def _expiring(self, token: Optional[str]) -> bool:
+        exp = self.jwt_exp(token)
+        return exp is not None and exp - time.time() < self.skew
+
+    def _already_refreshed(self, stale_token: Optional[str]) -> bool:
+        return stale_token is not None and self.token != stale_token and not self._expiring(self.token)
+
+    def _do_refresh(self) -> bool:
+        if not self.tokens["refresh_token"]:
+            return False
+        payload = {
+            "parentRefreshToken": self.tokens["refresh_token"],
+            "childRefreshToken": self.tokens["child_refresh"],
+        }
+        try:
+            resp = requests.post(
+                f"{self.base_url}/api/v3/token/refresh/parent_child",
+                data=payload,
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+                verify=False
+            )
+            resp.raise_for_status()
+            data = resp.json()
+        except (requests.exceptions.RequestException, ValueError):
+            return False
+
+        parent = data.get('parentAuthResponse') or {}
+        if 'accessToken' not in parent:
+            return False
+        self.tokens["token"] = parent['accessToken']
+        self.tokens["refresh_token"] = parent.get('refreshToken', self.tokens["refresh_token"])
+        child = data.get('childAuthResponse') or {}
+        if 'accessToken' in child:
+            self.tokens["child_token"] = child['accessToken']
+            self.tokens["child_refresh"] = child.get('refreshToken', self.tokens["child_refresh"])
+        self.refresh_count += 1
+        return True
+
+    @contextmanager
+    def _file_lock(self):
+        if not self.store_path or fcntl is None:
+            yield
+            return
+        with open(f"{self.store_path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_store(self):
+        if not self.store_path:
+            return
+        try:
+            with open(self.store_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        # Берём токены из файла, только если они свежее наших
+        if (self.jwt_exp(stored.get("token")) or 0) > (self.jwt_exp(self.token) or 0):
+            self.tokens.update({k: stored.get(k) for k in self.tokens if stored.get(k)})
+
+    def _save_store(self):
+        if not self.store_path:
+            return
+        tmp_path = f"{self.store_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.tokens, f)
+        os.replace(tmp_path, self.store_path)
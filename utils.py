@@ -5,6 +5,9 @@ import streamlit as st
 import uuid
 import urllib3
 
+from services.dictionary_cache import CachedDictionaryService
+from token_manager import TokenManager
+
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 def get_headers():
@@ -17,61 +20,56 @@ def get_headers():
         "Content-Type": "application/json"
     }
 
-def do_refresh(base_url):
+def get_token_manager(base_url):
+    """
+    TokenManager текущей сессии. Пересоздаётся, если сменился base_url
+    или токен в session_state ввели заново на главной странице.
+    """
+    manager = st.session_state.get('token_manager')
+    if (
+        manager is None
+        or manager.base_url != base_url.rstrip('/')
+        or manager.token != st.session_state.get('token')
+    ):
+        manager = TokenManager(
+            base_url,
+            st.session_state.get('token'),
+            refresh_token=st.session_state.get('refresh_token'),
+            child_refresh=st.session_state.get('child_refresh'),
+        )
+        st.session_state['token_manager'] = manager
+    return manager
+
+def sync_session_tokens(manager):
+    """Копирует токены из TokenManager обратно в session_state."""
+    for key, value in manager.tokens.items():
+        if value:
+            st.session_state[key] = value
+
+def do_refresh(base_url, stale_token=None):
     """
-    Отправляет запрос /api/v3/token/refresh/parent_child
-    в формате application/x-www-form-urlencoded (по скриншоту).
+    Рефреш через /api/v3/token/refresh/parent_child (см. TokenManager).
+    Одновременные вызовы не шлют несколько refresh: если stale_token
+    уже заменён, просто используем новый токен.
     Обновляет session_state['token'] при успехе.
     """
     if 'refresh_token' not in st.session_state:
         st.warning("Нет refresh-токена, не можем рефрешить!")
         return False
 
-    url = f"{base_url}/api/v3/token/refresh/parent_child"
-    
-    # Обычно refresh-эндпоинт требует form-data или x-www-form-urlencoded
-    payload = {
-        "parentRefreshToken": st.session_state['refresh_token'],
-        "childRefreshToken": st.session_state['child_refresh'],
-    }
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
-    try:
-        resp = requests.post(url, data=payload, headers=headers, verify=False)
-        resp.raise_for_status()
-        
-        data = resp.json()
-        # Внутри data обычно хранится accessToken, refreshToken и т.д.
-        # Исходя из примера, видим
-        # {
-        #   "parentAuthResponse": { ... "accessToken": "...", "refreshToken":"..." },
-        #   "childAuthResponse": { ... }
-        # }
-        
-        if 'parentAuthResponse' in data and 'accessToken' in data['parentAuthResponse']:
-            new_access = data['parentAuthResponse']['accessToken']
-            new_refresh = data['parentAuthResponse']['refreshToken']
-            st.session_state['token'] = new_access
-            st.session_state['refresh_token'] = new_refresh
-            st.info("✅ Токен успешно обновлён (родительский)!")
-            
-            # Аналогично, если нужен child:
-            if 'childAuthResponse' in data and 'accessToken' in data['childAuthResponse']:
-                new_child_access = data['childAuthResponse']['accessToken']
-                new_child_refresh = data['childAuthResponse']['refreshToken']
-                # Сохраняем при необходимости
-                st.session_state['child_token'] = new_child_access
-                st.session_state['child_refresh'] = new_child_refresh
-                st.info("✅ Токен успешно обновлён (дочерний)!")
-            return True
-        else:
-            st.error("Не нашли accessToken в ответе refresh!")
-            return False
-    except requests.exceptions.RequestException as e:
-        st.error(f"Ошибка при рефреше токена: {e}")
+    manager = get_token_manager(base_url)
+    refreshes_before = manager.refresh_count
+    if not manager.refresh(stale_token=stale_token):
+        st.error("Ошибка при рефреше токена!")
         return False
 
+    sync_session_tokens(manager)
+    if manager.refresh_count > refreshes_before:
+        st.info("✅ Токен успешно обновлён (родительский)!")
+        if manager.tokens.get('child_token'):
+            st.info("✅ Токен успешно обновлён (дочерний)!")
+    return True
+
 def fetch_api_data(base_url, endpoint, method="GET", payload=None):
     """
     Универсальная функция для запросов: GET, POST, PUT.
@@ -93,6 +91,13 @@ def fetch_api_data(base_url, endpoint, method="GET", payload=None):
         
         return resp
     
+    # Проактивный refresh, если access-токен скоро истечёт (exp из JWT)
+    if 'token' in st.session_state:
+        manager = get_token_manager(base_url)
+        manager.get_token()
+        sync_session_tokens(manager)
+
+    sent_token = st.session_state.get('token')
     resp = make_request()
     if resp is None:
         return None
@@ -100,7 +105,7 @@ def fetch_api_data(base_url, endpoint, method="GET", payload=None):
     # Проверяем статус
     if resp.status_code == 401:
         st.warning("Получили 401. Пробуем рефрешить токен...")
-        ok = do_refresh(base_url)
+        ok = do_refresh(base_url, stale_token=sent_token)
         if ok:
             st.info("Попытка повторить запрос с обновлённым токеном...")
             resp = make_request()  # повторяем запрос
@@ -115,6 +120,21 @@ def fetch_api_data(base_url, endpoint, method="GET", payload=None):
         st.text(resp.text)
         return resp.json
 
+def fetch_dictionary_data(base_url, endpoint):
+    """
+    Справочники (KBK, UGD) через локальный кэш CachedDictionaryService:
+    после первого запуска это чтение файла, а не тяжёлый GET.
+    При ошибке (например, протух токен) — обычный fetch_api_data с рефрешем.
+    """
+    dictionary = CachedDictionaryService(base_url, st.session_state.get('token', ''))
+    try:
+        return dictionary.get_cached(endpoint)
+    except Exception:
+        data = fetch_api_data(base_url, endpoint)
+        if data and not callable(data):
+            dictionary.store(endpoint, data)
+        return data
+
 def generate_transaction_id(prefix="APP_INDNTRTAX"):
     """Генерируем уникальный transactionId."""
     return f"{prefix}_{uuid.uuid4()}"